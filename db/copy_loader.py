@@ -0,0 +1,270 @@
+"""
+copy_loader.py
+--------------
+Shared bulk loader for every Postgres write in the pipeline.
+
+1. Rows are streamed to the server with COPY ... FROM STDIN, in text format
+   or (for typed values) binary format, instead of multi-row INSERTs.
+2. Rows come from any iterator (or a DataFrame, column by column) and are
+   encoded into ~1 MB buffers as COPY consumes them, so no tuple list or
+   SQL string for the whole load is ever built.
+3. replace_table() loads into a staging table and swaps it in with one
+   DROP + RENAME transaction, so readers see the old table or the new one,
+   never a half-loaded one.
+"""
+
+import json
+import struct
+from datetime import date, datetime
+
+import pandas as pd
+
+COPY_BUFFER_BYTES = 1 << 20
+
+PG_EPOCH_DATE = date(2000, 1, 1)
+PG_EPOCH = datetime(2000, 1, 1)
+
+_TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\x00": ""})
+
+
+# ------------------- Text Format ------------------- #
+def _is_missing(value) -> bool:
+    """None, NaN, NaT or pd.NA (from nullable dtypes); a list or dict value is never missing itself."""
+    if value is None or value is pd.NA:
+        return True
+    # common types first: pd.isna costs more than the rest of encoding a value
+    if isinstance(value, (str, int, list, tuple, dict)):
+        return False
+    if isinstance(value, float):
+        return value != value
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def _array_literal(values) -> str:
+    items = []
+    for item in values:
+        if _is_missing(item):
+            items.append("NULL")
+        else:
+            items.append('"' + str(item).replace("\\", "\\\\").replace('"', '\\"') + '"')
+    return "{" + ",".join(items) + "}"
+
+
+def text_value(value) -> str:
+    """One field in COPY text format (NULL is \\N)."""
+    if isinstance(value, (list, tuple)):
+        value = _array_literal(value)
+    elif isinstance(value, dict):
+        value = json.dumps(value)
+    elif _is_missing(value):
+        return "\\N"
+    elif isinstance(value, bool):
+        return "t" if value else "f"
+    elif isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    return str(value).translate(_TEXT_ESCAPES)
+
+
+def _text_chunks(rows, counter):
+    lines, size = [], 0
+    for row in rows:
+        line = "\t".join([text_value(value) for value in row]) + "\n"
+        lines.append(line)
+        size += len(line)
+        counter[0] += 1
+        if size >= COPY_BUFFER_BYTES:
+            yield "".join(lines).encode("utf-8")
+            lines, size = [], 0
+    if lines:
+        yield "".join(lines).encode("utf-8")
+
+
+# ------------------- Binary Format ------------------- #
+def _encode_text(value) -> bytes:
+    return str(value).replace("\x00", "").encode("utf-8")
+
+
+def _encode_date(value) -> bytes:
+    if isinstance(value, datetime):
+        value = value.date()
+    elif not isinstance(value, date):
+        value = date.fromisoformat(str(value))
+    return struct.pack("!i", (value - PG_EPOCH_DATE).days)
+
+
+def _encode_timestamp(value) -> bytes:
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    delta = value.replace(tzinfo=None) - PG_EPOCH
+    return struct.pack("!q", (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds)
+
+
+def _encode_json(value) -> bytes:
+    return (value if isinstance(value, str) else json.dumps(value)).encode("utf-8")
+
+
+def _encode_text_array(element_oid):
+    def encode(values) -> bytes:
+        items = [None if _is_missing(item) else _encode_text(item) for item in values]
+        if not items:
+            return struct.pack("!iiI", 0, 0, element_oid)
+        parts = [struct.pack("!iiIii", 1, None in items, element_oid, len(items), 1)]
+        for item in items:
+            parts.append(struct.pack("!i", -1) if item is None else struct.pack("!i", len(item)) + item)
+        return b"".join(parts)
+    return encode
+
+
+BINARY_ENCODERS = {
+    "text": _encode_text,
+    "character varying": _encode_text,
+    "character": _encode_text,
+    "smallint": lambda value: struct.pack("!h", int(value)),
+    "integer": lambda value: struct.pack("!i", int(value)),
+    "bigint": lambda value: struct.pack("!q", int(value)),
+    "real": lambda value: struct.pack("!f", float(value)),
+    "double precision": lambda value: struct.pack("!d", float(value)),
+    "boolean": lambda value: struct.pack("!?", bool(value)),
+    "date": _encode_date,
+    "timestamp without time zone": _encode_timestamp,
+    "json": _encode_json,
+    "jsonb": lambda value: b"\x01" + _encode_json(value),
+    "text[]": _encode_text_array(25),
+    "character varying[]": _encode_text_array(1043),
+}
+
+
+def column_types(conn, table_name, columns):
+    """Postgres type names (format_type without modifiers) of the given columns."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT attname, format_type(atttypid, NULL)
+            FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+        """, (table_name,))
+        types = dict(cursor.fetchall())
+    return [types[column] for column in columns]
+
+
+def binary_encoders(types):
+    encoders = []
+    for type_name in types:
+        if type_name not in BINARY_ENCODERS:
+            raise ValueError(f"Binary COPY does not support column type {type_name!r}; use text format")
+        encoders.append(BINARY_ENCODERS[type_name])
+    return encoders
+
+
+def _binary_chunks(rows, encoders, counter):
+    parts, size = [b"PGCOPY\n\xff\r\n\x00", struct.pack("!ii", 0, 0)], 19
+    field_count = struct.pack("!h", len(encoders))
+    null = struct.pack("!i", -1)
+    for row in rows:
+        parts.append(field_count)
+        size += 2
+        for encode, value in zip(encoders, row):
+            if _is_missing(value):
+                parts.append(null)
+                size += 4
+                continue
+            data = encode(value)
+            parts.append(struct.pack("!i", len(data)))
+            parts.append(data)
+            size += 4 + len(data)
+        counter[0] += 1
+        if size >= COPY_BUFFER_BYTES:
+            yield b"".join(parts)
+            parts, size = [], 0
+    parts.append(struct.pack("!h", -1))
+    yield b"".join(parts)
+
+
+# ------------------- COPY ------------------- #
+class _ChunkReader:
+    """File-like object for copy_expert that hands over pre-encoded chunks as COPY asks for data."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def read(self, size=-1):
+        return next(self._chunks, b"")
+
+
+def copy_rows(conn, table_name, columns, rows, binary=False) -> int:
+    """
+    Stream rows (an iterable of sequences, in `columns` order) into a table
+    with COPY FROM STDIN. Does not commit; returns the number of rows sent.
+    """
+    counter = [0]
+    if binary:
+        chunks = _binary_chunks(rows, binary_encoders(column_types(conn, table_name, columns)), counter)
+        options = "FORMAT binary"
+    else:
+        chunks = _text_chunks(rows, counter)
+        options = "FORMAT text"
+    with conn.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH ({options})",
+                           _ChunkReader(chunks), size=COPY_BUFFER_BYTES)
+    return counter[0]
+
+
+def dataframe_rows(df, columns=None):
+    """Iterate a DataFrame's rows as tuples of the given columns without copying the frame."""
+    columns = list(df.columns) if columns is None else list(columns)
+    return zip(*(df[column] for column in columns))
+
+
+def copy_dataframe(conn, table_name, df, columns=None, binary=False) -> int:
+    columns = list(df.columns) if columns is None else list(columns)
+    return copy_rows(conn, table_name, columns, dataframe_rows(df, columns), binary=binary)
+
+
+# ------------------- Staging + Swap ------------------- #
+def staging_name(table_name: str) -> str:
+    return f"{table_name}_staging"
+
+
+def create_staging_table(conn, table_name, create_sql, keep_definition=False) -> str:
+    """
+    (Re)create the staging table for `table_name` and commit, so other
+    connections can load into it too. create_sql is a CREATE TABLE statement
+    with a {table} placeholder. With keep_definition=True an existing target
+    is copied instead (LIKE ... INCLUDING ALL; not for tables with serial
+    columns, whose sequence would be dropped with the old table).
+    """
+    staging = staging_name(table_name)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {staging};")
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table_name,))
+        if keep_definition and cursor.fetchone()[0]:
+            cursor.execute(f"CREATE TABLE {staging} (LIKE {table_name} INCLUDING ALL);")
+        else:
+            cursor.execute(create_sql.format(table=staging))
+    conn.commit()
+    return staging
+
+
+def swap_table(conn, staging, table_name):
+    """Atomically replace table_name with the loaded staging table."""
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name};")
+        cursor.execute(f"ALTER TABLE {staging} RENAME TO {table_name.split('.')[-1]};")
+    conn.commit()
+
+
+def replace_table(conn, table_name, columns, rows, create_sql, keep_definition=False, binary=False) -> int:
+    """Load rows into a fresh staging table and swap it in place of table_name; returns rows loaded."""
+    staging = create_staging_table(conn, table_name, create_sql, keep_definition)
+    try:
+        count = copy_rows(conn, staging, columns, rows, binary=binary)
+    except Exception:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {staging};")
+        conn.commit()
+        raise
+    swap_table(conn, staging, table_name)
+    return count
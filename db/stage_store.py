@@ -0,0 +1,139 @@
+"""
+stage_store.py
+--------------
+Optional columnar store for the data handed between pipeline stages.
+
+When STAGE_STORE_DIR is set, the extractors, data_cleaning and
+entity_matching exchange intermediate data as Parquet datasets under that
+directory instead of writing it to Postgres and reading it back:
+1. each stage is a directory of Parquet files, optionally hive-partitioned
+   (e.g. cleaned ABR records by state) and sorted (e.g. by postcode) so
+   row-group statistics can skip data;
+2. readers ask for the columns they need and push filters down to the
+   files (pyarrow.dataset expressions), so unneeded data is never decoded;
+3. column types survive between stages (no TEXT round-trip).
+Postgres then only receives the final published table.
+"""
+
+import os
+import time
+import shutil
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+STAGE_STORE_DIR = os.getenv("STAGE_STORE_DIR")
+
+ABR_RAW = "abr_raw"
+COMMONCRAWL_RAW = "commoncrawl_raw"
+ABR_CLEANED = "abr_cleaned"
+COMMONCRAWL_CLEANED = "commoncrawl_cleaned"
+
+
+def default_store():
+    """The StageStore configured by STAGE_STORE_DIR, or None to use Postgres between stages."""
+    return StageStore(STAGE_STORE_DIR) if STAGE_STORE_DIR else None
+
+
+class StageStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, stage: str) -> str:
+        return os.path.join(self.root, stage)
+
+    def clear(self, stage: str):
+        shutil.rmtree(self.path(stage), ignore_errors=True)
+
+    # ------------------- Writing ------------------- #
+    def write(self, stage: str, data, partition_cols=None, sort_by=None, part_name: str = "part",
+              schema: pa.Schema = None):
+        """
+        Add a DataFrame or Arrow table to a stage as new Parquet file(s).
+        part_name must be unique among the writers of one stage.
+        """
+        if isinstance(data, pa.Table):
+            table = data
+        else:
+            table = pa.Table.from_pandas(data, schema=schema, preserve_index=False)
+        if sort_by:
+            table = table.sort_by([(column, "ascending") for column in sort_by])
+        ds.write_dataset(table, self.path(stage), format="parquet",
+                         partitioning=partition_cols, partitioning_flavor="hive" if partition_cols else None,
+                         basename_template=f"{part_name}-{{i}}.parquet",
+                         existing_data_behavior="overwrite_or_ignore")
+
+    def replace(self, stage: str, data, partition_cols=None, sort_by=None, schema: pa.Schema = None):
+        """Replace a whole stage with one DataFrame or Arrow table."""
+        self.clear(stage)
+        self.write(stage, data, partition_cols=partition_cols, sort_by=sort_by, schema=schema)
+
+    # ------------------- Reading ------------------- #
+    def dataset(self, stage: str) -> ds.Dataset:
+        return ds.dataset(self.path(stage), format="parquet", partitioning="hive")
+
+    def isin(self, stage: str, column: str, values) -> ds.Expression:
+        """Filter expression `column IN values`, with values typed like the stored column."""
+        value_type = self.dataset(stage).schema.field(column).type
+        return ds.field(column).isin(pa.array(list(values), type=value_type))
+
+    def read(self, stage: str, columns=None, filter=None):
+        """Read a stage into a DataFrame, decoding only `columns` and rows matching `filter`."""
+        return self.dataset(stage).to_table(columns=columns, filter=filter).to_pandas()
+
+    def iter_batches(self, stage: str, columns=None, filter=None, batch_size: int = 50_000):
+        """Yield a stage as DataFrames of at most batch_size rows."""
+        scanner = self.dataset(stage).scanner(columns=columns, filter=filter, batch_size=batch_size)
+        for batch in scanner.to_batches():
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+
+class StageWriter:
+    """
+    Drop-in replacement for StreamingPostgresWriter that appends records to a
+    stage: every flush_rows records are written as one Parquet file, after
+    which the after_flush() callbacks run.
+    """
+
+    def __init__(self, store: StageStore, stage: str, columns, schema: pa.Schema, to_row=tuple,
+                 flush_rows: int = 50_000):
+        self.store = store
+        self.stage = stage
+        self.columns = list(columns)
+        self.schema = schema
+        self.to_row = to_row
+        self.flush_rows = flush_rows
+        self.rows_written = 0
+        self._rows, self._callbacks = [], []
+        self._run_id = time.strftime("%Y%m%d%H%M%S")
+        self._parts = 0
+
+    def put(self, record):
+        self._rows.append(self.to_row(record))
+        if len(self._rows) >= self.flush_rows:
+            self.flush()
+
+    def after_flush(self, callback):
+        self._callbacks.append(callback)
+
+    def flush(self):
+        if self._rows:
+            table = pa.Table.from_pylist([dict(zip(self.columns, row)) for row in self._rows], schema=self.schema)
+            self.store.write(self.stage, table, part_name=f"{self._run_id}-{self._parts:05d}")
+            self._parts += 1
+            self.rows_written += len(self._rows)
+            print(f"  Flushed {len(self._rows):,} rows into stage {self.stage} (total {self.rows_written:,})")
+        for callback in self._callbacks:
+            callback()
+        self._rows, self._callbacks = [], []
+
+    def close(self):
+        self.flush()
+        print(f"Streamed {self.rows_written:,} records into stage {self.stage}.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,9 +1,17 @@
 import os
+import gzip
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from lxml import etree
 import psycopg2
-from psycopg2.extras import execute_values
+import pyarrow as pa
+import pyarrow.compute as pc
 from dotenv import load_dotenv
 
+from db.copy_loader import copy_rows, create_staging_table, swap_table
+from db.stage_store import ABR_RAW, StageStore, default_store
+
 # ------------------- Load DB Config ------------------- #
 load_dotenv(dotenv_path="C:/Users/Admin/Desktop/firmable-etl-pipeline/.venv/.env")
 
@@ -17,16 +25,14 @@ DB_CONFIG = {
 
 TABLE_NAME = "prd_firmable.stg.abr_raw_companies"
 FOLDER_PATH = "../data"
-BATCH_SIZE = 50000  
 
-# ------------------- PostgreSQL Connection ------------------- #
-conn = psycopg2.connect(**DB_CONFIG)
-cursor = conn.cursor()
+ABR_COLUMNS = ["abn", "entity_name", "entity_type", "entity_status", "address", "postcode", "state", "start_date"]
+ABR_SCHEMA = pa.schema([(column, pa.string()) for column in ABR_COLUMNS[:-1]] + [("start_date", pa.date32())])
+STAGE_CHUNK_ROWS = 100_000
 
-# Recreate table
-create_table_query = f"""
-DROP TABLE IF EXISTS {TABLE_NAME};
-CREATE TABLE {TABLE_NAME} (
+# ------------------- PostgreSQL Table ------------------- #
+ABR_TABLE_DDL = """
+CREATE TABLE {table} (
     id SERIAL PRIMARY KEY,
     abn VARCHAR(20),
     entity_name TEXT,
@@ -39,13 +45,6 @@ CREATE TABLE {TABLE_NAME} (
     created_at TIMESTAMP DEFAULT NOW()
 );
 """
-cursor.execute(create_table_query)
-conn.commit()
-
-insert_query = f"""
-INSERT INTO {TABLE_NAME} (abn, entity_name, entity_type, entity_status, address, postcode, state, start_date)
-VALUES %s
-"""
 
 # ------------------- Helper Function ------------------- #
 def extract_abr_data(abr):
@@ -67,33 +66,114 @@ def extract_abr_data(abr):
 
     return (abn, entity_name, entity_type, entity_status, address, postcode, state, start_date)
 
-# ------------------- Parse XML Files in Batches ------------------- #
-xml_files = [os.path.join(FOLDER_PATH, f) for f in os.listdir(FOLDER_PATH) if f.endswith('.xml')]
-batch = []
-total_inserted = 0
-
-for file in xml_files:
-    print(f"Processing file: {file}")
-    for _, abr in etree.iterparse(file, tag="ABR"):
-        row = extract_abr_data(abr)
-        batch.append(row)
-        abr.clear()  # free memory
-
-        if len(batch) >= BATCH_SIZE:
-            execute_values(cursor, insert_query, batch)
+# ------------------- Parse XML Files ------------------- #
+def abr_files(folder=FOLDER_PATH):
+    """ABR bulk-extract part files (.xml or .xml.gz) in a folder, in name order."""
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith((".xml", ".xml.gz")))
+
+
+def parse_abr_xml(path, limit=None):
+    """
+    Yield one row tuple (in ABR_COLUMNS order) per <ABR> element of a .xml or
+    .xml.gz file, stopping after `limit` rows if given.
+    Memory stays flat: each element is cleared once read and the already
+    processed siblings are detached from the root, which clear() alone
+    leaves behind as empty elements.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        for count, (_, abr) in enumerate(etree.iterparse(f, tag="ABR"), start=1):
+            yield extract_abr_data(abr)
+            abr.clear(keep_tail=True)
+            parent = abr.getparent()
+            while abr.getprevious() is not None:
+                del parent[0]
+            if limit is not None and count >= limit:
+                return
+
+# ------------------- Load ------------------- #
+def load_abr_file(path, table_name=TABLE_NAME):
+    """Stream one file into a table with COPY over its own connection; returns the rows inserted."""
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        inserted = copy_rows(conn, table_name, ABR_COLUMNS, parse_abr_xml(path))
+        conn.commit()
+    finally:
+        conn.close()
+    return inserted
+
+
+def abr_rows_to_table(rows) -> pa.Table:
+    """Arrow table (ABR_SCHEMA) from parsed rows; YYYYMMDD start dates become dates."""
+    columns = list(zip(*rows))
+    arrays = [pa.array(values, pa.string()) for values in columns[:-1]]
+    start_dates = pc.strptime(pa.array(columns[-1], pa.string()), format="%Y%m%d", unit="s", error_is_null=True)
+    return pa.Table.from_arrays(arrays + [start_dates.cast(pa.date32())], schema=ABR_SCHEMA)
+
+
+def stage_abr_file(path, store_root):
+    """Write one file to the raw ABR stage as Parquet, STAGE_CHUNK_ROWS rows per file; returns the rows written."""
+    store = StageStore(store_root)
+    name = os.path.basename(path).split(".")[0]
+    rows_iter = parse_abr_xml(path)
+    written = 0
+    for chunk_no in itertools.count():
+        rows = list(itertools.islice(rows_iter, STAGE_CHUNK_ROWS))
+        if not rows:
+            break
+        store.write(ABR_RAW, abr_rows_to_table(rows), part_name=f"{name}-{chunk_no:04d}")
+        written += len(rows)
+    return written
+
+
+def main(folder=FOLDER_PATH, workers=None, store: StageStore = None, append=False):
+    """
+    Load every part file, one worker process per file. Without a stage store
+    the files go into a staging table that is swapped in place of the raw
+    table once all of them have loaded; with one they become the raw ABR stage.
+    append=True COPYs the files straight into the existing raw table instead
+    (e.g. a weekly delta), for data_cleaning --incremental to pick up.
+    """
+    files = abr_files(folder)
+    if store is not None:
+        store.clear(ABR_RAW)
+        conn = target = None
+    else:
+        conn = psycopg2.connect(**DB_CONFIG)
+        if append:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT to_regclass(%s) IS NULL", (TABLE_NAME,))
+                if cursor.fetchone()[0]:
+                    cursor.execute(ABR_TABLE_DDL.format(table=TABLE_NAME))
             conn.commit()
-            total_inserted += len(batch)
-            print(f"Inserted batch of {len(batch)} rows. Total inserted: {total_inserted}")
-            batch = []
-
-# Insert remaining rows
-if batch:
-    execute_values(cursor, insert_query, batch)
-    conn.commit()
-    total_inserted += len(batch)
-    print(f"Inserted final batch of {len(batch)} rows. Total inserted: {total_inserted}")
-
-# ------------------- Close Connection ------------------- #
-cursor.close()
-conn.close()
-print("ETL completed successfully!")
+            target = TABLE_NAME
+        else:
+            target = create_staging_table(conn, TABLE_NAME, ABR_TABLE_DDL)
+
+    total_inserted = 0
+    with ProcessPoolExecutor(max_workers=workers or min(len(files), os.cpu_count()) or 1) as pool:
+        if store is not None:
+            futures = {pool.submit(stage_abr_file, path, store.root): path for path in files}
+        else:
+            futures = {pool.submit(load_abr_file, path, target): path for path in files}
+        for future in as_completed(futures):
+            inserted = future.result()
+            total_inserted += inserted
+            print(f"Processed file: {futures[future]} ({inserted} rows). Total inserted: {total_inserted}")
+
+    if conn is not None:
+        if not append:
+            swap_table(conn, target, TABLE_NAME)
+        conn.close()
+    print("ETL completed successfully!")
+    return total_inserted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load ABR bulk-extract XML files.")
+    parser.add_argument("folder", nargs="?", default=FOLDER_PATH)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--append", action="store_true",
+                        help="append to the raw table (delta files) instead of replacing it")
+    args = parser.parse_args()
+    main(args.folder, args.workers, store=default_store(), append=args.append)
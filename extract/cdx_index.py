@@ -0,0 +1,164 @@
+"""
+cdx_index.py
+------------
+Single-pass, resumable reader for Common Crawl CDX index queries.
+
+1. The index response is spooled page by page (one gzip shard per index page)
+   into a local cache while it is being consumed, so it is downloaded once.
+2. Completed shards are recorded in a manifest and never fetched again; a
+   shard interrupted mid-download is refetched on the next run.
+3. A checkpoint file stores how many index lines a run has fully processed,
+   so an interrupted crawl resumes where it stopped.
+"""
+
+import os
+import time
+import gzip
+import json
+import hashlib
+
+import requests
+
+CACHE_DIR = os.getenv("CC_CACHE_DIR", ".cache/commoncrawl")
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _load_json(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_json(path: str, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class CdxIndexCache:
+    def __init__(self, index_url: str, cache_dir: str = CACHE_DIR, session: requests.Session = None,
+                 progress_every: int = 100_000, max_retries: int = 4, backoff: float = 1.0):
+        self.index_url = index_url
+        self.session = session or requests.Session()
+        self.progress_every = progress_every
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.dir = os.path.join(cache_dir, "index", hashlib.sha1(index_url.encode()).hexdigest()[:16])
+
+        self.manifest_path = os.path.join(self.dir, "manifest.json")
+        self.checkpoint_path = os.path.join(self.dir, "checkpoint.json")
+        self.manifest = _load_json(self.manifest_path) or {"index_url": index_url, "pages": None, "shard_lines": {}}
+
+    # ------------------- Shards ------------------- #
+    def _fetch_num_pages(self) -> int:
+        """
+        Ask the CDX server for its page count, retrying transient failures
+        (connection errors, 429/5xx) and raising once retries run out. A
+        successful answer without a page count means it does not paginate: 0.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                r = self.session.get(f"{self.index_url}&showNumPages=true", timeout=30)
+                if r.status_code not in RETRY_STATUSES:
+                    r.raise_for_status()
+                    try:
+                        return int(r.json()["pages"])
+                    except (ValueError, KeyError, TypeError):
+                        return 0
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if attempt == self.max_retries:
+                    r.raise_for_status()
+            time.sleep(self.backoff * (2 ** attempt))
+
+    def num_pages(self) -> int:
+        """Number of index pages reported by the CDX server (0 if it does not paginate)."""
+        if self.manifest["pages"] is None:
+            # only a definite answer is saved: a wrong 0 would pin the cache to the first page
+            self.manifest["pages"] = self._fetch_num_pages()
+            _save_json(self.manifest_path, self.manifest)
+        return self.manifest["pages"]
+
+    def _shards(self):
+        pages = self.num_pages()
+        if not pages:
+            return [(0, self.index_url)]
+        return [(page, f"{self.index_url}&page={page}") for page in range(pages)]
+
+    def _shard_path(self, page: int) -> str:
+        return os.path.join(self.dir, f"page-{page:05d}.jsonl.gz")
+
+    def _cached_lines(self, page: int):
+        lines = self.manifest["shard_lines"].get(str(page))
+        return lines if lines is not None and os.path.exists(self._shard_path(page)) else None
+
+    def _read_shard(self, page: int):
+        with gzip.open(self._shard_path(page), "rb") as f:
+            for line in f:
+                yield line.rstrip(b"\n")
+
+    def _spool_shard(self, page: int, url: str):
+        """Download one index page, writing it to the cache while yielding its lines."""
+        path = self._shard_path(page)
+        part_path = f"{path}.part"
+        os.makedirs(self.dir, exist_ok=True)
+        count = 0
+        with self.session.get(url, stream=True, timeout=30) as r:
+            # The CDX server answers 404 when a page has no captures.
+            if r.status_code != 404:
+                r.raise_for_status()
+            with gzip.open(part_path, "wb") as out:
+                if r.status_code != 404:
+                    for line in r.iter_lines():
+                        if not line:
+                            continue
+                        out.write(line + b"\n")
+                        count += 1
+                        yield line
+        os.replace(part_path, path)
+        self.manifest["shard_lines"][str(page)] = count
+        _save_json(self.manifest_path, self.manifest)
+
+    # ------------------- Reading ------------------- #
+    def iter_lines(self, start: int = 0):
+        """
+        Yield (position, line) for every index line after the first `start`
+        lines, where position is the number of lines consumed so far.
+        Cached pages are read from disk; missing pages are downloaded once.
+        """
+        position = 0
+        for page, url in self._shards():
+            cached = self._cached_lines(page)
+            if cached is not None and position + cached <= start:
+                position += cached
+                continue
+            lines = self._read_shard(page) if cached is not None else self._spool_shard(page, url)
+            for line in lines:
+                position += 1
+                if position % self.progress_every == 0:
+                    print(f"  Index lines read: {position:,}")
+                if position > start:
+                    yield position, line
+
+    def count_total(self):
+        """Total number of index lines, or None until every page has been cached."""
+        shards = self._shards()
+        counts = [self._cached_lines(page) for page, _ in shards]
+        return None if None in counts else sum(counts)
+
+    # ------------------- Checkpoints ------------------- #
+    def load_checkpoint(self) -> int:
+        checkpoint = _load_json(self.checkpoint_path)
+        return checkpoint["position"] if checkpoint else 0
+
+    def save_checkpoint(self, position: int):
+        _save_json(self.checkpoint_path, {"index_url": self.index_url, "position": position})
+
+    def clear_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
@@ -1,15 +1,27 @@
 import re
 import json
 import os
-import requests
-from io import BytesIO
+import sys
+from functools import partial
 from urllib.parse import urlparse
-from warcio.archiveiterator import ArchiveIterator
-from bs4 import BeautifulSoup
 import psycopg2
-from psycopg2.extras import execute_values
+import pyarrow as pa
 from dotenv import load_dotenv
 
+from db.copy_loader import copy_rows, replace_table
+from db.stage_store import COMMONCRAWL_RAW, StageWriter, default_store
+from extract.cdx_index import CdxIndexCache, CACHE_DIR
+from extract.frontier import DomainFrontier, DEFAULT_BUDGET, site_key
+from extract.html_extract import clean_text, extract_lxml, get_backend
+from extract.identifier_scanner import (SCANNER, ABN_LABEL_PATTERN, ABN_PATTERN, EMAIL_PATTERN, PHONE_PATTERN,
+                                        POSTCODE_PATTERN)
+from extract.index_filter import IndexFilter, capture_key
+from extract.local_warc import LocalWarcReader, DOMAIN_SUFFIXES
+from extract.parse_pool import ParsePool
+from extract.stream_writer import StreamingPostgresWriter
+from extract.warc_cache import WarcRecordCache, WARC_CACHE_BYTES
+from extract.warc_fetcher import WarcRangeFetcher, decode_payload
+
 # ------------------- Load DB Config ------------------- #
 load_dotenv(dotenv_path="C:/Users/Admin/Desktop/firmable-etl-pipeline/.venv/.env")  # full path
 
@@ -22,9 +34,6 @@ DB_CONFIG = {
 }
 
 # ------------------- Utility Functions ------------------- #
-def clean_text(text: str) -> str:
-    return ' '.join(text.split())
-
 def extract_domain(url: str) -> str:
     domain = urlparse(url).netloc
     return domain[4:] if domain.startswith("www.") else domain
@@ -37,188 +46,314 @@ def extract_company_name(domain: str) -> str:
     name = name.replace('-', ' ').replace('_', ' ').title()
     return name
 
+ABN_WEIGHTS = (10, 1, 3, 5, 7, 9, 11, 13, 15, 17, 19)
+ABN_SEPARATORS = re.compile(r'[\s\-]')
+ABN_DIGITS = re.compile(r'^\d{11}$')
+WHITESPACE = re.compile(r'\s+')
+
 def validate_abn(abn: str) -> bool:
     if not abn:
         return False
-    abn_clean = re.sub(r'[\s\-]', '', abn)
-    if not re.match(r'^\d{11}$', abn_clean):
+    abn_clean = ABN_SEPARATORS.sub('', abn)
+    if not ABN_DIGITS.match(abn_clean):
         return False
-    weights = [10, 1, 3, 5, 7, 9, 11, 13, 15, 17, 19]
-    total = sum((int(d) - 1 if i == 0 else int(d)) * w for i, (d, w) in enumerate(zip(abn_clean, weights)))
+    total = sum((int(d) - 1 if i == 0 else int(d)) * w for i, (d, w) in enumerate(zip(abn_clean, ABN_WEIGHTS)))
     return total % 89 == 0
 
+# Single-identifier helpers; parse_pages uses the one-pass IdentifierScanner instead.
 def extract_abn(text: str):
-    for pattern in [r'ABN[:\s]*([0-9 ]{11,20})', r'\b(\d{2}\s?\d{3}\s?\d{3}\s?\d{3})\b']:
-        match = re.search(pattern, text, re.IGNORECASE)
+    for pattern in [ABN_LABEL_PATTERN, ABN_PATTERN]:
+        match = pattern.search(text)
         if match:
-            abn = re.sub(r'\s+', '', match.group(1))
+            abn = WHITESPACE.sub('', match.group(1))
             if validate_abn(abn):
                 return abn
     return None
 
 def extract_emails(text: str):
-    return re.findall(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}', text)
+    return EMAIL_PATTERN.findall(text)
 
 def extract_phone(text: str):
-    return re.findall(r'(\+61\s?\d{1,2}\s?\d{3}\s?\d{3}|\(0\d\)\s?\d{4}\s?\d{4}|\d{4}\s?\d{3}\s?\d{3})', text)
+    return PHONE_PATTERN.findall(text)
 
 def extract_postcode(text: str):
-    match = re.search(r'\b(0[289][0-9]{2}|[1-9][0-9]{3})\b', text)
+    match = POSTCODE_PATTERN.search(text)
     return match.group(1) if match else None
 
+def parse_pages(pages, extract_html=extract_lxml):
+    """Parse a batch of (url, html) pages; identifiers for the whole batch are found in one scan_many call."""
+    extracted = [(url, *extract_html(html)) for url, html in pages]
+    identifiers = SCANNER.scan_many(text for _, _, text, _ in extracted)
+
+    records = []
+    for (url, title, text, structured_data), found in zip(extracted, identifiers):
+        records.append({
+            "url": url,
+            "domain": extract_domain(url),
+            "company_name": extract_company_name(extract_domain(url)),
+            "title": title,
+            "abn": found["abn"],
+            "emails": found["emails"],
+            "phones": found["phones"],
+            "postcode": found["postcode"],
+            "structured_data": structured_data,
+            "snippet": text[:500]
+        })
+    return records
+
+def parse_page(html: str, url: str, extract_html=extract_lxml):
+    return parse_pages([(url, html)], extract_html)[0]
+
 # ------------------- PostgreSQL Storage ------------------- #
-def store_to_postgres(records, table_name="prd_firmable.stg.common_crawl_raw_companies"):
-    if not records:
-        print("No records to store.")
-        return
-    
+RAW_TABLE = "prd_firmable.stg.common_crawl_raw_companies"
+RAW_COLUMNS = ["url", "domain", "company_name", "abn", "title", "emails", "phones", "postcode",
+               "structured_data", "snippet"]
+# Column types of the raw stage when a Parquet stage store is used (structured_data is a JSON string).
+RAW_SCHEMA = pa.schema([(column, pa.list_(pa.string()) if column in ("emails", "phones") else pa.string())
+                        for column in RAW_COLUMNS])
+
+
+def record_to_row(r):
+    return (
+        r["url"],
+        r["domain"],
+        r.get("company_name"),
+        r.get("abn"),
+        r.get("title"),
+        r.get("emails"),
+        r.get("phones"),
+        r.get("postcode"),
+        json.dumps(r.get("structured_data")),
+        r.get("snippet")
+    )
+
+
+RAW_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id SERIAL PRIMARY KEY,
+        url TEXT NOT NULL,
+        domain TEXT NOT NULL,
+        company_name TEXT,
+        abn CHAR(20),
+        title TEXT,
+        emails TEXT[],
+        phones TEXT[],
+        postcode CHAR(20),
+        structured_data JSONB,
+        snippet TEXT,
+        created_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+
+
+def create_raw_table(table_name=RAW_TABLE, replace=True):
+    """Create the raw table; replace=True drops it first (full load)."""
     conn = psycopg2.connect(**DB_CONFIG)
     cursor = conn.cursor()
-
-    # Drop & recreate table (full load)
-    cursor.execute(f"""
-        DROP TABLE IF EXISTS {table_name};
-        CREATE TABLE {table_name} (
-            id SERIAL PRIMARY KEY,
-            url TEXT NOT NULL,
-            domain TEXT NOT NULL,
-            company_name TEXT,
-            abn CHAR(20),
-            title TEXT,
-            emails TEXT[],
-            phones TEXT[],
-            postcode CHAR(20),
-            structured_data JSONB,
-            snippet TEXT,
-            created_at TIMESTAMP DEFAULT NOW()
-        );
-    """)
+    if replace:
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name};")
+    cursor.execute(RAW_TABLE_DDL.format(table=table_name))
     conn.commit()
+    cursor.close()
+    conn.close()
+
 
-    insert_query = f"""
-        INSERT INTO {table_name}
-        (url, domain, company_name, abn, title, emails, phones, postcode, structured_data, snippet)
-        VALUES %s
-        ON CONFLICT DO NOTHING;
+def store_to_postgres(records, table_name=RAW_TABLE, replace=True):
+    """
+    COPY records into the raw table. replace=True loads a fresh staging table
+    and swaps it in (full load); otherwise rows are appended.
     """
+    if not records:
+        print("No records to store.")
+        return 0
 
-    values = [
-        (
-            r["url"],
-            r["domain"],
-            r.get("company_name"),
-            r.get("abn"),
-            r.get("title"),
-            r.get("emails"),
-            r.get("phones"),
-            r.get("postcode"),
-            json.dumps(r.get("structured_data")),
-            r.get("snippet")
-        )
-        for r in records
-    ]
-
-    execute_values(cursor, insert_query, values)
-    conn.commit()
-    cursor.close()
+    rows = map(record_to_row, records)
+    conn = psycopg2.connect(**DB_CONFIG)
+    if replace:
+        count = replace_table(conn, table_name, RAW_COLUMNS, rows, RAW_TABLE_DDL)
+    else:
+        create_raw_table(table_name, replace=False)
+        count = copy_rows(conn, table_name, RAW_COLUMNS, rows)
+        conn.commit()
     conn.close()
-    print(f"Inserted {len(values)} records into PostgreSQL.")
+    print(f"Inserted {count} records into PostgreSQL.")
+    return count
 
 # ------------------- Common Crawl Scraper ------------------- #
 class CommonCrawlScraper:
-    def __init__(self, index_url: str):
+    def __init__(self, index_url: str, fetcher: WarcRangeFetcher = None, max_in_flight: int = 32,
+                 ordered: bool = False, cache_dir: str = CACHE_DIR, html_backend: str = "lxml",
+                 parse_workers: int = 1, parse_chunk_size: int = 32, warc_cache_bytes: int = WARC_CACHE_BYTES,
+                 index_filter: IndexFilter = None, page_budget: int = DEFAULT_BUDGET):
         self.index_url = index_url
+        self.extract_html = get_backend(html_backend)
+        # parse_workers > 1 moves parsing and identifier extraction off the main process.
+        self.parse_pool = ParsePool(partial(parse_pages, extract_html=self.extract_html),
+                                    workers=parse_workers, chunk_size=parse_chunk_size)
+        # Fetched WARC records are kept on disk so reruns (e.g. after a parser change) skip the network.
+        cache = WarcRecordCache(os.path.join(cache_dir, "warc"), warc_cache_bytes) if warc_cache_bytes else None
+        self.fetcher = fetcher or WarcRangeFetcher(max_in_flight=max_in_flight, cache=cache)
+        self.ordered = ordered
+        # Drops records not worth a range request (non-200, non-HTML, huge, older or duplicate captures).
+        self.index_filter = index_filter or IndexFilter()
+        # At most page_budget pages per site, most promising first; 0 fetches every index hit.
+        self.frontier = DomainFrontier(budget=page_budget) if page_budget else None
+        self.index = CdxIndexCache(index_url, cache_dir=cache_dir, session=self.fetcher.session)
+        self.index_position = 0
 
     def count_total_urls(self):
-        """Estimate total matching URLs."""
-        count = 0
-        try:
-            with requests.get(self.index_url, stream=True, timeout=30) as r:
-                r.raise_for_status()
-                for line in r.iter_lines():
-                    if line:
-                        count += 1
-        except Exception as e:
-            print(f"Error counting URLs: {e}")
-        return count
+        """Total matching URLs; reads the local index cache, spooling it first if needed."""
+        total = self.index.count_total()
+        if total is None:
+            total = 0
+            for total, _ in self.index.iter_lines():
+                pass
+        return total
 
-    def fetch_metadata(self, batch_size=1000):
-        """Yield metadata in batches."""
+    def fetch_metadata(self, batch_size=1000, start=0, max_batch_size=None):
+        """
+        Yield metadata in batches, skipping the first `start` index lines.
+        The index is read once through the local cache; when a batch is yielded,
+        self.index_position is the number of index lines it covers up to.
+        A batch is only cut between captures of different URLs, so they are
+        filtered together and a checkpoint never splits them. With the
+        frontier on it is cut between sites, unless one site runs past
+        max_batch_size records (10 x batch_size by default): the site then
+        continues in the next batch, so memory stays bounded.
+        """
+        max_batch_size = max_batch_size or 10 * batch_size
         batch = []
+        position = previous = start
         try:
-            with requests.get(self.index_url, stream=True, timeout=30) as r:
-                r.raise_for_status()
-                for line in r.iter_lines():
-                    if not line:
-                        continue
-                    try:
-                        record = json.loads(line.decode("utf-8"))
-                        batch.append(record)
-                        if len(batch) >= batch_size:
-                            yield batch
-                            batch = []
-                    except json.JSONDecodeError:
-                        continue
-                if batch:
+            for position, line in self.index.iter_lines(start=start):
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except json.JSONDecodeError:
+                    previous = position
+                    continue
+                if batch and capture_key(record) != capture_key(batch[-1]) and (
+                        len(batch) >= max_batch_size or len(batch) >= batch_size
+                        and (self.frontier is None or site_key(record) != site_key(batch[-1]))):
+                    self.index_position = previous
                     yield batch
+                    batch = []
+                batch.append(record)
+                previous = position
+            self.index_position = position
+            if batch:
+                yield batch
         except Exception as e:
             print(f"Error fetching metadata: {e}")
+            raise
 
     def fetch_html(self, record):
-        filename, offset, length = record.get("filename"), record.get("offset"), record.get("length")
-        if not all([filename, offset, length]):
-            return ""
-        try:
-            warc_url = f"https://data.commoncrawl.org/{filename}"
-            headers = {"Range": f"bytes={offset}-{int(offset)+int(length)-1}"}
-            response = requests.get(warc_url, headers=headers, timeout=30)
-            response.raise_for_status()
-            for rec in ArchiveIterator(BytesIO(response.content)):
-                if rec.rec_type == "response":
-                    return rec.content_stream().read().decode("utf-8", errors="ignore")
-        except Exception as e:
-            print(f"Error reading WARC: {e}")
-        return ""
+        return decode_payload(self.fetcher.fetch_record(record))
 
     def parse_html(self, html: str, url: str):
-        soup = BeautifulSoup(html, "html.parser")
-        text = clean_text(soup.get_text())
-
-        structured_data = []
-        for script in soup.find_all("script", {"type": "application/ld+json"}):
-            try:
-                data = json.loads(script.string)
-                if isinstance(data, list):
-                    structured_data.extend(data)
-                else:
-                    structured_data.append(data)
-            except Exception:
-                continue
-
-        return {
-            "url": url,
-            "domain": extract_domain(url),
-            "company_name": extract_company_name(extract_domain(url)),
-            "title": soup.title.get_text(strip=True) if soup.title else None,
-            "abn": extract_abn(text),
-            "emails": extract_emails(text),
-            "phones": extract_phone(text),
-            "postcode": extract_postcode(text),
-            "structured_data": structured_data,
-            "snippet": text[:500]
-        }
+        return parse_page(html, url, self.extract_html)
 
-    def run(self, batch_size=1000):
-        total_count = self.count_total_urls()
-        print(f"Total matching URLs in index: {total_count}\n")
+    def _fetched_pages(self, records):
+        for rec, payload in self.fetcher.fetch_many(self.index_filter.claim(records), ordered=self.ordered):
+            if payload:
+                yield rec["url"], payload
+            else:
+                self.index_filter.release(rec)
 
-        all_results = []
-        for batch_num, batch_metadata in enumerate(self.fetch_metadata(batch_size=batch_size), start=1):
+    def _fetch_and_parse(self, records):
+        yield from self.parse_pool.map(self._fetched_pages(records))
+
+    def iter_records(self, batch_metadata):
+        """Yield parsed records for one metadata batch as their pages arrive."""
+        batch_metadata = self.index_filter.apply(batch_metadata)
+        if self.frontier is None:
+            yield from self._fetch_and_parse(batch_metadata)
+        else:
+            yield from self.frontier.crawl(batch_metadata, self._fetch_and_parse)
+
+    def print_fetch_stats(self):
+        stats = self.fetcher.stats
+        print(self.index_filter.summary())
+        if self.frontier is not None:
+            print(self.frontier.summary())
+        print(f"WARC range requests: {stats['requests']:,}, retries: {stats['retries']:,}, errors: {stats['errors']:,}")
+        if self.fetcher.cache is not None:
+            cache = self.fetcher.cache.stats
+            print(f"WARC cache hits: {cache['hits']:,}, misses: {cache['misses']:,}, evictions: {cache['evictions']:,}")
+        print()
+
+    def _start_position(self, resume):
+        start = self.index.load_checkpoint() if resume else 0
+        if start:
+            print(f"Resuming after {start:,} index lines")
+        return start
+
+    def iter_batches(self, batch_size=1000, resume=True):
+        """
+        Yield the parsed results of each index batch.
+        With resume=True the run starts from the saved checkpoint, and the
+        checkpoint moves past a batch once the caller asks for the next one.
+        """
+        start = self._start_position(resume)
+        for batch_num, batch_metadata in enumerate(self.fetch_metadata(batch_size=batch_size, start=start), start=1):
             print(f"Processing batch {batch_num}, size={len(batch_metadata)}")
-            for rec in batch_metadata:
-                html = self.fetch_html(rec)
-                if html:
-                    all_results.append(self.parse_html(html, rec["url"]))
+            position = self.index_position
+            yield list(self.iter_records(batch_metadata))
+            if resume:
+                self.index.save_checkpoint(position)
+
+        print(f"Total matching URLs in index: {self.index_position:,}")
+        self.print_fetch_stats()
+        if resume:
+            self.index.clear_checkpoint()
+
+    def stream(self, writer: StreamingPostgresWriter, batch_size=1000, resume=True):
+        """
+        Stream parsed records straight into a StreamingPostgresWriter.
+        Memory stays bounded by the fetch window and the writer queue, and the
+        checkpoint only moves past a batch once the writer has committed it.
+        """
+        start = self._start_position(resume)
+        with writer:
+            for batch_num, batch_metadata in enumerate(self.fetch_metadata(batch_size=batch_size, start=start), start=1):
+                print(f"Processing batch {batch_num}, size={len(batch_metadata)}")
+                position = self.index_position
+                for record in self.iter_records(batch_metadata):
+                    writer.put(record)
+                if resume:
+                    writer.after_flush(partial(self.index.save_checkpoint, position))
+
+        print(f"Total matching URLs in index: {self.index_position:,}")
+        self.print_fetch_stats()
+        if resume:
+            self.index.clear_checkpoint()
+
+    # ------------------- Local WARC Files ------------------- #
+    def iter_local_records(self, warc_paths, domain_suffixes=DOMAIN_SUFFIXES, index_records=None):
+        """
+        Parse pages straight from local WARC/WARC.gz files, read sequentially
+        instead of one range request per page. index_records (CDX metadata)
+        optionally restricts the scan to the captures listed in the index.
+        """
+        reader = LocalWarcReader(warc_paths, domain_suffixes=domain_suffixes, index_records=index_records)
+        yield from self.parse_pool.map(reader.iter_pages())
+        print(f"Local WARC files: {reader.stats['files']}, records read: {reader.stats['records']:,}, "
+              f"pages parsed: {reader.stats['pages']:,}")
+
+    def stream_local(self, writer: StreamingPostgresWriter, warc_paths, domain_suffixes=DOMAIN_SUFFIXES,
+                     index_records=None):
+        """Stream records parsed from local WARC files into a StreamingPostgresWriter."""
+        with writer:
+            for record in self.iter_local_records(warc_paths, domain_suffixes, index_records):
+                writer.put(record)
+
+    def close(self):
+        self.fetcher.close()
+        self.parse_pool.close()
+
+    def run(self, batch_size=1000):
+        all_results = []
+        for results in self.iter_batches(batch_size=batch_size, resume=False):
+            all_results.extend(results)
         return all_results
 
 # ------------------- Main Execution ------------------- #
@@ -226,10 +361,30 @@ if __name__ == "__main__":
     query = "*.com.au"
     index_url = f"https://index.commoncrawl.org/CC-MAIN-2025-13-index?url={query}&output=json"
 
-    scraper = CommonCrawlScraper(index_url)
-    scraped_data = scraper.run(batch_size=1000)
+    # Pre-downloaded WARC files given on the command line are read locally instead.
+    warc_paths = sys.argv[1:]
+
+    scraper = CommonCrawlScraper(index_url, parse_workers=os.cpu_count())
 
-    # Store scraped data in PostgreSQL
-    store_to_postgres(scraped_data)
+    # Stream records into the raw table, committing every 5,000 rows or 30 seconds.
+    # An interrupted run resumes from the last committed batch instead of starting over.
+    # With STAGE_STORE_DIR set, records go to the raw Parquet stage instead.
+    fresh_run = bool(warc_paths) or scraper.index.load_checkpoint() == 0
+    store = default_store()
+    if store is not None:
+        if fresh_run:
+            store.clear(COMMONCRAWL_RAW)
+        writer = StageWriter(store, COMMONCRAWL_RAW, RAW_COLUMNS, RAW_SCHEMA, to_row=record_to_row)
+    else:
+        create_raw_table(RAW_TABLE, replace=fresh_run)
+        writer = StreamingPostgresWriter(DB_CONFIG, RAW_TABLE, RAW_COLUMNS, to_row=record_to_row,
+                                         flush_rows=5_000, flush_seconds=30)
+    try:
+        if warc_paths:
+            scraper.stream_local(writer, warc_paths, domain_suffixes=(".com.au",))
+        else:
+            scraper.stream(writer, batch_size=1000)
+    finally:
+        scraper.close()
 
     print("Scraping and storage complete.")
@@ -0,0 +1,113 @@
+"""
+frontier.py
+-----------
+Per-domain crawl frontier for the Common Crawl scraper.
+
+The scraper's output is one company per domain, and most pages of a site
+carry no ABN or contact details. Instead of fetching every index hit, the
+frontier:
+1. groups index records by site (the host part of the SURT urlkey),
+2. orders each site's pages by likely value: homepage, contact, about,
+   terms/privacy, then shallow pages before deep ones,
+3. fetches in waves (a few pages per site per wave, all sites together so
+   range requests stay concurrent),
+4. stops a site once an ABN and a contact (email or phone) have been found,
+   or once its page budget is spent.
+5. a site too large for one batch continues in the next: the budget spent
+   and the identifiers found on the last site of a batch carry over.
+"""
+
+import re
+from urllib.parse import urlparse
+
+DEFAULT_BUDGET = 8
+DEFAULT_PAGES_PER_WAVE = 2
+
+# Lower rank is fetched first; anything else gets len(PAGE_RANKS).
+PAGE_RANKS = [
+    re.compile(r"^/?(index\.(html?|php|aspx?)|home/?)?$"),
+    re.compile(r"contact|get-in-touch|enquir"),
+    re.compile(r"about|our-company|who-we-are|our-story"),
+    re.compile(r"terms|privacy|legal|disclaimer|imprint"),
+]
+
+
+def site_key(record) -> str:
+    """Site a capture belongs to: the host part of its SURT urlkey (www. is already folded in)."""
+    urlkey = record.get("urlkey")
+    if urlkey and ")" in urlkey:
+        return urlkey.split(")", 1)[0]
+    host = urlparse(record.get("url", "")).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def page_priority(url: str):
+    """Sort key for a page: (rank, path depth, has query, length)."""
+    parsed = urlparse(url)
+    path = parsed.path.lower()
+    rank = next((i for i, pattern in enumerate(PAGE_RANKS) if pattern.search(path)), len(PAGE_RANKS))
+    depth = len([segment for segment in path.split("/") if segment])
+    return rank, depth, bool(parsed.query), len(url)
+
+
+class DomainFrontier:
+    def __init__(self, budget: int = DEFAULT_BUDGET, pages_per_wave: int = DEFAULT_PAGES_PER_WAVE):
+        self.budget = budget
+        self.pages_per_wave = pages_per_wave
+        self.stats = {"sites": 0, "sites_complete": 0, "pages_fetched": 0, "pages_skipped": 0, "waves": 0}
+        self._carried = {}  # last site of the previous batch -> (pages fetched, found)
+
+    def crawl(self, records, fetch_and_parse):
+        """
+        Crawl one batch of index records. A site's captures are in one batch,
+        except that the last site of a batch may continue at the start of the
+        next one (pages are then prioritised within each batch).
+        fetch_and_parse(records) fetches and parses a wave of index records and
+        yields parsed page records (with their "url"); parsed records are
+        yielded as they arrive.
+        """
+        queues = {}
+        for record in records:
+            queues.setdefault(site_key(record), []).append(record)
+        for queue in queues.values():
+            queue.sort(key=lambda record: page_priority(record.get("url", "")))
+        carried = self._carried
+        self.stats["sites"] += len(queues.keys() - carried.keys())
+
+        fetched = {site: carried[site][0] if site in carried else 0 for site in queues}
+        found = {site: carried[site][1] if site in carried else {"abn": False, "contact": False} for site in queues}
+        for site in queues.keys() & carried.keys():
+            if (found[site]["abn"] and found[site]["contact"]) or fetched[site] >= self.budget:
+                self.stats["pages_skipped"] += len(queues.pop(site))
+        while queues:
+            wave, site_of_url = [], {}
+            for site, queue in queues.items():
+                take = min(self.pages_per_wave, self.budget - fetched[site])
+                for record in queue[:take]:
+                    wave.append(record)
+                    site_of_url[record.get("url")] = site
+                del queue[:take]
+                fetched[site] += take
+            self.stats["waves"] += 1
+            self.stats["pages_fetched"] += len(wave)
+
+            for page in fetch_and_parse(wave):
+                state = found[site_of_url[page["url"]]]
+                state["abn"] = state["abn"] or bool(page.get("abn"))
+                state["contact"] = state["contact"] or bool(page.get("emails") or page.get("phones"))
+                yield page
+
+            for site in list(queues):
+                complete = found[site]["abn"] and found[site]["contact"]
+                if complete or not queues[site] or fetched[site] >= self.budget:
+                    self.stats["sites_complete"] += complete
+                    self.stats["pages_skipped"] += len(queues.pop(site))
+
+        if records:
+            last_site = site_key(records[-1])
+            self._carried = {last_site: (fetched[last_site], found[last_site])}
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"Frontier: {s['sites']:,} sites ({s['sites_complete']:,} with ABN and contact), "
+                f"{s['pages_fetched']:,} pages fetched, {s['pages_skipped']:,} skipped, {s['waves']:,} waves")
@@ -0,0 +1,151 @@
+"""
+html_extract.py
+---------------
+Pluggable HTML extraction backends for CommonCrawlScraper.parse_html.
+
+Every backend returns (title, text, structured_data):
+  - title:           text of the first <title>, stripped (None if absent)
+  - text:            visible page text, whitespace-collapsed
+  - structured_data: decoded application/ld+json blocks
+
+Backends:
+  - "bs4":  the original BeautifulSoup(html, "html.parser") full-tree parse.
+  - "lxml": libxml2 SAX-style parser target. No tree is built; only the title,
+            visible text (up to text_cap characters) and ld+json script bodies
+            are collected. With chunk_size set, the document is fed to the
+            parser incrementally (streaming mode), and max_chars stops reading
+            oversized pages early.
+"""
+
+import json
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+TEXT_CAP = 200_000
+LD_JSON_TYPE = "application/ld+json"
+
+# Elements whose contents BeautifulSoup's get_text() leaves out.
+_HIDDEN_TAGS = {"script", "style", "template"}
+
+
+def clean_text(text: str) -> str:
+    return ' '.join(text.split())
+
+
+def load_ld_json(blocks):
+    structured_data = []
+    for block in blocks:
+        try:
+            data = json.loads(block)
+            if isinstance(data, list):
+                structured_data.extend(data)
+            else:
+                structured_data.append(data)
+        except Exception:
+            continue
+    return structured_data
+
+
+# ------------------- BeautifulSoup Backend ------------------- #
+def extract_bs4(html: str, text_cap: int = None):
+    soup = BeautifulSoup(html, "html.parser")
+    text = soup.get_text()
+    if text_cap is not None:
+        text = text[:text_cap]
+    blocks = [script.string for script in soup.find_all("script", {"type": LD_JSON_TYPE})]
+    title = soup.title.get_text(strip=True) if soup.title else None
+    return title, clean_text(text), load_ld_json(blocks)
+
+
+# ------------------- lxml Backend ------------------- #
+class _PageTarget:
+    """Parser target collecting the title, visible text and ld+json script bodies."""
+
+    def __init__(self, text_cap):
+        self.text_cap = text_cap
+        self.text_parts = []
+        self.text_len = 0
+        self.title_parts = None
+        self.title_done = False
+        self.ld_blocks = []
+        self._ld_parts = None
+        self._hidden_depth = 0
+        self._in_title = False
+
+    def start(self, tag, attrib):
+        tag = tag.lower()
+        if tag in _HIDDEN_TAGS:
+            self._hidden_depth += 1
+            if tag == "script" and attrib.get("type") == LD_JSON_TYPE:
+                self._ld_parts = []
+        elif tag == "title" and not self.title_done:
+            self._in_title = True
+            self.title_parts = []
+
+    def end(self, tag):
+        tag = tag.lower()
+        if tag in _HIDDEN_TAGS:
+            self._hidden_depth = max(self._hidden_depth - 1, 0)
+            if tag == "script" and self._ld_parts is not None:
+                self.ld_blocks.append("".join(self._ld_parts))
+                self._ld_parts = None
+        elif tag == "title" and self._in_title:
+            self._in_title = False
+            self.title_done = True
+
+    def data(self, data):
+        if self._ld_parts is not None:
+            self._ld_parts.append(data)
+            return
+        if self._hidden_depth:
+            return
+        if self._in_title:
+            self.title_parts.append(data)
+        if self.text_len < self.text_cap:
+            self.text_parts.append(data)
+            self.text_len += len(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self
+
+
+def extract_lxml(html, text_cap: int = TEXT_CAP, chunk_size: int = None, max_chars: int = None):
+    target = _PageTarget(text_cap if text_cap is not None else float("inf"))
+    parser = etree.HTMLParser(target=target, recover=True)
+    if max_chars is not None:
+        html = html[:max_chars]
+    try:
+        if chunk_size:
+            for i in range(0, len(html), chunk_size):
+                parser.feed(html[i:i + chunk_size])
+        else:
+            parser.feed(html)
+        parser.close()
+    except etree.LxmlError:
+        # Empty or hopeless documents: keep whatever was collected.
+        pass
+
+    text = "".join(target.text_parts)
+    if text_cap is not None:
+        text = text[:text_cap]
+    title = None
+    if target.title_parts is not None:
+        title = "".join(target.title_parts).strip()
+    return title, clean_text(text), load_ld_json(target.ld_blocks)
+
+
+# ------------------- Backend Registry ------------------- #
+BACKENDS = {
+    "bs4": extract_bs4,
+    "lxml": extract_lxml,
+}
+
+
+def get_backend(name: str):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown HTML extraction backend: {name} (expected one of {sorted(BACKENDS)})")
+    return BACKENDS[name]
@@ -0,0 +1,153 @@
+"""
+identifier_scanner.py
+---------------------
+Single-pass scanner for ABNs, emails, phone numbers and postcodes in page text.
+
+The text is classified once: a vectorised pass over its code points finds the
+runs of ASCII digits, which are merged into candidate spans (digits joined by
+whitespace, brackets or "+"), and emails are anchored on "@". The precompiled
+patterns then run only over those spans instead of rescanning the whole page
+once per identifier kind.
+
+Every span of text is attributed to at most one identifier kind, tried in
+this order:
+    email > labelled ABN ("ABN: ...") > bare 11-digit ABN > phone > postcode
+so the digits of an ABN are no longer also reported as a phone number, and the
+digits of a phone number are no longer taken as the postcode. A labelled ABN
+takes only its 11 digits: the digits after it ("ABN 51 824 753 556 0412 345
+678") are scanned again, as bare ABNs, phones and postcodes.
+
+ABN candidates from all documents in a scan_many() call are validated together:
+the mod-89 checksum is computed for every candidate in one NumPy operation.
+"""
+
+import re
+from bisect import bisect_right
+
+import numpy as np
+
+ABN_WEIGHTS = np.array([10, 1, 3, 5, 7, 9, 11, 13, 15, 17, 19], dtype=np.int64)
+
+EMAIL_PATTERN = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+ABN_LABEL_PATTERN = re.compile(r"ABN[:\s]*([0-9 ]{11,20})", re.IGNORECASE)
+ABN_PATTERN = re.compile(r"\b(\d{2}\s?\d{3}\s?\d{3}\s?\d{3})\b")
+PHONE_PATTERN = re.compile(r"(\+61\s?\d{1,2}\s?\d{3}\s?\d{3}|\(0\d\)\s?\d{4}\s?\d{4}|\d{4}\s?\d{3}\s?\d{3})")
+POSTCODE_PATTERN = re.compile(r"\b(0[289][0-9]{2}|[1-9][0-9]{3})\b")
+
+_EMAIL_LOCAL_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789._%+-")
+_ABN_LABEL_TAIL = re.compile(r"ABN[:\s]*\Z", re.IGNORECASE)
+# exactly 11 digits (spaces allowed between them) ending where the digit run does
+_ABN_LABEL_DIGITS = re.compile(r"(?:[0-9] *){10}[0-9](?![0-9])")
+_SPAN_GAP = re.compile(r"[\s()+]*")
+_DIGIT_KINDS = re.compile(
+    rf"(?P<abn>{ABN_PATTERN.pattern})|(?P<phone>{PHONE_PATTERN.pattern})|(?P<postcode>{POSTCODE_PATTERN.pattern})"
+)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def validate_abns(candidates) -> np.ndarray:
+    """Vectorised ABN checksum: returns a boolean array, one entry per candidate string."""
+    candidates = list(candidates)
+    valid = np.zeros(len(candidates), dtype=bool)
+    positions = [i for i, abn in enumerate(candidates) if len(abn) == 11 and abn.isascii() and abn.isdigit()]
+    if not positions:
+        return valid
+    digits = np.frombuffer("".join(candidates[i] for i in positions).encode("ascii"), dtype=np.uint8)
+    digits = digits.reshape(-1, 11).astype(np.int64) - ord("0")
+    digits[:, 0] -= 1
+    valid[positions] = (digits @ ABN_WEIGHTS) % 89 == 0
+    return valid
+
+
+def _digit_spans(text: str):
+    """[start, end) spans of ASCII digit runs, merged across whitespace, brackets and '+'."""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    is_digit = ((codes >= 48) & (codes <= 57)).view(np.int8)
+    edges = np.flatnonzero(np.diff(is_digit, prepend=0, append=0)).reshape(-1, 2)
+
+    spans = []
+    for start, end in edges.tolist():
+        if spans and _SPAN_GAP.fullmatch(text, spans[-1][1], start):
+            spans[-1][1] = end
+        else:
+            spans.append([start, end])
+    return spans
+
+
+def _find_emails(text: str):
+    emails, spans = [], []
+    prev_end = 0
+    at = text.find("@")
+    while at != -1:
+        start = at
+        while start > prev_end and text[start - 1] in _EMAIL_LOCAL_CHARS:
+            start -= 1
+        if start < at:
+            match = EMAIL_PATTERN.match(text, start)
+            if match:
+                emails.append(match.group())
+                spans.append(match.span())
+                prev_end = match.end()
+        at = text.find("@", at + 1)
+    return emails, spans
+
+
+class IdentifierScanner:
+    def _collect(self, text: str):
+        emails, email_spans = _find_emails(text)
+        email_starts = [start for start, _ in email_spans]
+
+        def in_email(pos):
+            i = bisect_right(email_starts, pos) - 1
+            return i >= 0 and pos < email_spans[i][1]
+
+        found = {"emails": emails, "abn_label": [], "abn": [], "phones": [], "postcode": None}
+        scanned_to = 0
+        for start, end in _digit_spans(text):
+            pos = max(start - 1 if start and text[start - 1] in "(+" else start, scanned_to)
+            if _ABN_LABEL_TAIL.search(text, max(pos - 24, 0), start) and not in_email(start):
+                label = _ABN_LABEL_DIGITS.match(text, start)
+                if label:
+                    found["abn_label"].append(_WHITESPACE.sub("", label.group()))
+                    pos = label.end()
+            for match in _DIGIT_KINDS.finditer(text, pos, end + 1):
+                if in_email(match.start()):
+                    continue
+                kind = match.lastgroup
+                if kind == "postcode":
+                    found["postcode"] = found["postcode"] or match.group(kind)
+                elif kind == "abn":
+                    found["abn"].append(_WHITESPACE.sub("", match.group(kind)))
+                else:
+                    found["phones"].append(match.group(kind))
+                pos = match.end()
+            scanned_to = max(pos, end)
+        return found
+
+    def scan_many(self, texts):
+        """Scan many documents; returns one {"abn", "emails", "phones", "postcode"} dict per text."""
+        collected = [self._collect(text or "") for text in texts]
+
+        # Labelled candidates win over bare ones; validate them all in one batch.
+        candidates, owners = [], []
+        for doc, found in enumerate(collected):
+            for abn in found["abn_label"] + found["abn"]:
+                candidates.append(abn)
+                owners.append(doc)
+        valid = validate_abns(candidates)
+
+        abns = [None] * len(collected)
+        for abn, doc, ok in zip(candidates, owners, valid):
+            if ok and abns[doc] is None:
+                abns[doc] = abn
+
+        return [
+            {"abn": abn, "emails": found["emails"], "phones": found["phones"], "postcode": found["postcode"]}
+            for abn, found in zip(abns, collected)
+        ]
+
+    def scan(self, text: str) -> dict:
+        return self.scan_many([text])[0]
+
+
+SCANNER = IdentifierScanner()
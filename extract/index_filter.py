@@ -0,0 +1,134 @@
+"""
+index_filter.py
+---------------
+Pre-fetch filter over CDX index records.
+
+Every index record costs one WARC range request, so records that would be
+thrown away after fetching are dropped here instead, using only the index
+metadata (status, mime, length, digest, languages):
+1. status and MIME type allow-lists (drops redirects, errors, binaries),
+2. a maximum record length,
+3. an optional language allow-list,
+4. latest capture per URL (captures of one urlkey are adjacent in the index),
+5. digest dedup: identical payloads captured under several URLs are fetched
+   once. A digest counts as seen only once a record with it is fetched
+   (claim() just before the range requests, release() if one fails), so a
+   copy the frontier skipped never hides a later one. The most recent
+   max_digests digests are remembered.
+"""
+
+from collections import OrderedDict
+
+DEFAULT_STATUSES = ("200",)
+DEFAULT_MIME_TYPES = ("text/html", "application/xhtml+xml")
+DEFAULT_MAX_LENGTH = 2_000_000
+DEFAULT_MAX_DIGESTS = 1_000_000
+
+
+def capture_key(record) -> str:
+    """Key grouping captures of the same URL (the SURT urlkey; the raw URL if it is missing)."""
+    return record.get("urlkey") or record.get("url")
+
+
+class IndexFilter:
+    def __init__(self, statuses=DEFAULT_STATUSES, mime_types=DEFAULT_MIME_TYPES,
+                 max_length: int = DEFAULT_MAX_LENGTH, languages=None,
+                 latest_per_url: bool = True, dedup_digest: bool = True, max_digests: int = DEFAULT_MAX_DIGESTS):
+        """Pass None (or 0 for max_length) to switch a rule off."""
+        self.statuses = set(statuses) if statuses else None
+        self.mime_types = set(mime_types) if mime_types else None
+        self.max_length = max_length
+        self.languages = set(languages) if languages else None
+        self.latest_per_url = latest_per_url
+        self.dedup_digest = dedup_digest
+        self.max_digests = max_digests
+        self.fetched_digests = OrderedDict()  # digest -> None, oldest first
+        self.stats = {"records": 0, "kept": 0, "status": 0, "mime": 0, "length": 0, "language": 0,
+                      "older_capture": 0, "duplicate_digest": 0, "bytes_avoided": 0}
+
+    def _rejected_by(self, record):
+        """Name of the first metadata rule the record fails, or None. Missing fields never reject."""
+        status = record.get("status")
+        if self.statuses and status and status not in self.statuses:
+            return "status"
+        mimes = {mime for mime in (record.get("mime"), record.get("mime-detected")) if mime}
+        if self.mime_types and mimes and not mimes & self.mime_types:
+            return "mime"
+        if self.max_length and int(record.get("length") or 0) > self.max_length:
+            return "length"
+        languages = record.get("languages")
+        if self.languages and languages and not set(languages.split(",")) & self.languages:
+            return "language"
+        return None
+
+    def _drop(self, record, reason):
+        self.stats[reason] += 1
+        self.stats["bytes_avoided"] += int(record.get("length") or 0)
+
+    def apply(self, records):
+        """Filter one batch of index records; returns the records worth fetching, in index order."""
+        candidates = []
+        for record in records:
+            self.stats["records"] += 1
+            reason = self._rejected_by(record)
+            if reason:
+                self._drop(record, reason)
+            else:
+                candidates.append(record)
+
+        if self.latest_per_url:
+            latest = {}
+            for record in candidates:
+                key = capture_key(record)
+                current = latest.get(key)
+                if current is None or record.get("timestamp", "") >= current.get("timestamp", ""):
+                    latest[key] = record
+            kept_ids = {id(record) for record in latest.values()}
+            for record in candidates:
+                if id(record) not in kept_ids:
+                    self._drop(record, "older_capture")
+            candidates = [record for record in candidates if id(record) in kept_ids]
+
+        kept = []
+        for record in candidates:
+            if self.dedup_digest and record.get("digest") in self.fetched_digests:
+                self._drop(record, "duplicate_digest")
+            else:
+                kept.append(record)
+
+        self.stats["kept"] += len(kept)
+        return kept
+
+    def claim(self, records):
+        """
+        Of records about to be fetched, those whose digest has not been
+        fetched yet (the first of each within records); their digests are
+        recorded as fetched.
+        """
+        if not self.dedup_digest:
+            return list(records)
+        claimed = []
+        for record in records:
+            digest = record.get("digest")
+            if digest and digest in self.fetched_digests:
+                self._drop(record, "duplicate_digest")
+                self.stats["kept"] -= 1
+                continue
+            if digest:
+                self.fetched_digests[digest] = None
+                if len(self.fetched_digests) > self.max_digests:
+                    self.fetched_digests.popitem(last=False)
+            claimed.append(record)
+        return claimed
+
+    def release(self, record):
+        """Forget a claimed record's digest after its fetch failed, so another copy can still be fetched."""
+        self.fetched_digests.pop(record.get("digest"), None)
+
+    def summary(self) -> str:
+        s = self.stats
+        dropped = s["records"] - s["kept"]
+        return (f"Index filter kept {s['kept']:,} of {s['records']:,} records; {dropped:,} requests and "
+                f"{s['bytes_avoided'] / 1024 ** 2:,.1f} MB avoided (status {s['status']:,}, mime {s['mime']:,}, "
+                f"length {s['length']:,}, language {s['language']:,}, older capture {s['older_capture']:,}, "
+                f"duplicate digest {s['duplicate_digest']:,})")
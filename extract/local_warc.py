@@ -0,0 +1,78 @@
+"""
+local_warc.py
+-------------
+Sequential reader for local (pre-downloaded) WARC / WARC.gz files.
+
+Instead of one HTTP range request per page, whole WARC files are streamed
+front to back with warcio's ArchiveIterator, so I/O is sequential and runs at
+disk speed. Records are kept when:
+1. they are HTTP responses with an allowed status and MIME type,
+2. the target host ends with one of the domain suffixes, and
+3. if index records are given, the record's (file name, offset) is one of them.
+"""
+
+import os
+from urllib.parse import urlparse
+
+from warcio.archiveiterator import ArchiveIterator
+
+DOMAIN_SUFFIXES = (".au",)
+
+
+def host_matches(url: str, suffixes) -> bool:
+    host = (urlparse(url).hostname or "").rstrip(".")
+    return any(host == suffix.lstrip(".") or host.endswith(suffix) for suffix in suffixes)
+
+
+def index_offsets(index_records):
+    """{warc file name: {offset, ...}} from CDX index records; files are matched by base name."""
+    offsets = {}
+    for rec in index_records:
+        offsets.setdefault(os.path.basename(rec["filename"]), set()).add(int(rec["offset"]))
+    return offsets
+
+
+class LocalWarcReader:
+    def __init__(self, paths, domain_suffixes=DOMAIN_SUFFIXES, index_records=None,
+                 statuses=("200",), mime_types=("text/html",)):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.domain_suffixes = tuple(domain_suffixes)
+        self.offsets = index_offsets(index_records) if index_records is not None else None
+        self.statuses = set(statuses) if statuses else None
+        self.mime_types = set(mime_types) if mime_types else None
+        self.stats = {"files": 0, "records": 0, "pages": 0, "bytes": 0}
+
+    def _keep(self, record) -> bool:
+        if record.rec_type != "response" or record.http_headers is None:
+            return False
+        url = record.rec_headers.get_header("WARC-Target-URI") or ""
+        if not host_matches(url, self.domain_suffixes):
+            return False
+        if self.statuses and record.http_headers.get_statuscode() not in self.statuses:
+            return False
+        if self.mime_types:
+            mime = (record.http_headers.get_header("Content-Type") or "").split(";")[0].strip().lower()
+            if mime not in self.mime_types:
+                return False
+        return True
+
+    def iter_pages(self):
+        """Yield (url, payload_bytes) for every matching record, file by file in order."""
+        for path in self.paths:
+            filename = os.path.basename(path)
+            if self.offsets is not None and filename not in self.offsets:
+                continue
+            self.stats["files"] += 1
+            with open(path, "rb") as f:
+                records = ArchiveIterator(f)
+                for record in records:
+                    self.stats["records"] += 1
+                    if not self._keep(record):
+                        continue
+                    payload = record.content_stream().read()
+                    # The record offset is only known once the record has been read.
+                    if self.offsets is not None and records.get_record_offset() not in self.offsets[filename]:
+                        continue
+                    self.stats["pages"] += 1
+                    self.stats["bytes"] += len(payload)
+                    yield record.rec_headers.get_header("WARC-Target-URI"), payload
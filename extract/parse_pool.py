@@ -0,0 +1,75 @@
+"""
+parse_pool.py
+-------------
+Multi-process parse stage between fetching and storing.
+
+Raw WARC payload bytes are grouped into chunks of `chunk_size` pages and sent
+to a pool of worker processes; each worker decodes and parses its chunk and
+sends back the compact result records. Chunking keeps pickling/IPC overhead per
+page low, and at most `max_pending` chunks are in flight so memory stays
+bounded. Results are yielded in input order.
+"""
+
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from extract.warc_fetcher import decode_payload
+
+
+def _parse_chunk(parse_fn, chunk):
+    return parse_fn([(url, decode_payload(payload)) for url, payload in chunk])
+
+
+def _chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ParsePool:
+    def __init__(self, parse_fn, workers: int = None, chunk_size: int = 32, max_pending: int = None):
+        """
+        parse_fn([(url, html), ...]) -> [record, ...] parses one chunk. It must be
+        a picklable module-level function (or functools.partial of one), since
+        it is shipped to the workers.
+        """
+        self.parse_fn = parse_fn
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending or self.workers * 2
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            # not fork: the pool starts while fetch and writer threads are running
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("forkserver"))
+        return self._executor
+
+    def map(self, pages):
+        """Parse an iterable of (url, payload_bytes); yields records in order."""
+        if self.workers <= 1:
+            for chunk in _chunked(pages, self.chunk_size):
+                yield from _parse_chunk(self.parse_fn, chunk)
+            return
+
+        pool = self._pool()
+        pending = deque()
+        for chunk in _chunked(pages, self.chunk_size):
+            pending.append(pool.submit(_parse_chunk, self.parse_fn, chunk))
+            if len(pending) >= self.max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,111 @@
+"""
+stream_writer.py
+----------------
+Bounded-memory, append-mode Postgres writer for streaming extracts.
+
+Producers put records on a bounded queue; a background thread converts them
+to rows and COPYs them into the target table every `flush_rows` rows or
+`flush_seconds` seconds, whichever comes first. Each flush is committed, so
+partial progress is durable. Callbacks registered with after_flush() run once
+every record queued before them has been committed (used for checkpoints).
+"""
+
+import time
+import queue
+import threading
+
+import psycopg2
+
+from db.copy_loader import copy_rows
+
+
+class StreamingPostgresWriter:
+    def __init__(self, db_config: dict, table_name: str, columns, to_row=tuple, queue_size: int = 10_000,
+                 flush_rows: int = 5_000, flush_seconds: float = 30.0):
+        self.db_config = db_config
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.to_row = to_row
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rows_written = 0
+        self.error = None
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="pg-stream-writer", daemon=True)
+        self._thread.start()
+
+    # ------------------- Producer API ------------------- #
+    def _enqueue(self, item):
+        while True:
+            if self.error is not None:
+                raise RuntimeError(f"Streaming writer for {self.table_name} failed") from self.error
+            try:
+                self._queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def put(self, record):
+        """Queue one record; blocks while the queue is full."""
+        self._enqueue(("row", record))
+
+    def after_flush(self, callback):
+        """Run callback() once every record queued so far has been committed."""
+        self._enqueue(("callback", callback))
+
+    def close(self):
+        """Flush the remaining rows and stop the writer thread."""
+        if self._thread.is_alive():
+            self._enqueue(("stop", None))
+            self._thread.join()
+        if self.error is not None:
+            raise RuntimeError(f"Streaming writer for {self.table_name} failed") from self.error
+        print(f"Streamed {self.rows_written:,} records into {self.table_name}.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # ------------------- Writer Thread ------------------- #
+    def _run(self):
+        try:
+            conn = psycopg2.connect(**self.db_config)
+            try:
+                self._consume(conn)
+            finally:
+                conn.close()
+        except Exception as e:
+            self.error = e
+
+    def _consume(self, conn):
+        rows, callbacks = [], []
+        deadline = time.monotonic() + self.flush_seconds
+        while True:
+            try:
+                kind, item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                kind, item = None, None
+
+            if kind == "row":
+                rows.append(self.to_row(item))
+            elif kind == "callback":
+                callbacks.append(item)
+
+            if kind == "stop" or len(rows) >= self.flush_rows or time.monotonic() >= deadline:
+                self._flush(conn, rows, callbacks)
+                rows, callbacks = [], []
+                deadline = time.monotonic() + self.flush_seconds
+            if kind == "stop":
+                return
+
+    def _flush(self, conn, rows, callbacks):
+        if rows:
+            copy_rows(conn, self.table_name, self.columns, rows)
+            conn.commit()
+            self.rows_written += len(rows)
+            print(f"  Flushed {len(rows):,} rows into {self.table_name} (total {self.rows_written:,})")
+        for callback in callbacks:
+            callback()
@@ -0,0 +1,106 @@
+"""
+warc_cache.py
+-------------
+Persistent on-disk cache for WARC records fetched by byte range.
+
+1. Entries are keyed by the WARC coordinates of an index record
+   (filename, offset, length), so a rerun over the same crawl reads each
+   record from local disk instead of data.commoncrawl.org.
+2. Entries are the raw (gzipped) range bytes, stored under a sha1 of the
+   coordinates and written atomically.
+3. Hits are read through mmap and refresh the entry's mtime; when the cache
+   grows past max_bytes the least recently used entries are evicted.
+"""
+
+import os
+import mmap
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from extract.cdx_index import CACHE_DIR
+
+WARC_CACHE_DIR = os.path.join(CACHE_DIR, "warc")
+WARC_CACHE_BYTES = int(os.getenv("CC_WARC_CACHE_BYTES", 5 * 1024 ** 3))
+
+
+def record_key(filename: str, offset, length) -> str:
+    return hashlib.sha1(f"{filename}:{int(offset)}:{int(length)}".encode()).hexdigest()
+
+
+class WarcRecordCache:
+    def __init__(self, cache_dir: str = WARC_CACHE_DIR, max_bytes: int = WARC_CACHE_BYTES):
+        self.dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self.size = sum(size for _, _, size in self._entries())
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.dir, key[:2], key)
+
+    def _entries(self):
+        """(mtime, path, size) for every cached record."""
+        if not os.path.isdir(self.dir):
+            return []
+        entries = []
+        for sub in os.scandir(self.dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.is_file() and ".part" not in entry.name:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    # ------------------- Reading ------------------- #
+    @contextmanager
+    def open_record(self, filename: str, offset, length):
+        """
+        Context manager yielding a read-only mmap of the cached range bytes,
+        or None on a miss. The mapping is only valid inside the with block.
+        """
+        path = self._path(record_key(filename, offset, length))
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            self._count("misses")
+            yield None
+            return
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            self._count("hits")
+            os.utime(path)
+            yield mapped
+
+    # ------------------- Writing ------------------- #
+    def put(self, filename: str, offset, length, content: bytes):
+        if not content or len(content) > self.max_bytes:
+            return
+        path = self._path(record_key(filename, offset, length))
+        part_path = f"{path}.part.{threading.get_ident()}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(part_path, "wb") as f:
+            f.write(content)
+        existed = os.path.exists(path)
+        os.replace(part_path, path)
+        with self._lock:
+            self.size += 0 if existed else len(content)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until the cache is back under 90% of max_bytes."""
+        target = self.max_bytes * 0.9
+        for _, path, size in sorted(self._entries()):
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+            self.stats["evictions"] += 1
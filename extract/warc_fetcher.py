@@ -0,0 +1,153 @@
+"""
+warc_fetcher.py
+---------------
+Concurrent byte-range fetcher for Common Crawl WARC records.
+
+1. One pooled requests.Session shared by all worker threads, so range requests
+   against data.commoncrawl.org reuse TCP/TLS connections.
+2. Bounded number of requests in flight (thread pool + submission window).
+3. Retries with exponential backoff on 503 SlowDown and other transient errors.
+4. Results delivered in index order or as soon as they complete.
+5. Optional on-disk WarcRecordCache consulted before any request is made.
+"""
+
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from io import BytesIO
+
+import requests
+from requests.adapters import HTTPAdapter
+from warcio.archiveiterator import ArchiveIterator
+
+from extract.warc_cache import WarcRecordCache
+
+WARC_BASE_URL = "https://data.commoncrawl.org"
+
+# S3 answers throttled requests with "503 SlowDown"; the others are transient too.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# ------------------- WARC Helpers ------------------- #
+def read_warc_payload(content) -> bytes:
+    """Return the HTTP payload of the first response record in a WARC byte range (bytes or a readable buffer)."""
+    stream = content if hasattr(content, "read") else BytesIO(content)
+    for rec in ArchiveIterator(stream):
+        if rec.rec_type == "response":
+            return rec.content_stream().read()
+    return b""
+
+
+def decode_payload(payload: bytes) -> str:
+    return payload.decode("utf-8", errors="ignore") if payload else ""
+
+
+# ------------------- Range Fetcher ------------------- #
+class WarcRangeFetcher:
+    def __init__(self, base_url: str = WARC_BASE_URL, max_in_flight: int = 32, max_retries: int = 5,
+                 backoff: float = 0.5, max_backoff: float = 30.0, timeout: int = 30,
+                 cache: WarcRecordCache = None):
+        self.base_url = base_url.rstrip("/")
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.cache = cache
+
+        # One connection pool per host, sized so every worker can hold a connection.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_in_flight)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.stats = {"requests": 0, "retries": 0, "errors": 0, "bytes": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _retry_delay(self, attempt: int, response=None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+    def fetch_range(self, filename: str, offset, length) -> bytes:
+        """Fetch the raw (gzipped) WARC bytes of one record, retrying transient failures."""
+        url = f"{self.base_url}/{filename}"
+        headers = {"Range": f"bytes={int(offset)}-{int(offset) + int(length) - 1}"}
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            self._count("requests")
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    response.raise_for_status()
+                    self._count("bytes", len(response.content))
+                    return response.content
+            self._count("retries")
+            time.sleep(self._retry_delay(attempt, response))
+
+    def fetch_record(self, record) -> bytes:
+        """Return the HTTP payload for an index record, or b"" if it cannot be fetched."""
+        filename, offset, length = record.get("filename"), record.get("offset"), record.get("length")
+        if not all([filename, offset, length]):
+            return b""
+        try:
+            if self.cache is not None:
+                with self.cache.open_record(filename, offset, length) as cached:
+                    if cached is not None:
+                        return read_warc_payload(cached)
+            content = self.fetch_range(filename, offset, length)
+            if self.cache is not None:
+                self.cache.put(filename, offset, length, content)
+            return read_warc_payload(content)
+        except Exception as e:
+            self._count("errors")
+            print(f"Error reading WARC: {e}")
+        return b""
+
+    def fetch_many(self, records, ordered: bool = True):
+        """
+        Fetch payloads for many index records concurrently.
+        Yields (record, payload) pairs; in index order when ordered=True,
+        otherwise in completion order. At most max_in_flight requests run at
+        once and at most twice that many results are buffered.
+        """
+        window = self.max_in_flight * 2
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            if ordered:
+                pending = deque()
+                for rec in records:
+                    pending.append((rec, pool.submit(self.fetch_record, rec)))
+                    if len(pending) >= window:
+                        rec, future = pending.popleft()
+                        yield rec, future.result()
+                while pending:
+                    rec, future = pending.popleft()
+                    yield rec, future.result()
+            else:
+                pending = {}
+                for rec in records:
+                    pending[pool.submit(self.fetch_record, rec)] = rec
+                    if len(pending) >= window:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield pending.pop(future), future.result()
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+
+    def close(self):
+        self.session.close()
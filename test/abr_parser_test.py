@@ -0,0 +1,40 @@
+import gzip
+
+from extract.abr_parser import abr_files, parse_abr_xml
+
+
+def abr_element(i):
+    return f"""<ABR recordLastUpdatedDate="20250101" replaced="N">
+  <ABN status="ACT" ABNStatusFromDate="2000010{i % 9 + 1}">5182475355{i}</ABN>
+  <EntityType><EntityTypeInd>PRV</EntityTypeInd><EntityTypeText>Australian Private Company</EntityTypeText></EntityType>
+  <MainEntity>
+    <NonIndividualName type="MN"><NonIndividualNameText>COMPANY {i} PTY LTD</NonIndividualNameText></NonIndividualName>
+    <BusinessAddress><AddressDetails><State>NSW</State><Postcode>20{i:02d}</Postcode></AddressDetails></BusinessAddress>
+  </MainEntity>
+</ABR>"""
+
+
+def write_extract(path, count):
+    xml = "<Transfer>" + "".join(abr_element(i) for i in range(count)) + "</Transfer>"
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wb") as f:
+        f.write(xml.encode())
+
+
+def test_parse_plain_and_gzipped_files(tmp_path):
+    write_extract(tmp_path / "part1.xml", 5)
+    write_extract(tmp_path / "part2.xml.gz", 5)
+    (tmp_path / "notes.txt").write_text("not an extract")
+
+    files = abr_files(str(tmp_path))
+    assert [f.rsplit("/", 1)[-1] for f in files] == ["part1.xml", "part2.xml.gz"]
+    plain, gzipped = (list(parse_abr_xml(f)) for f in files)
+    assert plain == gzipped
+    assert plain[3] == ("51824753553", "COMPANY 3 PTY LTD", "Australian Private Company", "ACT", "NSW 2003", "2003",
+                        "NSW", "20000104")
+
+
+def test_limit(tmp_path):
+    write_extract(tmp_path / "part1.xml", 10)
+    rows = list(parse_abr_xml(str(tmp_path / "part1.xml"), limit=3))
+    assert [row[0] for row in rows] == ["51824753550", "51824753551", "51824753552"]
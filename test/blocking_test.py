@@ -0,0 +1,117 @@
+import pandas as pd
+
+from db.stage_store import ABR_CLEANED, StageStore
+from transform.blocking import PostcodeBlockIndex
+from transform.entity_matching import build_abr_index, fuzzy_match, load_name_store
+
+ABR = pd.DataFrame([
+    {"abn": "3", "entity_name": "Gamma Pty Ltd", "entity_type": "PRV", "state": "VIC", "postcode": "3000"},
+    {"abn": "2", "entity_name": "Beta Pty Ltd", "entity_type": "PRV", "state": "NSW", "postcode": "2000"},
+    {"abn": "1", "entity_name": "Alpha Pty Ltd", "entity_type": "PUB", "state": "NSW", "postcode": "2000"},
+    {"abn": "4", "entity_name": None, "entity_type": "PRV", "state": "NSW", "postcode": "2000"},
+    {"abn": "5", "entity_name": "Nowhere Pty Ltd", "entity_type": "PRV", "state": None, "postcode": None},
+    {"abn": "6", "entity_name": "Delta Pty Ltd", "entity_type": "PRV", "state": "QLD", "postcode": "4000"},
+])
+
+
+def test_blocks_are_postcode_slices_in_input_order():
+    index = PostcodeBlockIndex.from_dataframe(ABR)
+    assert len(index) == 4 and index.postcodes == ["2000", "3000", "4000"]
+    assert index.names("2000") == ["Beta Pty Ltd", "Alpha Pty Ltd"]
+    assert index.block("2000")["abn"].tolist() == ["2", "1"]
+    assert index.block("9999") is None and "9999" not in index
+    start, end = index.span("3000")
+    assert index.rows([start, 0])["abn"].tolist() == ["3", "2"]
+
+
+def test_index_from_stage_covers_crawl_postcodes_only(tmp_path):
+    store = StageStore(str(tmp_path))
+    store.replace(ABR_CLEANED, ABR, partition_cols=["state"], sort_by=["postcode"])
+    crawl = pd.DataFrame({"domain": ["alpha.com.au", "gamma.com.au", "none.com.au"],
+                          "company_name": ["Alpha Proprietary Ltd", "Gamma Pty Ltd", "Unknown"],
+                          "abn": [None, None, None], "postcode": ["2000", "3000", "5000"]})
+    index = build_abr_index(crawl, load_name_store(store=store, directory=str(tmp_path / "names")))
+    assert index.postcodes == ["2000", "3000"]
+    assert index.names("2000") == ["Alpha Pty Ltd", "Beta Pty Ltd"]  # ordered by ABN within a postcode
+
+    matches, remaining = fuzzy_match(crawl, index, threshold=60)
+    assert matches[["crawl_domain", "abr_abn", "abr_state"]].values.tolist() == [
+        ["alpha.com.au", "1", "NSW"], ["gamma.com.au", "3", "VIC"]]
+    assert remaining["domain"].tolist() == ["none.com.au"]
+
+
+def test_postcodes_block_on_their_cleaned_text(tmp_path):
+    store = StageStore(str(tmp_path))
+    abr = pd.concat([ABR, pd.DataFrame([
+        {"abn": "7", "entity_name": "Darwin Marine Pty Ltd", "entity_type": "PRV", "state": "NT", "postcode": "800"},
+        {"abn": "8", "entity_name": "Darwin Marine Pty Ltd", "entity_type": "PRV", "state": "NT", "postcode": "0800"},
+    ])], ignore_index=True)
+    store.replace(ABR_CLEANED, abr, partition_cols=["state"], sort_by=["postcode"])
+    crawl = pd.DataFrame({"domain": ["marine.com.au"], "company_name": ["Darwin Marine"], "abn": [None],
+                          "postcode": ["800"]})
+    index = build_abr_index(crawl, load_name_store(store=store, directory=str(tmp_path / "names")))
+    assert index.postcodes == ["800"]
+    matches, _ = fuzzy_match(crawl, index, threshold=60)
+    assert matches[["abr_abn", "abr_postcode"]].values.tolist() == [["7", "800"]]
+
+
+def test_name_keys_and_block_statistics():
+    from transform.blocking import name_keys, soundex
+    assert soundex(["Robert", "Rupert", "Ashcraft", "Tymczak", "Pfister", "Honeyman", "2000", None]) == [
+        "R163", "R163", "A261", "T522", "P236", "H555", "", None]
+    assert name_keys(["A.C.N. 000 018 342 Pty Limited", "ACN 000 018 342", "The Pty Ltd"]) == [
+        (("t", "000"), ("t", "018"), ("t", "342"), ("t", "A"), ("t", "C"), ("t", "N"), ("p", "A250")),
+        (("t", "000"), ("t", "018"), ("t", "342"), ("t", "ACN"), ("p", "A250")), None]
+
+    index = PostcodeBlockIndex.from_dataframe(ABR, sub_block_size=1)
+    assert index.is_oversized("2000") and not index.is_oversized("3000")
+    assert index.rows(index.candidates("2000", name_keys(["Beta Holdings"])[0]))["abn"].tolist() == ["2"]
+    assert index.candidates("2000", None).tolist() == [0, 1]
+    assert "1 blocks over 1 hold 50% of records" in index.summary()
+
+
+def test_sub_block_keys_ignore_word_order():
+    from transform.blocking import name_keys
+    abr = pd.DataFrame([{"abn": str(i), "entity_name": name, "entity_type": "PRV", "state": "NSW",
+                         "postcode": "2000"}
+                        for i, name in enumerate(["Smith Plumbing Pty Ltd", "Harbour Dental Pty Ltd",
+                                                  "Jones Electrical Pty Ltd"])])
+    index = PostcodeBlockIndex.from_dataframe(abr, sub_block_size=2)
+    assert index.is_oversized("2000")
+    keys = name_keys(["Plumbing Smith", "Dental Harbour Group", "Jones Electrical Pty Ltd"])
+    assert keys[0][:2] == (("t", "PLUMBING"), ("t", "SMITH")) and keys[0][2] != name_keys(["Smith Plumbing"])[0][2]
+    assert [index.rows(index.candidates("2000", k))["abn"].tolist() for k in keys] == [["0"], ["1"], ["2"]]
+
+
+def test_local_abn_join_matches_stage_join(tmp_path):
+    from transform.entity_matching import rule_based_match_local, rule_based_match_stage
+    store = StageStore(str(tmp_path))
+    abr = pd.concat([ABR.assign(abn=ABR["abn"].str.rjust(11, "1")),
+                     ABR.iloc[[1]].assign(abn="11111111112", entity_name="Beta Again Pty Ltd")], ignore_index=True)
+    store.replace(ABR_CLEANED, abr, partition_cols=["state"], sort_by=["postcode"])
+    crawl = pd.DataFrame({"domain": ["beta.com.au", "gamma.com.au", "beta.com.au", "none.com.au", "dup.com.au"],
+                          "company_name": ["Beta", "Gamma", "Beta", "None", "Beta"],
+                          "abn": ["11111111112 ", "11111111113", "11111111112 ", "12345678901", None],
+                          "postcode": ["2000", "3000", "2000", None, "2000"]})
+    names = load_name_store(store=store, directory=str(tmp_path / "names"))
+    local = rule_based_match_local(crawl, names)
+    stage = rule_based_match_stage(crawl, store)
+    key = ["crawl_domain", "abr_abn", "abr_company_name"]
+    assert list(local.columns) == list(stage.columns)
+    pd.testing.assert_frame_equal(local.sort_values(key, ignore_index=True), stage.sort_values(key, ignore_index=True))
+    assert len(local) == 3  # the repeated crawl row is counted once, the two ABR rows for its ABN both kept
+
+
+def test_local_abn_join_keeps_unnamed_abr_records(tmp_path):
+    from transform.entity_matching import rule_based_match_local, rule_based_match_stage
+    store = StageStore(str(tmp_path))
+    store.replace(ABR_CLEANED, ABR.assign(abn=ABR["abn"].str.rjust(11, "1")), partition_cols=["state"])
+    crawl = pd.DataFrame({"domain": ["soletrader.com.au"], "company_name": ["Jo Smith Plumbing"],
+                          "abn": ["11111111114"], "postcode": ["2000"]})
+    names = load_name_store(store=store, directory=str(tmp_path / "names"))
+    local = rule_based_match_local(crawl, names)
+    assert local[["crawl_domain", "abr_abn"]].values.tolist() == [["soletrader.com.au", "11111111114"]]
+    assert pd.isna(local["abr_company_name"].item())
+    pd.testing.assert_frame_equal(local, rule_based_match_stage(crawl, store), check_dtype=False)
+    # blocking still leaves the unnamed record out
+    assert build_abr_index(crawl, names).names("2000") == ["Alpha Pty Ltd", "Beta Pty Ltd"]
@@ -0,0 +1,96 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+import requests
+
+from extract.cdx_index import CdxIndexCache
+
+PAGE_SIZE = 25
+RECORDS = [{"url": f"https://site{i}.com.au/", "filename": "x.warc.gz", "offset": str(i), "length": "1"}
+           for i in range(110)]
+
+
+class IndexHandler(BaseHTTPRequestHandler):
+    """Minimal paginated CDX server: showNumPages plus one JSON line per capture."""
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        if "showNumPages" in params and self.server.num_pages_failures:
+            self.server.num_pages_failures -= 1
+            self.send_error(503)
+            return
+        if "showNumPages" in params:
+            pages = (len(RECORDS) + PAGE_SIZE - 1) // PAGE_SIZE
+            body = json.dumps({"pages": pages, "pageSize": 1, "blocks": pages}).encode()
+        else:
+            page = int(params["page"][0])
+            self.server.page_hits.append(page)
+            rows = RECORDS[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+            body = "".join(json.dumps(r) + "\n" for r in rows).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def index_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), IndexHandler)
+    server.page_hits, server.num_pages_failures = [], 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}/CC-TEST-index?url=*.com.au&output=json"
+    server.shutdown()
+
+
+def test_index_is_downloaded_once(index_url, tmp_path):
+    server, url = index_url
+    cache = CdxIndexCache(url, cache_dir=str(tmp_path))
+    lines = [json.loads(line) for _, line in cache.iter_lines()]
+    assert lines == RECORDS
+    assert cache.count_total() == len(RECORDS)
+
+    # A second reader of the same query never goes back to the server for pages.
+    cache = CdxIndexCache(url, cache_dir=str(tmp_path))
+    assert [json.loads(line) for _, line in cache.iter_lines()] == RECORDS
+    assert sorted(server.page_hits) == [0, 1, 2, 3, 4]
+
+
+def test_resume_from_checkpoint(index_url, tmp_path):
+    server, url = index_url
+    cache = CdxIndexCache(url, cache_dir=str(tmp_path))
+    for position, _ in cache.iter_lines():
+        if position == 60:
+            cache.save_checkpoint(position)
+            break
+
+    cache = CdxIndexCache(url, cache_dir=str(tmp_path))
+    start = cache.load_checkpoint()
+    resumed = [(position, json.loads(line)) for position, line in cache.iter_lines(start=start)]
+    assert start == 60
+    assert [record for _, record in resumed] == RECORDS[60:]
+    assert resumed[0][0] == 61
+    # Pages 0 and 1 were complete and are skipped; page 2 was cut off mid-download.
+    assert sorted(server.page_hits) == [0, 1, 2, 2, 3, 4]
+
+
+def test_page_count_errors_are_retried_not_cached(index_url, tmp_path):
+    server, url = index_url
+    server.num_pages_failures = 2
+    cache = CdxIndexCache(url, cache_dir=str(tmp_path), backoff=0)
+    assert cache.num_pages() == 5
+
+    server.num_pages_failures = 10
+    cache = CdxIndexCache(url, cache_dir=str(tmp_path / "failing"), max_retries=2, backoff=0)
+    with pytest.raises(requests.HTTPError):
+        cache.num_pages()
+    # nothing was recorded, so the next run asks again instead of reading one unpaginated page
+    server.num_pages_failures = 0
+    cache = CdxIndexCache(url, cache_dir=str(tmp_path / "failing"))
+    assert cache.manifest["pages"] is None
+    assert [json.loads(line) for _, line in cache.iter_lines()] == RECORDS
@@ -0,0 +1,70 @@
+import os
+import struct
+from datetime import date, datetime
+
+import pandas as pd
+import psycopg2
+import pytest
+
+from db.copy_loader import BINARY_ENCODERS, _binary_chunks, dataframe_rows, replace_table, text_value
+
+
+def test_text_values():
+    assert text_value(None) == "\\N"
+    assert text_value(float("nan")) == "\\N"
+    assert text_value(pd.NaT) == "\\N"
+    assert text_value("a\tb\\c\nd\x00") == "a\\tb\\\\c\\nd"
+    assert text_value(True) == "t"
+    assert text_value(date(2020, 1, 2)) == "2020-01-02"
+    assert text_value(["x", 'y"z', None]) == '{"x","y\\\\"z",NULL}'
+    assert text_value({"k": 1}) == '{"k": 1}'
+
+
+def test_binary_framing():
+    encoders = [BINARY_ENCODERS["integer"], BINARY_ENCODERS["text"]]
+    data = b"".join(_binary_chunks([(1, "ab"), (None, "c")], encoders, [0]))
+    assert data.startswith(b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0))
+    body = data[19:]
+    assert body == (struct.pack("!hi", 2, 4) + struct.pack("!i", 1) + struct.pack("!i", 2) + b"ab"
+                    + struct.pack("!hi", 2, -1) + struct.pack("!i", 1) + b"c" + struct.pack("!h", -1))
+
+
+def test_dataframe_rows():
+    df = pd.DataFrame({"a": [1, 2], "b": ["x", "y"], "c": [0.5, 1.5]})
+    assert list(dataframe_rows(df, ["b", "a"])) == [("x", 1), ("y", 2)]
+
+
+def test_nullable_dtypes_encode_missing_as_null():
+    df = pd.DataFrame({"n": pd.array([1, None], dtype="Int64"), "s": pd.array(["x", None], dtype="string"),
+                       "t": pd.to_datetime(["2020-01-02", None]), "f": [0.5, None]})
+    rows = list(dataframe_rows(df))
+    assert [[text_value(value) for value in row] for row in rows] == [
+        ["1", "x", "2020-01-02T00:00:00", "0.5"], ["\\N", "\\N", "\\N", "\\N"]]
+    assert text_value(["x", pd.NA, None]) == '{"x",NULL,NULL}'
+    data = b"".join(_binary_chunks([(pd.NA, pd.NA)], [BINARY_ENCODERS["integer"], BINARY_ENCODERS["text"]], [0]))
+    assert data[19:] == struct.pack("!hii", 2, -1, -1) + struct.pack("!h", -1)
+
+
+@pytest.mark.skipif(not os.getenv("DB_HOST"), reason="needs a Postgres database (DB_* environment variables)")
+@pytest.mark.parametrize("binary", [False, True])
+def test_replace_table_round_trip(binary):
+    conn = psycopg2.connect(host=os.getenv("DB_HOST"), port=int(os.getenv("DB_PORT", 5432)),
+                            dbname=os.getenv("DB_NAME"), user=os.getenv("DB_USER"), password=os.getenv("DB_PASSWORD"))
+    create_sql = """CREATE TABLE {table} (id SERIAL PRIMARY KEY, name TEXT, n BIGINT, d DATE, ts TIMESTAMP,
+                    data JSONB, emails TEXT[])"""
+    columns = ["name", "n", "d", "ts", "data", "emails"]
+    rows = [("a\tb\n\\c", 2 ** 40, date(2020, 1, 2), datetime(2020, 1, 2, 3, 4, 5), '{"k": [1]}', ["x", 'y"z', None]),
+            (None, None, None, None, None, [])]
+    try:
+        for _ in range(2):
+            assert replace_table(conn, "copy_loader_test", columns, iter(rows), create_sql, binary=binary) == 2
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT {', '.join(columns)} FROM copy_loader_test ORDER BY id")
+            loaded = cursor.fetchall()
+        assert loaded == [(rows[0][0], 2 ** 40, date(2020, 1, 2), datetime(2020, 1, 2, 3, 4, 5), {"k": [1]},
+                           ["x", 'y"z', None]), rows[1]]
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS copy_loader_test")
+        conn.commit()
+        conn.close()
@@ -0,0 +1,95 @@
+"""
+Benchmark the vectorised cleaning in transform/data_cleaning.py against the
+per-value Series.apply path it replaced.
+
+Usage:
+    python test/data_cleaning_bench.py [--rows N] [--repeat N]
+
+Cleans a synthetic ABR-style frame (names, ABNs, postcodes and state
+spellings with the usual noise) both ways, reports rows/s per step and the
+speed-up, and checks that both paths produce the same frame.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from transform.data_cleaning import (clean_abn, clean_abns, clean_company_name, clean_company_names,  # noqa: E402
+                                     clean_postcode, clean_postcodes, jsonify_frame, safe_jsonify, standardize_state,
+                                     standardize_states)
+
+STATES = ["NSW", "nsw", "N.S.W.", "New South Wales", "VIC", "Victoria", "QLD", "Queensland", "S.A.", "WA",
+          "Western Australia", "TAS", "ACT", "NT", "Northern Territory", None]
+WORDS = "acme widgets solutions services sydney melbourne quality trusted family holdings".split()
+SUFFIXES = ["PTY LTD", "PTY. LIMITED", "Pty Ltd", "LIMITED", "(AUST) PTY LTD", "& CO", "TRUST"]
+
+
+def synthetic_frame(rows, seed=7):
+    rng = random.Random(seed)
+    abns = [str(rng.randrange(10**10, 10**11)) for _ in range(rows)]
+    return pd.DataFrame({
+        "abn": [abn if i % 3 else f"{abn[:2]} {abn[2:5]} {abn[5:8]} {abn[8:]}" for i, abn in enumerate(abns)],
+        "entity_name": [f"{' '.join(rng.choices(WORDS, k=rng.randint(1, 4))).upper()} {rng.choice(SUFFIXES)}"
+                        for _ in range(rows)],
+        "entity_type": ["Australian Private Company"] * rows,
+        "postcode": [f"{rng.randrange(800, 7999):04d}" if i % 10 else "" for i in range(rows)],
+        "state": [rng.choice(STATES) for _ in range(rows)],
+    })
+
+
+STEPS = [
+    ("entity_name", clean_company_name, clean_company_names),
+    ("abn", clean_abn, clean_abns),
+    ("postcode", clean_postcode, clean_postcodes),
+    ("state", standardize_state, standardize_states),
+]
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.rows)
+    print(f"Frame: {len(df):,} rows")
+
+    applied, vectorised = df.copy(), df.copy()
+    totals = {"apply": 0.0, "vectorised": 0.0}
+    for column, scalar, column_fn in STEPS:
+        apply_s, applied[column] = best_of(args.repeat, lambda: df[column].apply(scalar))
+        vector_s, vectorised[column] = best_of(args.repeat, lambda: column_fn(df[column]))
+        totals["apply"] += apply_s
+        totals["vectorised"] += vector_s
+        print(f"{column:<12}: apply {len(df) / apply_s:12,.0f} rows/s   vectorised {len(df) / vector_s:12,.0f} rows/s"
+              f"  (x{apply_s / vector_s:.1f})")
+
+    apply_s, applied = best_of(args.repeat, lambda: applied.apply(lambda col: col.apply(safe_jsonify)))
+    vector_s, vectorised = best_of(args.repeat, lambda: jsonify_frame(vectorised.copy()))
+    totals["apply"] += apply_s
+    totals["vectorised"] += vector_s
+    print(f"{'jsonify':<12}: apply {len(df) / apply_s:12,.0f} rows/s   vectorised {len(df) / vector_s:12,.0f} rows/s"
+          f"  (x{apply_s / vector_s:.1f})")
+
+    print(f"{'total':<12}: apply {len(df) / totals['apply']:12,.0f} rows/s   "
+          f"vectorised {len(df) / totals['vectorised']:12,.0f} rows/s  (x{totals['apply'] / totals['vectorised']:.1f})")
+    print("Outputs identical:", applied.equals(vectorised))
+
+
+if __name__ == "__main__":
+    main()
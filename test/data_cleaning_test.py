@@ -0,0 +1,210 @@
+import os
+import datetime
+
+import pandas as pd
+import psycopg2
+import pytest
+
+from db.stage_store import ABR_CLEANED, ABR_RAW, COMMONCRAWL_CLEANED, COMMONCRAWL_RAW, StageStore
+from extract.abr_parser import abr_rows_to_table
+import transform.data_cleaning as data_cleaning
+from transform.data_cleaning import (STATE_LOOKUP, DB_CONFIG, clean_incremental, clean_abn, clean_abns, clean_abr_frame,
+                                     clean_cc_frame, clean_company_name, clean_company_names, clean_postcode,
+                                     clean_postcodes, iter_raw_chunks, jsonify_frame, run_cleaning,
+                                     run_cleaning_stream, safe_jsonify, standardize_state, standardize_states,
+                                     stream_cleaned_data)
+from transform.dedup import HashDeduplicator
+
+NAMES = ["QBE INSURANCE (INTERNATIONAL) LTD", "A.C.N. 000 018 342 PTY LIMITED", "  j & m  mfg pty ltd ",
+         "mcdonald's 3m co", "ÉCOLE Café\tPty", "!!!", "", None, "Bjelke-Petersen Bros", "abc&def x2y"]
+POSTCODES = ["2000", " 2000 ", "NSW 2141", "abc", "", None, "2٣١", "3121-"]
+ABNS = ["51824753556", "51 824 753 556", "51-824-753-556", "51 824 753　556", "51\x1c824753556",
+        "5182475355", "518247535567", "", None, "51_824_753_556"]
+STATES = ["NSW", "nsw", "N.S.W.", "New South Wales", "  victoria ", "Queenslnd", "W.A", "Unknown", "", None,
+          "NSW", "Tasmania"]
+
+
+def assert_same_as_apply(vectorised, scalar, values):
+    series = pd.Series(values, dtype=object)
+    pd.testing.assert_series_equal(vectorised(series), series.apply(scalar))
+    text = pd.Series(values)
+    pd.testing.assert_series_equal(vectorised(text), pd.Series(values, dtype=object).apply(scalar))
+
+
+def test_column_cleaners_match_scalar_functions():
+    assert_same_as_apply(clean_company_names, clean_company_name, NAMES)
+    assert_same_as_apply(clean_postcodes, clean_postcode, POSTCODES)
+    assert_same_as_apply(clean_abns, clean_abn, ABNS)
+    assert_same_as_apply(standardize_states, standardize_state, STATES)
+
+
+def test_frame_cleaners_match_apply():
+    abr = pd.DataFrame({"abn": ABNS, "entity_name": NAMES, "postcode": POSTCODES + ["2000", "2001"],
+                        "state": STATES[:10], "entity_type": ["Australian Private Company"] * 10}, dtype=object)
+    expected = abr.copy()
+    for col, clean in [("entity_name", clean_company_name), ("abn", clean_abn), ("postcode", clean_postcode),
+                       ("state", standardize_state)]:
+        expected[col] = expected[col].apply(clean)
+    pd.testing.assert_frame_equal(clean_abr_frame(abr.copy()), expected)
+
+    cc = abr.rename(columns={"entity_name": "company_name"}).drop(columns="state")
+    expected = cc.copy()
+    for col, clean in [("company_name", clean_company_name), ("abn", clean_abn), ("postcode", clean_postcode)]:
+        expected[col] = expected[col].apply(clean)
+    pd.testing.assert_frame_equal(clean_cc_frame(cc.copy()), expected)
+
+
+def test_jsonify_frame_matches_safe_jsonify():
+    df = pd.DataFrame({
+        "id": [1, 2, 3],
+        "score": [0.5, None, 1.0],
+        "name": ["a", None, "c"],
+        "names": pd.Series(["a", "b", None], dtype=object),
+        "emails": [["info@acme.com.au"], [], None],
+        "meta": [{"k": 1}, "plain", None],
+        "start_date": [datetime.date(2020, 1, 1), None, datetime.date(2021, 5, 6)],
+        "created_at": pd.to_datetime(["2025-01-01 10:00:00", "2025-01-02 00:00:00", None]),
+        "flag": [True, False, True],
+    })
+    expected = df.copy()
+    for col in expected.columns:
+        expected[col] = expected[col].apply(safe_jsonify)
+    pd.testing.assert_frame_equal(jsonify_frame(df.copy()), expected)
+
+
+def sorted_frame(df):
+    df = df[sorted(df.columns)].astype(str)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def test_stream_mode_matches_in_memory_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(STATE_LOOKUP, "cache_dir", str(tmp_path / "lookups"))
+    store = StageStore(str(tmp_path / "stages"))
+    abr_rows = [(f"51 824 753 {i % 7:03d}", f"acme {i % 5} pty ltd", "Australian Private Company", "ACT",
+                 None, f"{2000 + i % 4}", ["NSW", "Victoria", "qld", None][i % 4], "20200101") for i in range(40)]
+    store.write(ABR_RAW, abr_rows_to_table(abr_rows))
+    store.write(COMMONCRAWL_RAW, pd.DataFrame({
+        "url": [f"https://acme{i}.com.au/" for i in range(20)],
+        "company_name": [f"Acme {i % 3}" for i in range(20)],
+        "abn": ["51824753556", "51 824 753 556", None, "123"] * 5,
+        "postcode": ["2000", "NSW 2000", "", None, "3000"] * 4,
+    }))
+
+    run_cleaning(store)
+    in_memory = {stage: sorted_frame(store.read(stage)) for stage in (ABR_CLEANED, COMMONCRAWL_CLEANED)}
+    run_cleaning_stream(store, chunk_rows=7)
+    for stage, expected in in_memory.items():
+        pd.testing.assert_frame_equal(sorted_frame(store.read(stage)), expected)
+
+
+@pytest.mark.skipif(not os.getenv("DB_HOST"), reason="needs a Postgres database (DB_* environment variables)")
+def test_stream_through_server_side_cursor():
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS data_cleaning_test_raw; DROP TABLE IF EXISTS data_cleaning_test")
+            cursor.execute("CREATE TABLE data_cleaning_test_raw (company_name TEXT, abn TEXT, postcode TEXT)")
+            cursor.executemany("INSERT INTO data_cleaning_test_raw VALUES (%s, %s, %s)",
+                               [(f"acme {i % 4}", "51 824 753 556", "2000") for i in range(25)])
+        conn.commit()
+        chunks = list(iter_raw_chunks("SELECT * FROM data_cleaning_test_raw", chunk_rows=10))
+        assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+
+        dedup = HashDeduplicator(["abn", "company_name", "postcode"])
+        cleaned = (dedup.filter(clean_cc_frame(chunk)) for chunk in chunks)
+        assert stream_cleaned_data(cleaned, "data_cleaning_test") == 4
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT company_name, abn, postcode FROM data_cleaning_test ORDER BY company_name")
+            assert cursor.fetchall() == [(f"Acme {i}", "51824753556", "2000") for i in range(4)]
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS data_cleaning_test_raw; DROP TABLE IF EXISTS data_cleaning_test")
+        conn.commit()
+        conn.close()
+
+
+@pytest.mark.skipif(not os.getenv("DB_HOST"), reason="needs a Postgres database (DB_* environment variables)")
+def test_incremental_cleaning_upserts_on_natural_key(monkeypatch):
+    monkeypatch.setattr(data_cleaning, "WATERMARK_TABLE", "data_cleaning_test_watermarks")
+    tables = "data_cleaning_test_raw, data_cleaning_test, data_cleaning_test_watermarks"
+    conn = psycopg2.connect(**DB_CONFIG)
+
+    def add_raw(rows):
+        with conn.cursor() as cursor:
+            cursor.executemany("INSERT INTO data_cleaning_test_raw (domain, company_name, abn, postcode) "
+                               "VALUES (%s, %s, %s, %s)", rows)
+        conn.commit()
+
+    def run():
+        return clean_incremental("test", "data_cleaning_test_raw", clean_cc_frame, "data_cleaning_test", "domain",
+                                 chunk_rows=2)
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {tables}")
+            cursor.execute("""CREATE TABLE data_cleaning_test_raw (id SERIAL PRIMARY KEY, domain TEXT,
+                              company_name TEXT, abn TEXT, postcode TEXT, created_at TIMESTAMP DEFAULT NOW())""")
+        add_raw([("a.com.au", "acme v1", "51 824 753 556", "2000"), ("b.com.au", "bravo", None, "3000"),
+                 ("c.com.au", "charlie", "123", "NSW 4000")])
+        assert run() == (3, 3, 0)
+        assert run() == (3, 3, 3)  # the safety window reads them again, to the same rows
+
+        add_raw([("a.com.au", "acme v2", "51 824 753 556", "2000"), ("d.com.au", "delta", None, "5000"),
+                 ("a.com.au", "acme v3", None, "2001")])
+        assert run() == (6, 4, 3)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT domain, company_name, abn, postcode FROM data_cleaning_test ORDER BY domain")
+            # the latest a.com.au page has no ABN: the one an earlier page gave is kept
+            assert cursor.fetchall() == [("a.com.au", "Acme V3", "51824753556", "2001"),
+                                         ("b.com.au", "Bravo", None, "3000"), ("c.com.au", "Charlie", None, "4000"),
+                                         ("d.com.au", "Delta", None, "5000")]
+            cursor.execute("SELECT last_id, rows_cleaned FROM data_cleaning_test_watermarks WHERE source = 'test'")
+            assert cursor.fetchone() == (6, 6)
+
+            # a row that committed late, stamped before the watermark, is still cleaned
+            cursor.execute("INSERT INTO data_cleaning_test_raw (domain, company_name, abn, postcode, created_at) "
+                           "SELECT 'e.com.au', 'echo', '51 824 753 556', '6000', MIN(created_at) "
+                           "FROM data_cleaning_test_raw")
+        conn.commit()
+        assert run() == (7, 5, 4)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT company_name, abn FROM data_cleaning_test WHERE domain = 'e.com.au'")
+            assert cursor.fetchall() == [("Echo", "51824753556")]
+            cursor.execute("SELECT last_id FROM data_cleaning_test_watermarks WHERE source = 'test'")
+            assert cursor.fetchone() == (6,)
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {tables}")
+        conn.commit()
+        conn.close()
+
+
+@pytest.mark.skipif(not os.getenv("DB_HOST"), reason="needs a Postgres database (DB_* environment variables)")
+def test_incremental_abr_upsert_keeps_the_full_mode_dedup_rows(monkeypatch):
+    monkeypatch.setattr(data_cleaning, "WATERMARK_TABLE", "data_cleaning_test_watermarks")
+    tables = "data_cleaning_test_raw, data_cleaning_test, data_cleaning_test_watermarks"
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {tables}")
+            cursor.execute("""CREATE TABLE data_cleaning_test_raw (id SERIAL PRIMARY KEY, abn TEXT, entity_name TEXT,
+                              entity_type TEXT, state TEXT, postcode TEXT, created_at TIMESTAMP DEFAULT NOW())""")
+            cursor.executemany("INSERT INTO data_cleaning_test_raw (abn, entity_name, entity_type, state, postcode) "
+                               "VALUES (%s, %s, %s, %s, %s)",
+                               [("51824753556", "acme", "PRV", "NSW", None),
+                                ("51824753556", "acme trading", None, "NSW", None),
+                                ("51824753556", "acme", None, "New South Wales", None)])
+        conn.commit()
+        assert clean_incremental("test", "data_cleaning_test_raw", clean_abr_frame, "data_cleaning_test",
+                                 data_cleaning.ABR_DEDUP_COLUMNS) == (3, 2, 0)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT entity_name, entity_type, state, postcode FROM data_cleaning_test "
+                           "ORDER BY entity_name")
+            assert cursor.fetchall() == [("Acme", "PRV", "NSW", None), ("Acme Trading", None, "NSW", None)]
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {tables}")
+        conn.commit()
+        conn.close()
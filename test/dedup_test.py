@@ -0,0 +1,51 @@
+import os
+import random
+
+import pandas as pd
+import pytest
+
+from transform.data_cleaning import ABR_DEDUP_COLUMNS, CC_DEDUP_COLUMNS
+from transform.dedup import HashDeduplicator
+
+
+def synthetic_rows(n, seed=3):
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "abn": [rng.choice([f"5182475{rng.randrange(1000):04d}", None]) for _ in range(n)],
+        "entity_name": [f"Acme {rng.randrange(50)}" for _ in range(n)],
+        "company_name": [rng.choice([f"Acme {rng.randrange(50)}", None]) for _ in range(n)],
+        "state": [rng.choice(["NSW", "VIC", None]) for _ in range(n)],
+        "postcode": [rng.choice(["2000", "3000", "4000", None]) for _ in range(n)],
+        "row": range(n),
+    })
+
+
+def dedup_in_chunks(dedup, df, chunk_rows):
+    return pd.concat([dedup.filter(df.iloc[i:i + chunk_rows]) for i in range(0, len(df), chunk_rows)])
+
+
+@pytest.mark.parametrize("subset", [ABR_DEDUP_COLUMNS, CC_DEDUP_COLUMNS])
+def test_matches_drop_duplicates_in_memory(subset):
+    df = synthetic_rows(5_000)
+    with HashDeduplicator(subset) as dedup:
+        pd.testing.assert_frame_equal(dedup_in_chunks(dedup, df, 700), df.drop_duplicates(subset=subset))
+    assert dedup.stats["spills"] == 0
+
+
+@pytest.mark.parametrize("subset", [ABR_DEDUP_COLUMNS, CC_DEDUP_COLUMNS])
+def test_matches_drop_duplicates_when_spilling(tmp_path, subset):
+    df = synthetic_rows(20_000)
+    with HashDeduplicator(subset, memory_bytes=4_000, spill_dir=str(tmp_path), partitions=8, max_runs=3) as dedup:
+        pd.testing.assert_frame_equal(dedup_in_chunks(dedup, df, 300), df.drop_duplicates(subset=subset))
+        assert dedup.stats["spills"] > 3 and dedup.stats["merges"] > 0
+        assert dedup.memory_used() <= 4_000
+        assert all(len(runs) <= 3 for runs in dedup._runs)
+    assert os.listdir(tmp_path) == []
+
+
+def test_single_partition_and_validation(tmp_path):
+    df = synthetic_rows(3_000)
+    with HashDeduplicator(["abn"], memory_bytes=800, spill_dir=str(tmp_path), partitions=1) as dedup:
+        pd.testing.assert_frame_equal(dedup_in_chunks(dedup, df, 250), df.drop_duplicates(subset=["abn"]))
+    with pytest.raises(ValueError):
+        HashDeduplicator(["abn"], partitions=48)
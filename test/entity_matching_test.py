@@ -1,4 +1,5 @@
 import pandas as pd
+import pytest
 import random
 import re
 from fuzzywuzzy import fuzz
@@ -91,3 +92,112 @@ synthetic_df = pd.DataFrame(rows)
 pd.set_option("display.max_columns", None)
 pd.set_option("display.width", 200)
 print(synthetic_df)
+
+
+# ---------------- fuzzy_match ---------------- #
+from rapidfuzz import process as rf_process, fuzz as rf_fuzz  # noqa: E402
+
+from transform.entity_matching import fuzzy_match  # noqa: E402
+
+
+def reference_fuzzy_match(crawl_df, abr_df, threshold=80):
+    """fuzzy_match as it was written: one extractOne per crawl row."""
+    results = []
+    abr_grouped = abr_df.groupby("postcode")
+    for _, crawl_row in crawl_df.iterrows():
+        postcode = crawl_row["postcode"]
+        if postcode not in abr_grouped.groups:
+            continue
+        abr_subset = abr_grouped.get_group(postcode)
+        match_name, score, abr_idx = rf_process.extractOne(
+            crawl_row["company_name"], abr_subset["entity_name"].tolist(), scorer=rf_fuzz.token_sort_ratio
+        )
+        if score >= threshold:
+            abr_row = abr_subset.iloc[abr_idx]
+            results.append({
+                "crawl_domain": crawl_row["domain"],
+                "crawl_company_name": crawl_row["company_name"],
+                "crawl_abn": crawl_row["abn"],
+                "abr_abn": abr_row["abn"],
+                "abr_company_name": abr_row["entity_name"],
+                "abr_entity_type": abr_row["entity_type"],
+                "abr_state": abr_row["state"],
+                "abr_postcode": abr_row["postcode"],
+                "match_method": "fuzzy",
+                "match_score": score,
+                "match_confidence": "high" if score >= 92 else "medium"
+            })
+    fuzzy_df = pd.DataFrame(results)
+    matched_domains = fuzzy_df["crawl_domain"].tolist() if not fuzzy_df.empty else []
+    return fuzzy_df, crawl_df[~crawl_df["domain"].isin(matched_domains)].copy()
+
+
+def matching_inputs():
+    crawl_df = synthetic_df[["domain", "variant_company_name", "abn", "postcode"]].rename(
+        columns={"variant_company_name": "company_name"})
+    extra_crawl = pd.DataFrame([
+        {"domain": "nopostcode.com", "company_name": "TOOHEYS PTY LIMITED", "abn": None, "postcode": None},
+        {"domain": "elsewhere.com", "company_name": "TOOHEYS PTY LIMITED", "abn": None, "postcode": "9999"},
+        {"domain": "tie.com", "company_name": "Twin Holdings Pty Ltd", "abn": None, "postcode": "2000"},
+    ])
+    twins = pd.DataFrame([
+        {"abn": "22000000001", "entity_name": "TWIN HOLDINGS PTY LTD", "entity_type": "Australian Private Company",
+         "state": "NSW", "postcode": "2000"},
+        {"abn": "22000000002", "entity_name": "TWIN HOLDINGS PTY LTD", "entity_type": "Australian Private Company",
+         "state": "NSW", "postcode": "2000"},
+    ])
+    crawl_df = pd.concat([crawl_df, extra_crawl], ignore_index=True)
+    crawl_df["company_name"] = crawl_df["company_name"].str.upper()
+    return crawl_df.set_index(crawl_df.index * 3), pd.concat([abr_data, twins], ignore_index=True)
+
+
+@pytest.mark.parametrize("threshold", [80, 60, 95])
+def test_fuzzy_match_matches_per_row_extract_one(threshold):
+    crawl_df, abr_df = matching_inputs()
+    expected, expected_remaining = reference_fuzzy_match(crawl_df, abr_df, threshold)
+    matches, remaining = fuzzy_match(crawl_df, abr_df, threshold)
+    pd.testing.assert_frame_equal(matches, expected)
+    pd.testing.assert_frame_equal(remaining, expected_remaining)
+    assert matches[matches["crawl_domain"] == "tie.com"]["abr_abn"].tolist() == ["22000000001"]
+
+
+def test_fuzzy_match_skips_unnamed_records_and_splits_large_blocks(monkeypatch):
+    import transform.entity_matching as entity_matching
+    crawl_df, abr_df = matching_inputs()
+    expected, _ = reference_fuzzy_match(crawl_df, abr_df)
+    monkeypatch.setattr(entity_matching, "FUZZY_BLOCK_CELLS", 3)
+    abr_df = pd.concat([abr_df, pd.DataFrame([{"abn": "33000000003", "entity_name": None, "postcode": "2000"}])],
+                       ignore_index=True)
+    crawl_df = pd.concat([crawl_df, pd.DataFrame([{"domain": "unnamed.com", "company_name": None,
+                                                   "postcode": "2000"}])])
+    matches, remaining = fuzzy_match(crawl_df, abr_df)
+    pd.testing.assert_frame_equal(matches, expected)
+    assert "unnamed.com" in remaining["domain"].tolist()
+
+
+NOISE_WORDS = ("HARBOUR CITY GLOBAL PACIFIC CAPITAL PARTNERS CONSULTING DIGITAL SOLUTIONS PROPERTY GROUP "
+               "MEDICAL LEGAL RETAIL FOODS TRANSPORT ENERGY BUILDING DESIGN STUDIO").split()
+
+
+@pytest.mark.parametrize("threshold", [80, 60, 95])
+def test_sub_blocking_keeps_recall_on_synthetic_set(threshold):
+    from transform.blocking import PostcodeBlockIndex
+    crawl_df, abr_df = matching_inputs()
+    rng = random.Random(threshold)
+    noise = pd.DataFrame({
+        "abn": [f"44{i:09d}" for i in range(2000)],
+        "entity_name": [" ".join(rng.sample(NOISE_WORDS, rng.randint(1, 3))) + " PTY LTD" for _ in range(2000)],
+        "entity_type": "Australian Private Company", "state": "NSW", "postcode": "2000",
+    })
+    abr_df = pd.concat([abr_df, noise], ignore_index=True)
+    expected, expected_remaining = fuzzy_match(
+        crawl_df, PostcodeBlockIndex.from_dataframe(abr_df, sub_block_size=len(abr_df)), threshold)
+
+    index = PostcodeBlockIndex.from_dataframe(abr_df, sub_block_size=0)  # split every block
+    matches, remaining = fuzzy_match(crawl_df, index, threshold)
+    pairs = set(zip(matches["crawl_domain"], matches["abr_abn"]))
+    recall = sum(pair in pairs for pair in zip(expected["crawl_domain"], expected["abr_abn"])) / len(expected)
+    assert recall == 1.0
+    pd.testing.assert_frame_equal(matches, expected)
+    pd.testing.assert_frame_equal(remaining, expected_remaining)
+    assert index.stats["comparisons"] * 10 < index.stats["full_comparisons"]
@@ -0,0 +1,66 @@
+from extract.frontier import DomainFrontier, page_priority, site_key
+
+
+def test_pages_ordered_by_likely_value():
+    urls = ["https://acme.com.au/blog/2024/05/some-article", "https://acme.com.au/terms",
+            "https://acme.com.au/about-us", "https://acme.com.au/products?id=3", "https://acme.com.au/contact",
+            "https://www.acme.com.au/", "https://acme.com.au/products"]
+    assert sorted(urls, key=page_priority) == [
+        "https://www.acme.com.au/", "https://acme.com.au/contact", "https://acme.com.au/about-us",
+        "https://acme.com.au/terms", "https://acme.com.au/products", "https://acme.com.au/products?id=3",
+        "https://acme.com.au/blog/2024/05/some-article"]
+
+
+def test_site_key():
+    assert site_key({"urlkey": "au,com,acme)/contact", "url": "https://www.acme.com.au/contact"}) == "au,com,acme"
+    assert site_key({"url": "https://www.acme.com.au/contact"}) == "acme.com.au"
+
+
+def make_site(site, pages):
+    return [{"urlkey": f"au,com,{site})/{page}", "url": f"https://{site}.com.au/{page}"} for page in pages]
+
+
+def fake_fetch_and_parse(contents, fetched):
+    def fetch_and_parse(records):
+        for record in records:
+            fetched.append(record["url"])
+            yield {"url": record["url"], **contents.get(record["url"], {})}
+    return fetch_and_parse
+
+
+def test_stops_site_once_abn_and_contact_found():
+    records = make_site("acme", ["blog/a", "blog/b", "", "contact", "about", "terms"])
+    contents = {"https://acme.com.au/": {"abn": "51824753556"},
+                "https://acme.com.au/contact": {"emails": ["info@acme.com.au"]}}
+    fetched = []
+    frontier = DomainFrontier(budget=8, pages_per_wave=1)
+    pages = list(frontier.crawl(records, fake_fetch_and_parse(contents, fetched)))
+    assert fetched == ["https://acme.com.au/", "https://acme.com.au/contact"]
+    assert [page["url"] for page in pages] == fetched
+    assert frontier.stats["sites_complete"] == 1 and frontier.stats["pages_skipped"] == 4
+
+
+def test_budget_limits_pages_per_site_and_waves_span_sites():
+    records = make_site("acme", [f"p{i}" for i in range(10)]) + make_site("widgets", ["", "contact"])
+    fetched = []
+    frontier = DomainFrontier(budget=3, pages_per_wave=2)
+    list(frontier.crawl(records, fake_fetch_and_parse({}, fetched)))
+    assert fetched[:4] == ["https://acme.com.au/p0", "https://acme.com.au/p1",
+                           "https://widgets.com.au/", "https://widgets.com.au/contact"]
+    assert fetched[4:] == ["https://acme.com.au/p2"]
+    assert frontier.stats == {"sites": 2, "sites_complete": 0, "pages_fetched": 5, "pages_skipped": 7, "waves": 2}
+
+
+def test_site_split_across_batches_keeps_its_budget_and_findings():
+    contents = {"https://widgets.com.au/": {"abn": "51824753556", "phones": ["0412 345 678"]}}
+    fetched = []
+    frontier = DomainFrontier(budget=3, pages_per_wave=1)
+    list(frontier.crawl(make_site("acme", ["blog/a", "blog/b"]), fake_fetch_and_parse({}, fetched)))
+    list(frontier.crawl(make_site("acme", ["", "contact", "about"]) + make_site("widgets", [""]),
+                        fake_fetch_and_parse(contents, fetched)))
+    assert fetched == ["https://acme.com.au/blog/a", "https://acme.com.au/blog/b", "https://acme.com.au/",
+                       "https://widgets.com.au/"]
+    assert frontier.stats["sites"] == 2 and frontier.stats["pages_skipped"] == 2
+
+    list(frontier.crawl(make_site("widgets", ["contact"]), fake_fetch_and_parse(contents, fetched)))
+    assert fetched[4:] == []  # widgets was complete after the previous batch
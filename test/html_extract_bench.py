@@ -0,0 +1,93 @@
+"""
+Benchmark the HTML extraction backends used by CommonCrawlScraper.parse_html.
+
+Usage:
+    python test/html_extract_bench.py [PAGES_DIR] [--repeat N]
+
+PAGES_DIR holds saved pages (*.html / *.htm, e.g. dumped from fetch_html).
+Without it, a synthetic corpus of business-style pages is generated.
+Reports pages/s and MB/s per backend, the speed-up over "bs4", and how often
+each backend's parse_html record matches the bs4 record field by field.
+"""
+
+import os
+import sys
+import time
+import glob
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from extract.commoncrawl_scraper import CommonCrawlScraper  # noqa: E402
+
+
+def load_corpus(pages_dir):
+    paths = sorted(glob.glob(os.path.join(pages_dir, "*.htm*")))
+    corpus = []
+    for path in paths:
+        with open(path, "rb") as f:
+            corpus.append((f"https://{os.path.basename(path)}.com.au/", f.read().decode("utf-8", errors="ignore")))
+    return corpus
+
+
+def synthetic_corpus(n=300, seed=7):
+    rng = random.Random(seed)
+    words = "acme widgets solutions services sydney melbourne quality trusted family owned since".split()
+    corpus = []
+    for i in range(n):
+        paragraphs = "".join(
+            f"<p class='c{j}'>{' '.join(rng.choices(words, k=40))} <a href='/p{j}'>more</a></p>"
+            for j in range(rng.randint(20, 200))
+        )
+        html = f"""<!DOCTYPE html><html><head><title>Company {i} | Home</title>
+            <style>body {{ font-family: sans-serif; }}</style>
+            <script>window.dataLayer = [{{"page": {i}}}];</script>
+            <script type="application/ld+json">{{"@type": "Organization", "name": "Company {i}"}}</script>
+            </head><body><nav><ul><li>Home</li><li>About</li><li>Contact</li></ul></nav>{paragraphs}
+            <footer>ABN 51 824 753 556 | info@company{i}.com.au | (02) 9876 5432 | Sydney NSW 2000</footer>
+            </body></html>"""
+        corpus.append((f"https://company{i}.com.au/", html))
+    return corpus
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pages_dir", nargs="?")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.pages_dir) if args.pages_dir else synthetic_corpus()
+    total_mb = sum(len(html) for _, html in corpus) / 1e6
+    print(f"Corpus: {len(corpus)} pages, {total_mb:.1f} MB")
+
+    results, timings = {}, {}
+    for backend in ("bs4", "lxml"):
+        scraper = CommonCrawlScraper("unused", html_backend=backend)
+        timings[backend, "extract"], _ = best_of(
+            args.repeat, lambda: [scraper.extract_html(html) for _, html in corpus])
+        timings[backend, "parse_html"], results[backend] = best_of(
+            args.repeat, lambda: [scraper.parse_html(html, url) for url, html in corpus])
+
+    for (backend, stage), seconds in timings.items():
+        speedup = timings["bs4", stage] / seconds
+        print(f"{backend:>5} {stage:<10}: {seconds:7.3f}s  {len(corpus) / seconds:8.1f} pages/s"
+              f"  {total_mb / seconds:6.1f} MB/s  (x{speedup:.1f} vs bs4)")
+
+    fields = results["bs4"][0].keys() if corpus else []
+    for field in fields:
+        same = sum(a[field] == b[field] for a, b in zip(results["bs4"], results["lxml"]))
+        print(f"  {field:<16} identical in {same}/{len(corpus)} pages")
+
+
+if __name__ == "__main__":
+    main()
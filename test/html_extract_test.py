@@ -0,0 +1,38 @@
+import pytest
+
+from extract.html_extract import extract_bs4, extract_lxml, get_backend
+
+PAGES = [
+    """<html><head><title> Acme &amp; Co | Home </title><style>.a { color: red }</style>
+       <script type="application/ld+json">{"@type": "Organization", "name": "Acme"}</script></head>
+       <body><!-- nav --><p>Welcome to <b>Acme</b></p><script>var x = 1;</script>
+       <noscript>Enable JS</noscript><footer>ABN 51 824 753 556 &amp; info@acme.com.au</footer></body></html>""",
+    """<html><body><h1>No title</h1><script type="application/ld+json">[{"a": 1}, {"b": 2}]</script>
+       <script type="application/ld+json">not json</script><table><tr><td>a</td><td>b</td></tr></table>""",
+    "<p>unclosed <div>markup<span>everywhere",
+    "plain text without tags",
+    "",
+]
+
+
+@pytest.mark.parametrize("html", PAGES)
+def test_lxml_matches_bs4(html):
+    assert extract_lxml(html) == extract_bs4(html)
+
+
+@pytest.mark.parametrize("html", PAGES)
+def test_streaming_mode_matches_single_feed(html):
+    assert extract_lxml(html, chunk_size=16) == extract_lxml(html)
+
+
+def test_text_cap_and_max_chars():
+    html = "<title>T</title><p>" + "word " * 1000 + "</p>"
+    _, text, _ = extract_lxml(html, text_cap=100)
+    assert len(text) <= 100
+    _, text, _ = extract_lxml(html, max_chars=50)
+    assert text.startswith("Tword word") and len(text) < 50
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_backend("regex")
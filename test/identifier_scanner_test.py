@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from extract.commoncrawl_scraper import extract_emails, extract_phone, validate_abn
+from extract.identifier_scanner import SCANNER, validate_abns
+
+TEXTS = [
+    "Contact us: info@acme.com.au or sales@acme.net. Call (02) 9876 5432 or 0412 345 678. "
+    "Acme Pty Ltd ABN: 51 824 753 556. Level 3, 1 Martin Place Sydney NSW 2000",
+    "abn 53 004 085 616 | PO Box 100 Darwin NT 0800 | +61 3 9876 5432",
+    "ABN 12 345 678 901 (not valid) but 51 824 753 556 is. Brisbane QLD 4000",
+    "Nothing to see here",
+    "",
+]
+
+
+EXPECTED = [
+    # the helpers took "9876" from the phone number as the postcode
+    {"abn": "51824753556", "emails": ["info@acme.com.au", "sales@acme.net"],
+     "phones": ["(02) 9876 5432", "0412 345 678"], "postcode": "2000"},
+    {"abn": "53004085616", "emails": [], "phones": [], "postcode": "0800"},
+    # the helpers stopped at the invalid labelled ABN
+    {"abn": "51824753556", "emails": [], "phones": [], "postcode": "4000"},
+    {"abn": None, "emails": [], "phones": [], "postcode": None},
+    {"abn": None, "emails": [], "phones": [], "postcode": None},
+]
+
+
+@pytest.mark.parametrize("text, expected", list(zip(TEXTS, EXPECTED)))
+def test_scanner_finds_every_identifier(text, expected):
+    assert SCANNER.scan(text) == expected
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_scanner_agrees_with_single_identifier_helpers(text):
+    found = SCANNER.scan(text)
+    assert found["emails"] == extract_emails(text)
+    assert found["phones"] == extract_phone(text)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("ABN 51 824 753 556 0412 345 678",
+     {"abn": "51824753556", "emails": [], "phones": ["0412 345 678"], "postcode": None}),
+    ("ABN: 51 824 753 556 2000 Sydney", {"abn": "51824753556", "emails": [], "phones": [], "postcode": "2000"}),
+    ("ABN 12 345 678 901 51 824 753 556", {"abn": "51824753556", "emails": [], "phones": [], "postcode": None}),
+    # twelve digits are no ABN, labelled or not
+    ("ABN 51 824 753 5560 Sydney", {"abn": None, "emails": [], "phones": [], "postcode": "5560"}),
+])
+def test_digits_after_a_labelled_abn_are_scanned(text, expected):
+    assert SCANNER.scan(text) == expected
+
+
+def test_each_span_has_one_kind():
+    found = SCANNER.scan("Call (02) 9876 5432, ABN 51824753556, sales@2000.com.au, Sydney 2000")
+    assert found["phones"] == ["(02) 9876 5432"]
+    assert found["abn"] == "51824753556"
+    assert found["emails"] == ["sales@2000.com.au"]
+    assert found["postcode"] == "2000"
+
+
+def test_scan_many_matches_scan():
+    assert SCANNER.scan_many(TEXTS) == [SCANNER.scan(text) for text in TEXTS]
+
+
+def test_batched_checksum_matches_validate_abn():
+    rng = random.Random(0)
+    candidates = ["51824753556", "53004085616", "12345678901", "5182475355", "abc", ""]
+    candidates += ["".join(rng.choices("0123456789", k=11)) for _ in range(2000)]
+    assert validate_abns(candidates).tolist() == [validate_abn(abn) for abn in candidates]
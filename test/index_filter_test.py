@@ -0,0 +1,96 @@
+import json
+
+from extract.commoncrawl_scraper import CommonCrawlScraper
+from extract.index_filter import IndexFilter
+
+
+def capture(urlkey, timestamp, status="200", mime="text/html", length="1000", digest=None, languages="eng"):
+    return {"urlkey": urlkey, "timestamp": timestamp, "url": f"https://{urlkey}", "status": status, "mime": mime,
+            "mime-detected": mime, "length": length, "digest": digest or f"{urlkey}-{timestamp}",
+            "languages": languages}
+
+
+RECORDS = [
+    capture("au,com,acme)/", "20250301"),
+    capture("au,com,acme)/", "20250315"),
+    capture("au,com,acme)/about", "20250301", status="301"),
+    capture("au,com,acme)/logo.png", "20250301", mime="image/png"),
+    capture("au,com,acme)/report.pdf", "20250301", mime="text/html", length="50000000"),
+    capture("au,com,acme)/fr", "20250301", languages="fra"),
+    capture("au,com,www-acme)/", "20250301", digest="au,com,acme)/-20250315"),
+    capture("au,com,widgets)/", "20250302"),
+]
+
+
+def test_filter_rules_and_stats():
+    index_filter = IndexFilter(languages=["eng"])
+    kept = index_filter.claim(index_filter.apply(RECORDS))
+    assert [(r["urlkey"], r["timestamp"]) for r in kept] == [("au,com,acme)/", "20250315"),
+                                                              ("au,com,widgets)/", "20250302")]
+    stats = index_filter.stats
+    assert (stats["status"], stats["mime"], stats["length"], stats["language"]) == (1, 1, 1, 1)
+    assert (stats["older_capture"], stats["duplicate_digest"]) == (1, 1)
+    assert stats["records"] - stats["kept"] == 6
+    assert stats["bytes_avoided"] == 5 * 1000 + 50000000
+
+
+def test_digest_dedup_spans_batches():
+    index_filter = IndexFilter()
+    assert len(index_filter.claim(index_filter.apply(RECORDS[:2]))) == 1
+    assert index_filter.apply([RECORDS[6]]) == []
+
+
+def test_only_fetched_digests_count():
+    index_filter = IndexFilter(max_digests=2)
+    # acme's homepage passes the filter but is never fetched (say the frontier stopped the site)
+    assert len(index_filter.apply(RECORDS[:2])) == 1
+    assert index_filter.claim(index_filter.apply([RECORDS[6]])) == [RECORDS[6]]
+
+    # a failed fetch gives the digest back
+    index_filter.release(RECORDS[6])
+    assert index_filter.apply([RECORDS[6]]) == [RECORDS[6]]
+
+    # only the most recent max_digests digests are kept
+    others = [capture(f"au,com,site{i})/", "20250301") for i in range(3)]
+    index_filter.claim(others)
+    assert list(index_filter.fetched_digests) == [others[1]["digest"], others[2]["digest"]]
+
+
+def test_rules_can_be_switched_off():
+    index_filter = IndexFilter(statuses=None, mime_types=None, max_length=0, latest_per_url=False,
+                               dedup_digest=False)
+    assert index_filter.apply(RECORDS) == RECORDS
+
+
+class ListIndex:
+    def __init__(self, records):
+        self.lines = [json.dumps(r).encode() for r in records]
+
+    def iter_lines(self, start=0):
+        for position, line in enumerate(self.lines[start:], start=start + 1):
+            yield position, line
+
+
+def test_batches_never_split_captures_of_one_url(tmp_path):
+    records = [capture(f"au,com,site{i // 3})/", f"2025030{i % 3}") for i in range(10)]
+    scraper = CommonCrawlScraper("http://localhost/index?url=*.au&output=json", cache_dir=str(tmp_path))
+    scraper.index = ListIndex(records)
+    batches, positions = [], []
+    for batch in scraper.fetch_metadata(batch_size=2):
+        batches.append([r["urlkey"] for r in batch])
+        positions.append(scraper.index_position)
+    scraper.close()
+    assert [len(b) for b in batches] == [3, 3, 3, 1]
+    assert all(len(set(b)) == 1 for b in batches)
+    assert positions == [3, 6, 9, 10]
+
+
+def test_frontier_batches_cut_inside_a_site_only_past_max_batch_size(tmp_path):
+    records = [capture(f"au,com,acme)/p{i:02d}", "20250301") for i in range(25)]
+    records += [capture(f"au,com,widgets)/p{i}", "20250301") for i in range(3)]
+    scraper = CommonCrawlScraper("http://localhost/index?url=*.au&output=json", cache_dir=str(tmp_path))
+    scraper.index = ListIndex(records)
+    batches = [[r["urlkey"] for r in batch] for batch in scraper.fetch_metadata(batch_size=2, max_batch_size=10)]
+    scraper.close()
+    assert [len(b) for b in batches] == [10, 10, 5, 3]
+    assert batches[2][-1] == "au,com,acme)/p24" and batches[3][0] == "au,com,widgets)/p0"
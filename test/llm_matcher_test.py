@@ -0,0 +1,145 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+from openai import OpenAI
+
+from transform.entity_matching import llm_match, llm_shortlists
+from transform.llm_matcher import LLMMatcher, RateLimiter
+from transform.token_index import TokenIndex
+
+ABR = pd.DataFrame(
+    [{"abn": str(100 + i), "entity_name": f"Company {i} Pty Ltd", "entity_type": "PRV", "state": "NSW",
+      "postcode": "2000"} for i in range(40)]
+    + [{"abn": "900", "entity_name": "Harbour Bridge Dental Trust", "entity_type": "TRT", "state": "NSW",
+        "postcode": None}])
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    """
+    Stub chat-completions endpoint: picks the candidate named like the record
+    (plus " Pty Ltd" or " Trust"), except for wrong.com.au, where it names an
+    ABN that is not among the candidates.
+    """
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        records = json.loads(body["messages"][-1]["content"])["records"]
+        with server.lock:
+            server.batches.append(records)
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+        time.sleep(0.05)
+        matches = []
+        for record in records:
+            names = {c["name"]: c["abn"] for c in record["candidates"]}
+            abn = names.get(f"{record['name']} Pty Ltd") or names.get(f"{record['name']} Trust")
+            matches.append({"id": record["id"], "abn": "999" if record["domain"] == "wrong.com.au" else abn,
+                            "confidence": "high" if abn else "low"})
+        content = json.dumps({"matches": matches})
+        reply = json.dumps({
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        }).encode()
+        with server.lock:
+            server.in_flight -= 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def chat_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChatHandler)
+    server.batches, server.in_flight, server.peak, server.lock = [], 0, 0, threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def stub_client(server):
+    return OpenAI(base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", api_key="test", max_retries=0)
+
+
+def crawl_records():
+    return pd.DataFrame(
+        [{"domain": f"company{i}.com.au", "company_name": f"Company {i}", "abn": None, "postcode": "2000"}
+         for i in range(30)]
+        + [{"domain": "dental.com.au", "company_name": "Harbour Bridge Dental", "abn": None, "postcode": None},
+           {"domain": "wrong.com.au", "company_name": "Company 7", "abn": None, "postcode": "2000"},
+           {"domain": "blank.com.au", "company_name": None, "abn": None, "postcode": "2000"}])
+
+
+def test_shortlists_come_from_block_and_token_index():
+    shortlists = llm_shortlists(crawl_records(), ABR, TokenIndex.from_dataframe(ABR), k=3)
+    assert [c["abn"] for c in shortlists[4]][0] == "104" and len(shortlists[4]) == 3
+    assert [c["abn"] for c in shortlists[30]] == ["900"]  # no postcode: token index only
+    assert shortlists[32] == []
+
+
+def test_records_without_an_abn_are_never_candidates():
+    unnamed = pd.DataFrame([{"abn": None, "entity_name": "Company 4 Pty Ltd", "entity_type": "PRV", "state": "NSW",
+                             "postcode": "2000"},
+                            {"abn": None, "entity_name": "Harbour Bridge Dental Trust", "entity_type": "TRT",
+                             "state": "NSW", "postcode": None}])
+    abr = pd.concat([ABR, unnamed], ignore_index=True)
+    shortlists = llm_shortlists(crawl_records(), abr, TokenIndex.from_dataframe(abr), k=3)
+    assert all(c["abn"] is not None for shortlist in shortlists for c in shortlist)
+    assert [c["abn"] for c in shortlists[4]][0] == "104" and len(shortlists[4]) == 3
+    assert [c["abn"] for c in shortlists[30]] == ["900"]
+
+    batch = [{"candidates": [{"abn": None}, {"abn": "104"}]}, {"candidates": [{"abn": "104"}]}]
+    content = json.dumps({"matches": [{"id": 0, "abn": None, "confidence": "high"},
+                                      {"id": 1, "abn": "104", "confidence": "high"}]})
+    assert LLMMatcher.parse(content, batch) == {1: ("104", "high")}
+
+
+def test_llm_match_batches_shortlists_concurrently(chat_server):
+    matcher = LLMMatcher(stub_client(chat_server), records_per_request=8, max_in_flight=3)
+    matches, remaining = llm_match(crawl_records(), ABR, TokenIndex.from_dataframe(ABR), matcher, k=5)
+
+    assert [len(batch) for batch in chat_server.batches] == [8, 8, 8, 8]  # the unnamed record is not sent
+    assert all(len(record["candidates"]) <= 5 for batch in chat_server.batches for record in batch)
+    assert 1 < chat_server.peak <= 3
+    assert len(matches) == 31 and set(matches["match_method"]) == {"LLM"}
+    assert matches.set_index("crawl_domain").loc["dental.com.au", "abr_abn"] == "900"
+    # an ABN outside the record's shortlist is not taken
+    assert remaining["domain"].tolist() == ["wrong.com.au", "blank.com.au"]
+    assert matcher.stats["requests"] == 4 and matcher.stats["tokens"] == 480 and matcher.stats["matches"] == 31
+
+
+def test_budget_stops_sending(chat_server):
+    matcher = LLMMatcher(stub_client(chat_server), records_per_request=8, max_in_flight=1, max_requests=2)
+    matches, remaining = llm_match(crawl_records(), ABR, TokenIndex.from_dataframe(ABR), matcher)
+    assert len(chat_server.batches) == 2 and len(matches) == 16
+    assert matcher.stats["skipped"] == 16 and len(remaining) == 33 - 16
+
+
+def test_rate_limiter_waits_for_requests_and_tokens():
+    now, sleeps = [0.0], []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=1_000, clock=lambda: now[0], sleep=sleep)
+    limiter.acquire(600)
+    limiter.acquire(300)
+    assert sleeps == []
+    limiter.acquire(100)  # no request left: one refills in 30s
+    assert sleeps == [pytest.approx(30.0)]
+    limiter.correct(estimated=100, used=900)  # the last request was larger than estimated
+    limiter.acquire(500)
+    assert now[0] == pytest.approx(30.0 + 48.0)  # 800 tokens short at 1,000 a minute
@@ -0,0 +1,68 @@
+from io import BytesIO
+
+from warcio.warcwriter import WARCWriter
+from warcio.statusandheaders import StatusAndHeaders
+
+from extract.commoncrawl_scraper import CommonCrawlScraper, parse_pages
+from extract.local_warc import LocalWarcReader, host_matches
+
+PAGES = [
+    ("https://www.acme.com.au/", "200 OK", "text/html; charset=utf-8", "<title>Acme</title>ABN 51 824 753 556"),
+    ("https://example.com/", "200 OK", "text/html", "<title>Not Australian</title>"),
+    ("https://www.acme.com.au/missing", "404 Not Found", "text/html", "<title>Missing</title>"),
+    ("https://www.acme.com.au/logo.png", "200 OK", "image/png", "PNG"),
+    ("https://shop.widgets.net.au/contact", "200 OK", "text/html", "<p>sales@widgets.net.au</p>"),
+]
+
+
+def write_warc(path, pages=PAGES):
+    """Write pages (with a request record before each response) and return their CDX-style records."""
+    records = []
+    with open(path, "wb") as f:
+        writer = WARCWriter(f, gzip=True)
+        for url, status, mime, html in pages:
+            writer.write_record(writer.create_warc_record(url, "request", payload=BytesIO(b"GET / HTTP/1.1\r\n\r\n")))
+            offset = f.tell()
+            http_headers = StatusAndHeaders(status, [("Content-Type", mime)], protocol="HTTP/1.1")
+            writer.write_record(writer.create_warc_record(url, "response", payload=BytesIO(html.encode()),
+                                                          http_headers=http_headers))
+            records.append({"url": url, "filename": f"crawl-data/segments/0/warc/{path.name}",
+                            "offset": str(offset), "length": str(f.tell() - offset)})
+    return records
+
+
+def test_host_matches():
+    assert host_matches("https://www.acme.com.au/x", [".com.au"])
+    assert host_matches("http://gov.au", [".au"])
+    assert not host_matches("https://acme.com/au", [".au"])
+
+
+def test_reader_filters_by_domain_status_and_mime(tmp_path):
+    path = tmp_path / "test.warc.gz"
+    write_warc(path)
+    reader = LocalWarcReader([str(path)])
+    pages = list(reader.iter_pages())
+    assert [url for url, _ in pages] == ["https://www.acme.com.au/", "https://shop.widgets.net.au/contact"]
+    assert pages[0][1] == b"<title>Acme</title>ABN 51 824 753 556"
+    assert reader.stats["records"] == 2 * len(PAGES) and reader.stats["pages"] == 2
+
+
+def test_reader_restricted_to_index_records(tmp_path):
+    path = tmp_path / "test.warc.gz"
+    records = write_warc(path)
+    reader = LocalWarcReader([str(path)], domain_suffixes=[".com.au"], index_records=records[:3])
+    assert [url for url, _ in reader.iter_pages()] == ["https://www.acme.com.au/"]
+
+
+def test_scraper_local_mode_parses_like_parse_pages(tmp_path):
+    path = tmp_path / "test.warc.gz"
+    write_warc(path)
+    scraper = CommonCrawlScraper("http://localhost/index?url=*.au&output=json", cache_dir=str(tmp_path))
+    try:
+        records = list(scraper.iter_local_records([str(path)]))
+    finally:
+        scraper.close()
+    expected = parse_pages([(url, html) for url, status, mime, html in PAGES if url in
+                            ("https://www.acme.com.au/", "https://shop.widgets.net.au/contact")])
+    assert records == expected
+    assert records[0]["abn"] == "51824753556"
@@ -0,0 +1,71 @@
+import pandas as pd
+import pyarrow as pa
+
+from transform.blocking import ABR_BLOCK_SCHEMA, sort_tokens
+from transform.name_store import NameStore
+
+ABR = pd.DataFrame([
+    {"abn": "51824753556", "entity_name": "Widgets Acme Pty Ltd", "entity_type": "PRV", "state": "NSW", "postcode": "2000"},
+    {"abn": "11000000948", "entity_name": "Qbe Insurance Ltd", "entity_type": "PUB", "state": "NSW", "postcode": "2000"},
+    {"abn": "33102417032", "entity_name": "Top End Tours", "entity_type": "PRV", "state": "NT", "postcode": "0800"},
+    {"abn": None, "entity_name": "No Abn Trust", "entity_type": "TRT", "state": "VIC", "postcode": "3000"},
+    {"abn": "44000000001", "entity_name": "Nowhere Pty Ltd", "entity_type": "PRV", "state": None, "postcode": None},
+    {"abn": "44000000002", "entity_name": None, "entity_type": "PRV", "state": "VIC", "postcode": "3000"},
+    {"abn": "22000000003", "entity_name": "Darwin Marine", "entity_type": "PRV", "state": "NT", "postcode": "800"},
+    {"abn": "22000000004", "entity_name": "Typo Postcode", "entity_type": "PRV", "state": "NSW", "postcode": "20000"},
+])
+
+
+def build(fingerprint=""):
+    return NameStore.build(pa.Table.from_pandas(ABR, schema=ABR_BLOCK_SCHEMA, preserve_index=False), fingerprint)
+
+
+def test_sort_tokens_matches_token_sort_preprocessing():
+    names = ["Widgets Acme  Pty Ltd", " b a ", "", None]
+    assert sort_tokens(names).to_pylist() == ["Acme Ltd Pty Widgets", "a b", "", None]
+
+
+def test_compact_columns_and_blocks_decode_to_cleaned_strings():
+    names = build()
+    assert len(names) == 8  # the unnamed record is kept for the ABN join
+    assert names.table.schema.field("abn").type == pa.int64()
+    assert names.table.schema.field("postcode").type == pa.dictionary(pa.int16(), pa.string())
+    assert names.table.schema.field("state").type == pa.dictionary(pa.int8(), pa.string())
+    assert names.span("2000") == (2, 4) and names.span("9999")[0] == names.span("9999")[1]
+    assert names.span(None) == (0, 0) and names.span("20000") == (4, 5)
+    # postcodes are kept as cleaned: "800" is not "0800"
+    assert names.span("0800") == (1, 2) and names.span("800") == (7, 8)
+
+    blocks = names.blocks(["2000", "0800", "9999", None]).to_pandas()
+    assert blocks["abn"].tolist() == ["33102417032", "11000000948", "51824753556"]  # postcode, then ABN order
+    assert blocks["postcode"].tolist() == ["0800", "2000", "2000"]
+    assert blocks["sort_name"].tolist() == ["End Top Tours", "Insurance Ltd Qbe", "Acme Ltd Pty Widgets"]
+    records = names.records().to_pandas().set_index("entity_name")
+    assert pd.isna(records.loc["No Abn Trust", "abn"]) and pd.isna(records.loc["Nowhere Pty Ltd", "postcode"])
+    assert records.loc["Top End Tours", ["entity_type", "state"]].tolist() == ["PRV", "NT"]
+    assert records.loc[["Darwin Marine", "Typo Postcode"], "postcode"].tolist() == ["800", "20000"]
+    unnamed = names.records().to_pandas().query("abn == '44000000002'")
+    assert pd.isna(unnamed["entity_name"].item()) and pd.isna(unnamed["sort_name"].item())
+
+
+def test_save_and_open_memory_mapped(tmp_path):
+    names = build("v1")
+    names.save(str(tmp_path))
+    assert NameStore.open(str(tmp_path), "v2") is None
+    assert NameStore.open(str(tmp_path / "missing")) is None
+    opened = NameStore.open(str(tmp_path), "v1")
+    assert opened.fingerprint == "v1" and opened.table.equals(names.table)
+    assert opened.blocks(["2000"]).equals(names.blocks(["2000"]))
+
+
+def test_match_abns_joins_every_equal_pair():
+    names = NameStore.build(pa.Table.from_pandas(
+        pd.concat([ABR, ABR.iloc[[0]].assign(entity_name="Acme Widgets Second Record")], ignore_index=True),
+        schema=ABR_BLOCK_SCHEMA, preserve_index=False))
+    queries = [" 51824753556 ", "051824753556", "11000000948", None, "5182475355x", "99999999999", "51824753556"]
+    rows, positions = names.match_abns(queries)
+    assert rows.tolist() == [0, 0, 2, 6, 6]
+    matched = names.records(positions).to_pandas()
+    assert matched["abn"].tolist() == ["51824753556", "51824753556", "11000000948", "51824753556", "51824753556"]
+    assert sorted(matched["entity_name"][:2]) == ["Acme Widgets Second Record", "Widgets Acme Pty Ltd"]
+    assert [len(part) for part in names.match_abns([])] == [0, 0]
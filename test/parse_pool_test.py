@@ -0,0 +1,18 @@
+from extract.commoncrawl_scraper import parse_pages
+from extract.parse_pool import ParsePool
+
+PAGES = [(f"https://site{i}.com.au/",
+          f"<html><title>Site {i} Pty Ltd</title><body>ABN 51 824 753 556 Sydney NSW {2000 + i}</body></html>"
+          .encode()) for i in range(23)]
+
+
+def test_worker_processes_match_in_process_output_in_order():
+    expected = list(ParsePool(parse_pages, workers=1, chunk_size=4).map(PAGES))
+    pool = ParsePool(parse_pages, workers=2, chunk_size=3, max_pending=2)
+    try:
+        records = list(pool.map(PAGES))
+    finally:
+        pool.close()
+    assert len(expected) == len(PAGES)
+    assert records == expected
+    assert [record["url"] for record in records] == [url for url, _ in PAGES]
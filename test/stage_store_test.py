@@ -0,0 +1,55 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from db.stage_store import StageStore, StageWriter
+from extract.abr_parser import ABR_COLUMNS, abr_rows_to_table
+
+ABR = pd.DataFrame({
+    "abn": ["51824753556", "53004085616", "11000000948", "11000002568"],
+    "entity_name": ["Acme Pty Ltd", "Widgets Ltd", "Qbe Insurance", "Tooheys Pty Limited"],
+    "state": ["NSW", "VIC", "NSW", None],
+    "postcode": ["2141", "3000", "2000", "2141"],
+})
+
+
+def test_partitioned_write_with_projection_and_filter(tmp_path):
+    store = StageStore(str(tmp_path))
+    store.replace("abr_cleaned", ABR, partition_cols=["state"], sort_by=["postcode"])
+    assert sorted(p.name for p in (tmp_path / "abr_cleaned").iterdir())[:2] == ["state=NSW", "state=VIC"]
+
+    df = store.read("abr_cleaned", columns=["abn", "state"], filter=ds.field("state") == "NSW")
+    assert list(df.columns) == ["abn", "state"]
+    assert sorted(df["abn"]) == ["11000000948", "51824753556"]
+
+    df = store.read("abr_cleaned", columns=["abn"], filter=store.isin("abr_cleaned", "postcode", ["2141"]))
+    assert sorted(df["abn"]) == ["11000002568", "51824753556"]
+
+    batches = list(store.iter_batches("abr_cleaned", columns=["abn"], batch_size=1))
+    assert sum(len(batch) for batch in batches) == len(ABR)
+
+
+def test_stage_writer_flushes_parts_then_runs_callbacks(tmp_path):
+    store = StageStore(str(tmp_path))
+    schema = pa.schema([("url", pa.string()), ("emails", pa.list_(pa.string()))])
+    flushed = []
+    with StageWriter(store, "raw", ["url", "emails"], schema, to_row=lambda r: (r["url"], r["emails"]),
+                     flush_rows=2) as writer:
+        for i in range(3):
+            writer.put({"url": f"https://site{i}.com.au/", "emails": [f"info@site{i}.com.au"]})
+            writer.after_flush(lambda i=i: flushed.append(i))
+        assert flushed == [0]
+    assert flushed == [0, 1, 2]
+    assert len(list((tmp_path / "raw").iterdir())) == 2
+    df = store.read("raw").sort_values("url")
+    assert df["emails"].map(list).tolist() == [["info@site0.com.au"], ["info@site1.com.au"], ["info@site2.com.au"]]
+
+
+def test_abr_rows_keep_their_types(tmp_path):
+    rows = [("51824753556", "ACME PTY LTD", "Australian Private Company", "ACT", "NSW 2000", "2000", "NSW",
+             "19991101"),
+            ("53004085616", None, None, None, None, None, None, None)]
+    table = abr_rows_to_table(rows)
+    assert table.column_names == ABR_COLUMNS
+    assert table.schema.field("start_date").type == pa.date32()
+    assert str(table["start_date"][0]) == "1999-11-01" and table["start_date"][1].as_py() is None
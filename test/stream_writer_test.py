@@ -0,0 +1,118 @@
+import time
+import threading
+
+import pytest
+
+from extract import stream_writer
+from extract.stream_writer import StreamingPostgresWriter
+
+
+class EventLog(list):
+    pass
+
+
+class FakeConnection:
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    def commit(self):
+        self.events.append(("commit",))
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def events(monkeypatch):
+    """Log of copies, commits and callbacks; copy_rows can be held (gate) or made to fail (fail)."""
+    log = EventLog()
+    log.gate, log.fail, log.connections = threading.Event(), None, []
+    log.gate.set()
+
+    def connect(**config):
+        conn = FakeConnection(log)
+        log.connections.append(conn)
+        return conn
+
+    def copy_rows(conn, table_name, columns, rows):
+        log.gate.wait()
+        if log.fail is not None:
+            raise log.fail
+        log.append(("copy", list(rows)))
+        return len(rows)
+
+    monkeypatch.setattr(stream_writer.psycopg2, "connect", connect)
+    monkeypatch.setattr(stream_writer, "copy_rows", copy_rows)
+    return log
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_flushes_every_flush_rows(events):
+    writer = StreamingPostgresWriter({}, "t", ["a"], to_row=lambda r: (r,), flush_rows=3, flush_seconds=60)
+    for record in range(7):
+        writer.put(record)
+    writer.close()
+    assert events == [("copy", [(0,), (1,), (2,)]), ("commit",), ("copy", [(3,), (4,), (5,)]), ("commit",),
+                      ("copy", [(6,)]), ("commit",)]
+    assert writer.rows_written == 7 and events.connections[0].closed
+
+
+def test_flushes_after_flush_seconds(events):
+    writer = StreamingPostgresWriter({}, "t", ["a"], to_row=lambda r: (r,), flush_rows=1_000, flush_seconds=0.1)
+    writer.put(1)
+    writer.put(2)
+    wait_for(lambda: ("commit",) in events)  # written while the writer is still open
+    assert events == [("copy", [(1,), (2,)]), ("commit",)]
+    writer.close()
+    assert writer.rows_written == 2
+
+
+def test_after_flush_runs_once_earlier_records_are_committed(events):
+    writer = StreamingPostgresWriter({}, "t", ["a"], to_row=lambda r: (r,), flush_rows=2, flush_seconds=60)
+    writer.put("a")
+    writer.after_flush(lambda: events.append(("callback", writer.rows_written)))
+    writer.put("b")
+    writer.after_flush(lambda: events.append(("callback", writer.rows_written)))
+    writer.close()
+    assert events == [("copy", [("a",), ("b",)]), ("commit",), ("callback", 2), ("callback", 2)]
+
+
+def test_full_queue_blocks_the_producer(events):
+    events.gate.clear()
+    writer = StreamingPostgresWriter({}, "t", ["a"], to_row=lambda r: (r,), queue_size=2, flush_rows=1,
+                                     flush_seconds=60)
+    writer.put(0)
+    wait_for(lambda: writer._queue.empty())  # the writer holds record 0 in a stalled COPY
+    writer.put(1)
+    writer.put(2)
+    producer = threading.Thread(target=writer.put, args=(3,))
+    producer.start()
+    producer.join(0.3)
+    assert producer.is_alive()  # queue full: back-pressure on the producer
+
+    events.gate.set()
+    producer.join(5)
+    assert not producer.is_alive()
+    writer.close()
+    assert [event[1] for event in events if event[0] == "copy"] == [[(0,)], [(1,)], [(2,)], [(3,)]]
+
+
+def test_writer_error_reaches_put_and_close(events):
+    events.fail = ValueError("COPY failed")
+    writer = StreamingPostgresWriter({}, "t", ["a"], to_row=lambda r: (r,), queue_size=1, flush_rows=1,
+                                     flush_seconds=60)
+    writer.put(0)
+    wait_for(lambda: writer.error is not None)
+    with pytest.raises(RuntimeError) as put_error:
+        writer.put(1)
+    assert isinstance(put_error.value.__cause__, ValueError)
+    with pytest.raises(RuntimeError):
+        writer.close()
+    assert events.connections[0].closed and writer.rows_written == 0
@@ -0,0 +1,66 @@
+import pandas as pd
+
+from db.stage_store import ABR_CLEANED, StageStore
+from transform.entity_matching import load_name_store, load_token_index, token_match
+from transform.blocking import name_tokens
+from transform.token_index import TokenIndex
+
+ABR = pd.DataFrame([
+    {"abn": "1", "entity_name": "Acme Widgets Pty Ltd", "entity_type": "PRV", "state": "NSW", "postcode": "2000"},
+    {"abn": "2", "entity_name": "Acme Plumbing Pty Ltd", "entity_type": "PRV", "state": "VIC", "postcode": "3000"},
+    {"abn": "3", "entity_name": "Harbour Bridge Dental Trust", "entity_type": "TRT", "state": "NSW", "postcode": None},
+    {"abn": "4", "entity_name": "Sydney Widgets Limited", "entity_type": "PUB", "state": "NSW", "postcode": "2000"},
+    {"abn": "5", "entity_name": None, "entity_type": "PRV", "state": "QLD", "postcode": "4000"},
+    {"abn": "6", "entity_name": "The Trustee For Smith Family Trust", "entity_type": "TRT", "state": "QLD",
+     "postcode": "4000"},
+])
+
+
+def test_name_tokens_drop_punctuation_and_stop_words():
+    positions, tokens = name_tokens(["Acme (Aust) Pty. Ltd.", None, "The Smith & Co Trust", "Pty Ltd"])
+    assert positions.tolist() == [0, 2]
+    assert tokens.to_pylist() == ["ACME", "SMITH"]
+
+
+def test_shortlist_ranks_rare_tokens_first():
+    index = TokenIndex.from_dataframe(ABR)
+    assert len(index) == 5  # the unnamed record is left out
+    widgets, dental, nothing = index.candidates(["Acme Widgets", "harbour dental", "Pty Ltd"], k=3)
+    assert index.rows(widgets)["abn"].tolist() == ["1", "2", "4"]  # both tokens first, then ties by position
+    assert index.rows(dental)["abn"].tolist() == ["3"]
+    assert len(nothing) == 0
+
+
+def test_postings_cap_keeps_the_rarest_token():
+    index = TokenIndex.from_dataframe(ABR)
+    (shortlist,) = index.candidates(["Acme Widgets Plumbing"], k=10, max_postings=1)
+    assert index.rows(shortlist)["abn"].tolist() == ["2"]
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    index = TokenIndex.from_dataframe(ABR, fingerprint="v1")
+    index.save(str(tmp_path))
+    assert TokenIndex.load(str(tmp_path), "v2") is None
+    loaded = TokenIndex.load(str(tmp_path), "v1")
+    assert loaded.vocab == index.vocab and loaded.fingerprint == "v1"
+    query = ["acme widgets", "smith family"]
+    assert [c.tolist() for c in loaded.candidates(query)] == [c.tolist() for c in index.candidates(query)]
+    assert TokenIndex.load(str(tmp_path / "missing")) is None
+
+
+def test_token_match_from_stage_with_missing_postcodes(tmp_path):
+    store = StageStore(str(tmp_path / "stages"))
+    store.replace(ABR_CLEANED, ABR, partition_cols=["state"])
+    index_dir = str(tmp_path / "index")
+    index = load_token_index(load_name_store(store=store, directory=str(tmp_path / "names")), directory=index_dir)
+    assert TokenIndex.load(index_dir, index.fingerprint) is not None
+
+    crawl = pd.DataFrame({"domain": ["dental.com.au", "sydney.com.au", "acme.com.au", "blank.com.au"],
+                          "company_name": ["Harbour Bridge Dental Trust", "Sydney Widgets Ltd", "Acme Plumbing", None],
+                          "abn": [None, None, None, None], "postcode": [None, "9999", "2000", None]})
+    matches, remaining = token_match(crawl, index)
+    assert matches[["crawl_domain", "abr_abn", "match_method", "match_confidence"]].values.tolist() == [
+        ["dental.com.au", "3", "fuzzy_token", "high"], ["sydney.com.au", "4", "fuzzy_token", "medium"]]
+    # below the stricter threshold without a postcode to back it
+    assert remaining["domain"].tolist() == ["acme.com.au", "blank.com.au"]
+
@@ -0,0 +1,53 @@
+import pandas as pd
+from fuzzywuzzy import process as fuzzywuzzy_process
+
+from transform.data_cleaning import STATE_MAPPING
+from transform.value_lookup import ValueLookup, tidy_key
+
+SPELLINGS = ["NSW", "n.s.w.", " New  South Wales ", "Queenslnd", "W A", "NSWW", "Victora", "Sth Australia",
+             "Tasmanian", "ACT 2600", "North Territory", "Sydney", "W.AUST", "Unknown", "", None]
+
+
+def fuzzywuzzy_state(state):
+    """standardize_state as it was written against fuzzywuzzy."""
+    if not isinstance(state, str):
+        return None
+    key = tidy_key(state)
+    if key in STATE_MAPPING:
+        return STATE_MAPPING[key]
+    best_match, score = fuzzywuzzy_process.extractOne(key, STATE_MAPPING.keys())
+    return STATE_MAPPING[best_match] if score > 85 else None
+
+
+def test_resolves_like_fuzzywuzzy(tmp_path):
+    lookup = ValueLookup("state", STATE_MAPPING, cache_dir=str(tmp_path))
+    assert [lookup.resolve(s) for s in SPELLINGS] == [fuzzywuzzy_state(s) for s in SPELLINGS]
+
+
+def test_map_resolves_each_distinct_value_once(tmp_path):
+    lookup = ValueLookup("state", STATE_MAPPING, cache_dir=str(tmp_path))
+    column = pd.Series(SPELLINGS * 1000)
+    mapped = lookup.map(column)
+    assert lookup.stats["resolved"] == len(set(s for s in SPELLINGS if s is not None))
+    assert mapped.fillna("-").tolist() == [lookup.resolve(s) or "-" for s in column]
+
+
+def test_resolved_table_persists_until_mapping_changes(tmp_path):
+    lookup = ValueLookup("state", STATE_MAPPING, cache_dir=str(tmp_path))
+    lookup.map(pd.Series(SPELLINGS))
+    lookup.save()
+
+    warm = ValueLookup("state", STATE_MAPPING, cache_dir=str(tmp_path))
+    assert warm.map(pd.Series(SPELLINGS)).equals(lookup.map(pd.Series(SPELLINGS)))
+    assert warm.stats["resolved"] == 0 and warm.stats["loaded"] == len(lookup.resolved)
+
+    changed = ValueLookup("state", {**STATE_MAPPING, "SYDNEY": "NSW"}, cache_dir=str(tmp_path))
+    assert changed.stats["loaded"] == 0 and changed.resolve("Sydney") == "NSW"
+
+
+def test_reusable_for_other_columns(tmp_path):
+    entity_types = ValueLookup("entity_type", {"AUSTRALIAN PRIVATE COMPANY": "PRV", "AUSTRALIAN PUBLIC COMPANY": "PUB",
+                                               "DISCRETIONARY TRADING TRUST": "DTT"}, cache_dir=str(tmp_path))
+    column = pd.Series(["Australian Private Company", "australian  public company", "Australian Privte Company",
+                        "Discretionary Trading Trust", "Sole Trader", None])
+    assert entity_types.map(column).fillna("-").tolist() == ["PRV", "PUB", "PRV", "DTT", "-", "-"]
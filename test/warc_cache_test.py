@@ -0,0 +1,33 @@
+import os
+
+from extract.warc_cache import WarcRecordCache, record_key
+
+
+def read(cache, *coords):
+    with cache.open_record(*coords) as cached:
+        return None if cached is None else cached[:]
+
+
+def test_put_and_read_back(tmp_path):
+    cache = WarcRecordCache(str(tmp_path))
+    assert read(cache, "a.warc.gz", 0, 3) is None
+    cache.put("a.warc.gz", 0, 3, b"abc")
+    assert read(cache, "a.warc.gz", "0", "3") == b"abc"
+    assert read(cache, "a.warc.gz", 3, 3) is None
+    assert cache.stats == {"hits": 1, "misses": 2, "evictions": 0}
+    assert WarcRecordCache(str(tmp_path)).size == 3
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = WarcRecordCache(str(tmp_path), max_bytes=250)
+    for offset in range(2):
+        cache.put("a.warc.gz", offset, 100, b"x" * 100)
+        key = record_key("a.warc.gz", offset, 100)
+        os.utime(os.path.join(str(tmp_path), key[:2], key), (offset, offset))
+    read(cache, "a.warc.gz", 0, 100)  # refreshes entry 0, so entry 1 is now the oldest
+
+    cache.put("a.warc.gz", 2, 100, b"x" * 100)
+    assert read(cache, "a.warc.gz", 1, 100) is None
+    assert read(cache, "a.warc.gz", 0, 100) == b"x" * 100
+    assert read(cache, "a.warc.gz", 2, 100) == b"x" * 100
+    assert cache.stats["evictions"] == 1 and cache.size == 200
@@ -0,0 +1,118 @@
+import threading
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from warcio.warcwriter import WARCWriter
+from warcio.statusandheaders import StatusAndHeaders
+
+from extract.warc_cache import WarcRecordCache
+from extract.warc_fetcher import WarcRangeFetcher, decode_payload
+
+WARC_PATH = "crawl-data/CC-MAIN-TEST/segments/0/warc/test.warc.gz"
+
+
+def build_warc(pages):
+    """Write pages into one gzipped WARC and return (bytes, index records)."""
+    out = BytesIO()
+    writer = WARCWriter(out, gzip=True)
+    records = []
+    for url, html in pages:
+        offset = out.tell()
+        http_headers = StatusAndHeaders("200 OK", [("Content-Type", "text/html")], protocol="HTTP/1.1")
+        writer.write_record(writer.create_warc_record(url, "response", payload=BytesIO(html.encode()),
+                                                      http_headers=http_headers))
+        records.append({"url": url, "filename": WARC_PATH, "offset": str(offset),
+                        "length": str(out.tell() - offset)})
+    return out.getvalue(), records
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves byte ranges of one WARC file, failing the first `slow_downs` requests with 503."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits += 1
+            slow_down = server.slow_downs > 0
+            server.slow_downs -= 1 if slow_down else 0
+        if slow_down:
+            body = b"<Error><Code>SlowDown</Code></Error>"
+            self.send_response(503)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path.lstrip("/") != WARC_PATH:
+            self.send_error(404)
+            return
+        start, end = self.headers["Range"].split("=")[1].split("-")
+        body = server.warc[int(start):int(end) + 1]
+        self.send_response(206)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def warc_server():
+    pages = [(f"https://site{i}.com.au/", f"<html><title>Site {i}</title></html>") for i in range(40)]
+    warc, records = build_warc(pages)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    server.warc, server.hits, server.slow_downs, server.lock = warc, 0, 0, threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, records, pages
+    server.shutdown()
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_fetch_many_ordered(warc_server):
+    server, records, pages = warc_server
+    fetcher = WarcRangeFetcher(base_url=base_url(server), max_in_flight=4)
+    results = [(rec["url"], decode_payload(payload)) for rec, payload in fetcher.fetch_many(records)]
+    assert results == pages
+    assert fetcher.stats["requests"] == len(records)
+
+
+def test_fetch_many_unordered(warc_server):
+    server, records, pages = warc_server
+    fetcher = WarcRangeFetcher(base_url=base_url(server), max_in_flight=8)
+    results = {rec["url"]: decode_payload(payload) for rec, payload in fetcher.fetch_many(records, ordered=False)}
+    assert results == dict(pages)
+
+
+def test_retries_on_slow_down(warc_server):
+    server, records, pages = warc_server
+    server.slow_downs = 3
+    fetcher = WarcRangeFetcher(base_url=base_url(server), max_in_flight=1, backoff=0.01)
+    assert decode_payload(fetcher.fetch_record(records[0])) == pages[0][1]
+    assert fetcher.stats["retries"] == 3
+
+
+def test_gives_up_after_max_retries(warc_server):
+    server, records, _ = warc_server
+    server.slow_downs = 10
+    fetcher = WarcRangeFetcher(base_url=base_url(server), max_in_flight=1, max_retries=2, backoff=0.01)
+    assert fetcher.fetch_record(records[0]) == b""
+    assert fetcher.stats["errors"] == 1
+
+
+def test_cache_serves_repeat_fetches_locally(warc_server, tmp_path):
+    server, records, pages = warc_server
+    cache = WarcRecordCache(str(tmp_path))
+    fetcher = WarcRangeFetcher(base_url=base_url(server), max_in_flight=4, cache=cache)
+    first = [decode_payload(payload) for _, payload in fetcher.fetch_many(records)]
+    hits = server.hits
+
+    fetcher = WarcRangeFetcher(base_url=base_url(server), max_in_flight=4, cache=WarcRecordCache(str(tmp_path)))
+    second = [decode_payload(payload) for _, payload in fetcher.fetch_many(records)]
+    assert first == second == [html for _, html in pages]
+    assert server.hits == hits and fetcher.stats["requests"] == 0
+    assert fetcher.cache.stats["hits"] == len(records) and cache.stats["misses"] == len(records)
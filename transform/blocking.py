@@ -0,0 +1,227 @@
+"""
+blocking.py
+-----------
+Postcode blocking index over the cleaned ABR records, used by
+entity_matching to compare each crawl record with every ABR record in its
+postcode, and only those.
+
+1. The ABR records (ABR_BLOCK_SCHEMA columns) are read once and held as one
+   Arrow table sorted by postcode, so a block is a zero-copy slice and
+   names are stored as compact Arrow strings rather than Python objects.
+2. Records without a postcode or a name are left out: they can never be
+   matched on name within a postcode.
+3. The sort is stable, so within a block records keep their input order
+   (ties between equally good names resolve as before).
+4. Each name is also kept token-sorted (sort_name): fuzz.ratio on sorted
+   names is exactly token_sort_ratio, without re-sorting every ABR name on
+   every comparison.
+5. CBD postcodes (2000, 3000, ...) hold far more records than the rest.
+   Blocks over sub_block_size are split again by name keys (name_keys: the
+   significant tokens and a soundex code of the name), built lazily
+   per block. A crawl record is then compared with the records sharing
+   either of its keys instead of the whole block.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+ABR_BLOCK_SCHEMA = pa.schema([(column, pa.string())
+                              for column in ["abn", "entity_name", "entity_type", "state", "postcode"]])
+SUB_BLOCK_SIZE = 5_000
+
+STOP_WORDS = frozenset("""
+    PTY PTE LTD LIMITED PROPRIETARY P L INC INCORPORATED CORP CORPORATION CO COMPANY
+    TRUST TRUSTEE TRUSTEES FOR ATF THE AND OF AUSTRALIA AUST AUS
+""".split())
+_STOP_WORDS = pa.array(sorted(STOP_WORDS), pa.large_string())
+_SOUNDEX_CLASSES = [("[AEIOUY]", "0"), ("[BFPV]", "1"), ("[CGJKQSXZ]", "2"), ("[DT]", "3"), ("L", "4"),
+                    ("[MN]", "5"), ("R", "6")]
+
+
+def name_tokens(names):
+    """
+    Tokenise names: returns (positions, tokens), the index of the name each
+    token came from and the tokens (Arrow strings), stop words removed.
+    """
+    if isinstance(names, pa.ChunkedArray):
+        names = names.combine_chunks()
+    elif not isinstance(names, pa.Array):
+        names = pa.array(list(names), pa.large_string(), from_pandas=True)
+    normalised = pc.replace_substring_regex(pc.utf8_upper(names.cast(pa.large_string())), r"[^A-Z0-9]+", " ")
+    lists = pc.split_pattern(pc.utf8_trim(normalised, " "), " ")
+    positions = pc.list_parent_indices(lists)
+    tokens = pc.list_flatten(lists)
+    keep = pc.and_(pc.invert(pc.is_in(tokens, _STOP_WORDS)), pc.not_equal(tokens, ""))
+    return positions.filter(keep).to_numpy(), tokens.filter(keep)
+
+
+def sort_tokens(names) -> pa.Array:
+    """Whitespace tokens of each name sorted and joined by one space, as token_sort_ratio compares them."""
+    if isinstance(names, pa.ChunkedArray):
+        names = names.combine_chunks()
+    elif not isinstance(names, pa.Array):
+        names = pa.array(list(names), pa.string(), from_pandas=True)
+    lists = pc.split_pattern_regex(pc.utf8_trim_whitespace(names.cast(pa.string())), r"\s+")
+    tokens = pc.list_flatten(lists)
+    order = pc.sort_indices(pa.table({"name": pc.list_parent_indices(lists), "token": tokens}),
+                            sort_keys=[("name", "ascending"), ("token", "ascending")])
+    rebuilt = pa.ListArray.from_arrays(lists.offsets, tokens.take(order), mask=pc.is_null(lists))
+    return pc.binary_join(rebuilt, " ")
+
+
+def soundex(values) -> list:
+    """
+    American soundex of the letters of each string (None for null, "" for
+    no letters), computed with Arrow string kernels rather than per value.
+    """
+    values = values if isinstance(values, pa.Array) else pa.array(list(values), pa.string(), from_pandas=True)
+    letters = pc.replace_substring_regex(pc.utf8_upper(values.cast(pa.string())), r"[^A-Z]", "")
+    first = pc.utf8_slice_codeunits(letters, 0, 1)
+    codes = pc.replace_substring_regex(letters, r"[HW]", "")
+    for pattern, digit in _SOUNDEX_CLASSES:
+        codes = pc.replace_substring_regex(codes, pattern, digit)
+    for digit in "0123456":
+        codes = pc.replace_substring_regex(codes, f"{digit}+", digit)
+    # the first letter stands for its own code (H and W have none, so were removed already)
+    codes = pc.if_else(pc.is_in(first, pa.array(["H", "W"])), codes,
+                       pc.utf8_slice_codeunits(codes, 1))
+    padded = pc.binary_join_element_wise(first, pc.replace_substring(codes, "0", ""), "000", "")
+    return pc.if_else(pc.equal(letters, ""), letters, pc.utf8_slice_codeunits(padded, 0, 4)).to_pylist()
+
+
+def _key_columns(names):
+    """
+    (mask of names with a significant token, positions and tokens of each
+    name's distinct significant tokens in sorted order, their soundex codes).
+    """
+    positions, tokens = name_tokens(names)
+    offsets = np.searchsorted(positions, np.arange(len(names) + 1)).astype(np.int32)
+    has_words = np.diff(offsets) > 0
+    words = pa.ListArray.from_arrays(pa.array(offsets), tokens).filter(pa.array(has_words))
+    distinct = pd.DataFrame({"name": positions, "token": tokens.to_pylist()})
+    distinct = distinct.drop_duplicates().sort_values(["name", "token"])
+    return (has_words, distinct["name"].to_numpy(), distinct["token"].tolist(),
+            soundex(pc.binary_join(words, pa.scalar("", pa.large_string()))))
+
+
+def name_keys(names) -> list:
+    """
+    Sub-block keys of each name: ("t", token) for each significant token,
+    sorted, and ("p", soundex of its significant tokens run together).
+    Sharing any one word is enough, whatever order the words come in or how
+    many are left out ("Plumbing Smith" / "Smith Plumbing Services"); the
+    soundex key keeps names together whose words are split or punctuated
+    differently ("A.C.N. 000" / "ACN 000"). Names with no significant token
+    get None.
+    """
+    has_words, positions, tokens, codes = _key_columns(names)
+    token_keys = [[] for _ in names]
+    for i, token in zip(positions.tolist(), tokens):
+        token_keys[i].append(("t", token))
+    keys = [None] * len(names)
+    for i, code in zip(np.flatnonzero(has_words).tolist(), codes):
+        keys[i] = (*token_keys[i], ("p", code))
+    return keys
+
+
+class PostcodeBlockIndex:
+    def __init__(self, table: pa.Table, sub_block_size: int = SUB_BLOCK_SIZE):
+        """
+        table: ABR records with ABR_BLOCK_SCHEMA columns, in any order, and
+        optionally their sort_name (from a NameStore); computed otherwise.
+        """
+        sort_name = table["sort_name"] if "sort_name" in table.column_names else None
+        table = table.select(ABR_BLOCK_SCHEMA.names).cast(ABR_BLOCK_SCHEMA)
+        table = table.append_column("sort_name", sort_name if sort_name is not None
+                                    else sort_tokens(table["entity_name"]))
+        table = table.filter(pc.and_(pc.is_valid(table["postcode"]), pc.is_valid(table["entity_name"])))
+        self.table = table.take(pc.sort_indices(table, sort_keys=[("postcode", "ascending")]))
+        postcodes = self.table.column("postcode").to_numpy(zero_copy_only=False)
+        starts = np.flatnonzero(np.r_[True, postcodes[1:] != postcodes[:-1]]) if len(postcodes) else []
+        ends = np.r_[starts[1:], len(postcodes)] if len(postcodes) else []
+        self._blocks = {postcodes[start]: (int(start), int(end)) for start, end in zip(starts, ends)}
+        self.sub_block_size = sub_block_size
+        self._sub_blocks = {}
+        self.stats = {"blocks_split": 0, "comparisons": 0, "full_comparisons": 0}
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, sub_block_size: int = SUB_BLOCK_SIZE) -> "PostcodeBlockIndex":
+        return cls(pa.Table.from_pandas(df[ABR_BLOCK_SCHEMA.names], schema=ABR_BLOCK_SCHEMA, preserve_index=False),
+                   sub_block_size)
+
+    # ------------------- Lookup ------------------- #
+    def __len__(self):
+        return self.table.num_rows
+
+    def __contains__(self, postcode):
+        return postcode in self._blocks
+
+    @property
+    def postcodes(self):
+        return list(self._blocks)
+
+    def span(self, postcode):
+        """(start, end) positions of a postcode's block, or None."""
+        return self._blocks.get(postcode)
+
+    def names(self, postcode, column="entity_name") -> list:
+        """Entity names (or sort_names) of a block, in block order."""
+        start, end = self._blocks[postcode]
+        return self.table.column(column).slice(start, end - start).to_pylist()
+
+    def names_at(self, positions, column="entity_name") -> list:
+        return self.table.column(column).take(pa.array(positions, pa.int64())).to_pylist()
+
+    def is_oversized(self, postcode) -> bool:
+        start, end = self._blocks[postcode]
+        return end - start > self.sub_block_size
+
+    def sub_blocks(self, postcode) -> dict:
+        """name key -> sorted index positions of a block's records with that key (built once per block)."""
+        if postcode not in self._sub_blocks:
+            start, end = self._blocks[postcode]
+            has_words, positions, tokens, codes = _key_columns(self.names(postcode))
+            rows = start + np.flatnonzero(has_words)
+            sub = {None: start + np.flatnonzero(~has_words)}
+            sub.update({("t", token): start + positions[members]
+                        for token, members in pd.Series(tokens).groupby(tokens).indices.items()})
+            sub.update({("p", code): rows[members]
+                        for code, members in pd.Series(codes).groupby(codes).indices.items()})
+            self._sub_blocks[postcode] = sub
+            self.stats["blocks_split"] += 1
+        return self._sub_blocks[postcode]
+
+    def candidates(self, postcode, keys) -> np.ndarray:
+        """Positions of the block's records sharing any of keys (the whole block for keys None)."""
+        start, end = self._blocks[postcode]
+        if keys is None:
+            return np.arange(start, end)
+        sub = self.sub_blocks(postcode)
+        found = [sub[key] for key in keys if key in sub]
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+    def block(self, postcode) -> pd.DataFrame:
+        """A postcode's records as a DataFrame, or None if it has none."""
+        if postcode not in self._blocks:
+            return None
+        start, end = self._blocks[postcode]
+        return self.table.slice(start, end - start).select(ABR_BLOCK_SCHEMA.names).to_pandas()
+
+    def rows(self, positions) -> pd.DataFrame:
+        """Records at index positions (as returned with span)."""
+        return self.table.take(pa.array(positions, pa.int64())).select(ABR_BLOCK_SCHEMA.names).to_pandas()
+
+    def summary(self) -> str:
+        sizes = np.array([end - start for start, end in self._blocks.values()] or [0])
+        oversized = sizes[sizes > self.sub_block_size]
+        return (f"ABR blocking index: {len(self):,} records in {len(self._blocks):,} postcodes "
+                f"(block size median {np.median(sizes):,.0f}, p99 {np.percentile(sizes, 99):,.0f}, "
+                f"largest {sizes.max():,}; {len(oversized):,} blocks over {self.sub_block_size:,} "
+                f"hold {oversized.sum() / max(len(self), 1):.0%} of records; {self.table.nbytes / 1e6:.1f} MB)")
+
+    def scoring_summary(self) -> str:
+        s = self.stats
+        return (f"Fuzzy scoring: {s['comparisons']:,} name comparisons "
+                f"({s['full_comparisons']:,} without sub-blocking, {s['blocks_split']:,} blocks split)")
@@ -5,16 +5,39 @@ data_cleaning.py — Final Production Version
 2. Deduplicates exactly as per SQL DISTINCT logic:
    - ABR: DISTINCT abn, entity_name, state, postcode
    - CC:  DISTINCT abn, company_name, postcode
-3. Inserts cleaned data into pre_dwh schema in batches.
+3. Loads cleaned data into the pre_dwh schema with COPY (staging table + swap).
+4. With STAGE_STORE_DIR set, reads the raw stages and writes the cleaned ones
+   as Parquet instead (cleaned ABR partitioned by state, sorted by postcode).
+5. Whole columns are cleaned at once with Arrow compute kernels
+   (clean_abr_frame / clean_cc_frame); the per-value functions remain the
+   reference they must match, see test/data_cleaning_test.py.
+6. States resolve once per distinct raw spelling through a persisted
+   lookup table (transform/value_lookup.py).
+7. --stream reads the raw data in CHUNK_ROWS chunks (named server-side
+   cursor, or stage batches), and cleans, deduplicates and writes each chunk
+   as it goes, so memory no longer grows with the raw tables.
+8. --incremental cleans only the raw rows added since the previous run
+   (watermarks in pre_dwh.etl_watermarks, re-reading a safety window behind
+   them) and upserts them on the full-mode dedup key for ABR / domain for
+   Common Crawl, merging each key's rows column by column, instead of
+   reloading whole tables.
 """
 
 import os
 import re
 import json
+import argparse
+import datetime
 import psycopg2
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from dotenv import load_dotenv
-from fuzzywuzzy import process
+
+from db.copy_loader import copy_rows, create_staging_table, dataframe_rows, replace_table, swap_table
+from db.stage_store import ABR_CLEANED, ABR_RAW, COMMONCRAWL_CLEANED, COMMONCRAWL_RAW, default_store
+from transform.dedup import HashDeduplicator
+from transform.value_lookup import ValueLookup
 
 # ------------------- Load DB config ------------------- #
 load_dotenv(dotenv_path="C:/Users/Admin/Desktop/firmable-etl-pipeline/.venv/.env")
@@ -38,19 +61,14 @@ STATE_MAPPING = {
     "ACT": "ACT", "AUSTRALIAN CAPITAL TERRITORY": "ACT",
     "NT": "NT", "NORTHERN TERRITORY": "NT"
 }
+STATE_LOOKUP = ValueLookup("state", STATE_MAPPING)
+
+CHUNK_ROWS = 50_000
 
 # ------------------- Cleaning Functions ------------------- #
 def standardize_state(state: str) -> str:
-    """Standardize state names using mapping and fuzzy matching."""
-    if not isinstance(state, str):
-        return None
-    state_clean = re.sub(r'[\.\s]+', ' ', state.strip().upper())
-    if state_clean in STATE_MAPPING:
-        return STATE_MAPPING[state_clean]
-    best_match, score = process.extractOne(state_clean, STATE_MAPPING.keys())
-    if score > 85:
-        return STATE_MAPPING[best_match]
-    return None
+    """Standardize state names using mapping and fuzzy matching (memoised per raw spelling)."""
+    return STATE_LOOKUP.resolve(state)
 
 
 def clean_company_name(name: str) -> str:
@@ -88,6 +106,80 @@ def safe_jsonify(x):
     except Exception:
         return None
 
+# ------------------- Vectorised Cleaning ------------------- #
+# RE2 classes matching Python's Unicode \s (str.isspace) and \d, so the
+# kernels agree with the re-based functions above on any input.
+_PY_SPACE = r"\pZ\t\n\x0b\x0c\r\x1c-\x1f\x85"
+_NON_DIGIT = r"[^\p{Nd}]"
+
+
+def _text_array(series: pd.Series) -> pa.Array:
+    """A text column as an Arrow string array, with empty strings (falsy values) as nulls."""
+    array = pa.array(series.astype("string"), type=pa.large_string(), from_pandas=True)
+    return pc.if_else(pc.equal(array, ""), pa.scalar(None, pa.large_string()), array)
+
+
+def _to_series(array: pa.Array, like: pd.Series) -> pd.Series:
+    """Back to pandas, inferring the dtype the way Series.apply does."""
+    return pd.Series(array.to_numpy(zero_copy_only=False), index=like.index, name=like.name)
+
+
+def clean_company_names(series: pd.Series) -> pd.Series:
+    """clean_company_name over a whole column."""
+    names = pc.replace_substring_regex(_text_array(series), r"[^A-Za-z0-9 &]", " ")
+    names = pc.utf8_trim(pc.replace_substring_regex(names, " +", " "), " ")
+    return _to_series(pc.utf8_title(names), series)
+
+
+def clean_postcodes(series: pd.Series) -> pd.Series:
+    """clean_postcode over a whole column."""
+    postcodes = pc.replace_substring_regex(_text_array(series), _NON_DIGIT, "")
+    return _to_series(pc.if_else(pc.equal(postcodes, ""), pa.scalar(None, postcodes.type), postcodes), series)
+
+
+def clean_abns(series: pd.Series) -> pd.Series:
+    """clean_abn over a whole column."""
+    abns = pc.replace_substring_regex(_text_array(series), rf"[{_PY_SPACE}\-]", "")
+    return _to_series(pc.if_else(pc.equal(pc.utf8_length(abns), 11), abns, pa.scalar(None, abns.type)), series)
+
+
+def standardize_states(series: pd.Series) -> pd.Series:
+    """standardize_state over a whole column: each distinct value is resolved once."""
+    return STATE_LOOKUP.map(series)
+
+
+def clean_abr_frame(df: pd.DataFrame) -> pd.DataFrame:
+    df["entity_name"] = clean_company_names(df["entity_name"])
+    df["abn"] = clean_abns(df["abn"])
+    df["postcode"] = clean_postcodes(df["postcode"])
+    df["state"] = standardize_states(df["state"])
+    return df
+
+
+def clean_cc_frame(df: pd.DataFrame) -> pd.DataFrame:
+    df["company_name"] = clean_company_names(df["company_name"])
+    df["abn"] = clean_abns(df["abn"])
+    df["postcode"] = clean_postcodes(df["postcode"])
+    return df
+
+
+def jsonify_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    safe_jsonify over every column, skipping columns it would leave as they
+    are: numeric, bool and string dtypes, and object columns holding only
+    strings.
+    """
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object:
+            if pd.api.types.infer_dtype(values, skipna=True) in ("string", "empty"):
+                df[col] = values.infer_objects()
+                continue
+        elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_string_dtype(values):
+            continue
+        df[col] = values.apply(safe_jsonify)
+    return df
+
 # ------------------- Database Utility Functions ------------------- #
 def fetch_raw_data(query: str) -> pd.DataFrame:
     """Fetch raw data from PostgreSQL."""
@@ -100,87 +192,336 @@ def fetch_raw_data(query: str) -> pd.DataFrame:
         return pd.DataFrame()
 
 
-def save_cleaned_data(df: pd.DataFrame, table_name: str, batch_size: int = 500_000):
-    """Save cleaned data to PostgreSQL in batches, handling large datasets efficiently."""
+def iter_raw_chunks(query: str, chunk_rows: int = CHUNK_ROWS, params=None):
+    """
+    Yield the result of query as DataFrames of at most chunk_rows rows, read
+    through a named (server-side) cursor so only one chunk is ever held.
+    """
+    with psycopg2.connect(**DB_CONFIG) as conn:
+        with conn.cursor(name="data_cleaning_raw") as cursor:
+            cursor.itersize = chunk_rows
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                columns = [column[0] for column in cursor.description]
+                yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+
+def cleaned_table_sql(cols) -> str:
+    """CREATE TABLE used when a cleaned table does not exist yet; an existing table keeps its definition."""
+    col_defs = ', '.join([f"{c} TEXT" for c in cols if c.lower() != "created_at"])
+    return f"""
+        CREATE TABLE {{table}} (
+            {col_defs}
+            {',' if col_defs else ''} created_at TIMESTAMP DEFAULT NOW()
+        );
+    """
+
+
+def save_cleaned_data(df: pd.DataFrame, table_name: str):
+    """
+    Replace a cleaned table with df: rows are streamed with COPY into a
+    staging copy of the table, which is then swapped in atomically.
+    """
     if df.empty:
         print(f"No data to save for {table_name}")
         return
 
     # Convert JSON / array fields safely
-    for col in df.columns:
-        df[col] = df[col].apply(safe_jsonify)
+    df = jsonify_frame(df)
 
     cols = df.columns.tolist()
-    col_names = ', '.join(cols)
-    total_rows = len(df)
-    batches = range(0, total_rows, batch_size)
 
     try:
         with psycopg2.connect(**DB_CONFIG) as conn:
-            with conn.cursor() as cur:
-                # ---- Create table if not exists ---- #
-                col_defs = ', '.join([f"{c} TEXT" for c in cols if c.lower() != "created_at"])
-                cur.execute(f"""
-                    CREATE TABLE IF NOT EXISTS {table_name} (
-                        {col_defs}
-                        {',' if col_defs else ''} created_at TIMESTAMP DEFAULT NOW()
-                    );
-                """)
-                conn.commit()
-
-                # ---- Truncate before reloading ---- #
-                cur.execute(f"TRUNCATE TABLE {table_name};")
-                conn.commit()
-
-                from psycopg2.extras import execute_values
-
-                # ---- Batch Insert ---- #
-                for i in batches:
-                    batch_df = df.iloc[i:i + batch_size]
-                    batch_values = batch_df.values.tolist()
-
-                    execute_values(
-                        cur,
-                        f"INSERT INTO {table_name} ({col_names}) VALUES %s",
-                        batch_values
-                    )
-                    conn.commit()
-                    print(f"✅ Inserted batch {i // batch_size + 1} ({len(batch_df):,} rows)")
-
-                print(f"🎯 Successfully inserted {total_rows:,} records into {table_name}")
+            total_rows = replace_table(conn, table_name, cols, dataframe_rows(df, cols), cleaned_table_sql(cols),
+                                       keep_definition=True)
+            print(f"🎯 Successfully inserted {total_rows:,} records into {table_name}")
 
     except Exception as e:
         print("❌ Error saving cleaned data:", e)
 
 
-# ------------------- Main Cleaning Pipeline ------------------- #
-if __name__ == "__main__":
-    abr_query = "SELECT * FROM prd_firmable.stg.abr_raw_companies;"
-    cc_query = "SELECT * FROM prd_firmable.stg.common_crawl_raw_companies;"
+def stream_cleaned_data(chunks, table_name: str) -> int:
+    """
+    save_cleaned_data for an iterator of DataFrames: each chunk is COPYed into
+    the staging table as it arrives, and the table is swapped in at the end.
+    """
+    total_rows = 0
+    with psycopg2.connect(**DB_CONFIG) as conn:
+        staging = None
+        try:
+            for chunk in chunks:
+                chunk = jsonify_frame(chunk)
+                cols = chunk.columns.tolist()
+                if staging is None:
+                    staging = create_staging_table(conn, table_name, cleaned_table_sql(cols), keep_definition=True)
+                total_rows += copy_rows(conn, staging, cols, dataframe_rows(chunk, cols))
+        except Exception:
+            conn.rollback()
+            if staging is not None:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {staging};")
+                conn.commit()
+            raise
+        if staging is None:
+            print(f"No data to save for {table_name}")
+            return 0
+        swap_table(conn, staging, table_name)
+    print(f"🎯 Successfully inserted {total_rows:,} records into {table_name}")
+    return total_rows
+
+
+# ------------------- Streaming ------------------- #
+def clean_chunks(chunks, clean_frame, dedup: HashDeduplicator):
+    """Clean and deduplicate a stream of raw chunks, yielding the non-empty cleaned ones."""
+    for chunk in chunks:
+        chunk = dedup.filter(clean_frame(chunk))
+        if len(chunk):
+            yield chunk
+
+
+# ------------------- Incremental Cleaning ------------------- #
+WATERMARK_TABLE = "prd_firmable.pre_dwh.etl_watermarks"
+WATERMARK_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        source TEXT PRIMARY KEY,
+        last_created_at TIMESTAMP NOT NULL,
+        last_id BIGINT NOT NULL,
+        rows_cleaned BIGINT,
+        updated_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+# how far behind its watermark a source is read again, for rows that committed late
+WATERMARK_SAFETY_WINDOW = datetime.timedelta(minutes=10)
+
+
+def get_watermark(conn, source: str):
+    """(created_at, id) of the last raw row cleaned for source, or None before the first incremental run."""
+    with conn.cursor() as cursor:
+        cursor.execute(WATERMARK_DDL.format(table=WATERMARK_TABLE))
+        cursor.execute(f"SELECT last_created_at, last_id FROM {WATERMARK_TABLE} WHERE source = %s", (source,))
+        row = cursor.fetchone()
+    conn.commit()
+    return row
+
+
+def iter_raw_delta(raw_table: str, watermark, chunk_rows: int = CHUNK_ROWS,
+                   safety_window: datetime.timedelta = WATERMARK_SAFETY_WINDOW):
+    """
+    Raw rows from safety_window before the watermark on, in (created_at, id)
+    order, as chunks. created_at defaults to the start of the inserting
+    transaction, so a row can commit after rows stamped later than it were
+    already cleaned; re-reading the window picks it up, and the upsert makes
+    reading a row twice harmless.
+    """
+    if watermark is None:
+        return iter_raw_chunks(f"SELECT * FROM {raw_table} ORDER BY created_at, id", chunk_rows)
+    return iter_raw_chunks(f"SELECT * FROM {raw_table} WHERE created_at > %s ORDER BY created_at, id",
+                           chunk_rows, params=(watermark[0] - safety_window,))
+
+
+def upsert_cleaned_data(chunks, table_name: str, key, source: str, delta):
+    """
+    Apply cleaned chunks to table_name keyed on `key` (a column or a list of
+    columns), in one transaction: chunks are COPYed into a temporary table
+    after the rows of table_name with the same keys, those rows are deleted
+    (superseded), and one row per key is inserted holding each column's
+    latest non-null value, so a page without an ABN does not erase the ABN
+    an earlier page gave. Rows with no value in the first key column are
+    skipped; the others compare nulls as equal, as drop_duplicates does. The
+    source's watermark advances to delta["last"] in the same transaction.
+    Returns (rows upserted, rows superseded).
+    """
+    keys = [key] if isinstance(key, str) else list(key)
+    delta_table = "cleaned_delta"
+    with psycopg2.connect(**DB_CONFIG) as conn:
+        with conn.cursor() as cursor:
+            cols = None
+            for chunk in chunks:
+                chunk = jsonify_frame(chunk[chunk[keys[0]].notna()])
+                if cols is None:
+                    cols = chunk.columns.tolist()
+                    cursor.execute(cleaned_table_sql(cols).replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS")
+                                   .format(table=table_name))
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name.split('.')[-1]}_{keys[0]}_idx "
+                                   f"ON {table_name} ({keys[0]})")
+                    cursor.execute(f"CREATE TEMP TABLE {delta_table} (LIKE {table_name}) ON COMMIT DROP")
+                    cursor.execute(f"ALTER TABLE {delta_table} ADD COLUMN delta_seq BIGSERIAL")
+                copy_rows(conn, delta_table, cols, dataframe_rows(chunk, cols))
+            if cols is None:
+                return 0, 0
+
+            col_list = ", ".join(cols)
+            same_key = " AND ".join([f"t.{keys[0]} = d.{keys[0]}"]
+                                    + [f"t.{k} IS NOT DISTINCT FROM d.{k}" for k in keys[1:]])
+            # stored rows merge in first (delta_seq 0); COPY numbered the new ones in arrival order
+            cursor.execute(f"""
+                INSERT INTO {delta_table} ({col_list}, delta_seq)
+                SELECT {", ".join(f"t.{c}" for c in cols)}, 0 FROM {table_name} t
+                WHERE EXISTS (SELECT 1 FROM {delta_table} d WHERE {same_key})
+            """)
+            cursor.execute(f"DELETE FROM {table_name} t USING {delta_table} d WHERE {same_key}")
+            superseded = cursor.rowcount
+            latest = ", ".join(c if c in keys else
+                               f"(array_agg({c} ORDER BY delta_seq DESC) FILTER (WHERE {c} IS NOT NULL))[1]"
+                               for c in cols)
+            cursor.execute(f"INSERT INTO {table_name} ({col_list}) "
+                           f"SELECT {latest} FROM {delta_table} GROUP BY {', '.join(keys)}")
+            upserted = cursor.rowcount
+            cursor.execute(f"""
+                INSERT INTO {WATERMARK_TABLE} (source, last_created_at, last_id, rows_cleaned, updated_at)
+                VALUES (%s, %s, %s, %s, NOW())
+                ON CONFLICT (source) DO UPDATE SET last_created_at = EXCLUDED.last_created_at,
+                    last_id = EXCLUDED.last_id, rows_cleaned = EXCLUDED.rows_cleaned, updated_at = NOW()
+            """, (source, *delta["last"], delta["rows"]))
+    return upserted, superseded
+
+
+def track_delta(chunks, delta):
+    """
+    Pass raw chunks through, recording the row count and the (created_at, id)
+    of the last row; delta["last"] starts at the previous watermark, which
+    re-read rows do not move back.
+    """
+    for chunk in chunks:
+        delta["rows"] += len(chunk)
+        last = chunk.iloc[-1]
+        last = (last["created_at"].to_pydatetime(), int(last["id"]))
+        delta["last"] = last if delta["last"] is None else max(tuple(delta["last"]), last)
+        yield chunk
 
-    df_abr = fetch_raw_data(abr_query)
-    df_cc = fetch_raw_data(cc_query)
+
+# ------------------- Main Cleaning Pipeline ------------------- #
+ABR_RAW_TABLE = "prd_firmable.stg.abr_raw_companies"
+CC_RAW_TABLE = "prd_firmable.stg.common_crawl_raw_companies"
+ABR_QUERY = f"SELECT * FROM {ABR_RAW_TABLE};"
+CC_QUERY = f"SELECT * FROM {CC_RAW_TABLE};"
+ABR_CLEANED_TABLE = "prd_firmable.pre_dwh.cleaned_abr_companies"
+CC_CLEANED_TABLE = "prd_firmable.pre_dwh.cleaned_commoncrawl_companies"
+ABR_DEDUP_COLUMNS = ["abn", "entity_name", "state", "postcode"]
+CC_DEDUP_COLUMNS = ["abn", "company_name", "postcode"]
+
+
+def run_cleaning(store=None):
+    """Clean both raw sources in memory: read whole tables/stages, clean, dedupe, replace the outputs."""
+    if store is not None:
+        df_abr = store.read(ABR_RAW)
+        df_cc = store.read(COMMONCRAWL_RAW)
+    else:
+        df_abr = fetch_raw_data(ABR_QUERY)
+        df_cc = fetch_raw_data(CC_QUERY)
 
     print(f"Raw ABR records: {len(df_abr):,}, Raw CC records: {len(df_cc):,}")
 
     # --- Clean ABR --- #
-    df_abr["entity_name"] = df_abr["entity_name"].apply(clean_company_name)
-    df_abr["abn"] = df_abr["abn"].apply(clean_abn)
-    df_abr["postcode"] = df_abr["postcode"].apply(clean_postcode)
-    df_abr["state"] = df_abr["state"].apply(standardize_state)
+    df_abr = clean_abr_frame(df_abr)
+    STATE_LOOKUP.save()
+    print(STATE_LOOKUP.summary())
 
     # --- Clean CC --- #
-    df_cc["company_name"] = df_cc["company_name"].apply(clean_company_name)
-    df_cc["abn"] = df_cc["abn"].apply(clean_abn)
-    df_cc["postcode"] = df_cc["postcode"].apply(clean_postcode)
+    df_cc = clean_cc_frame(df_cc)
 
     # --- Deduplication (Exact SQL DISTINCT logic) --- #
-    df_abr = df_abr.drop_duplicates(subset=["abn", "entity_name", "state", "postcode"])
-    df_cc = df_cc.drop_duplicates(subset=["abn", "company_name", "postcode"])
+    df_abr = df_abr.drop_duplicates(subset=ABR_DEDUP_COLUMNS)
+    df_cc = df_cc.drop_duplicates(subset=CC_DEDUP_COLUMNS)
 
     print(f"Deduplicated ABR records: {len(df_abr):,}, Deduplicated CC records: {len(df_cc):,}")
 
     # --- Save Cleaned Outputs --- #
-    save_cleaned_data(df_abr, "prd_firmable.pre_dwh.cleaned_abr_companies")
-    save_cleaned_data(df_cc, "prd_firmable.pre_dwh.cleaned_commoncrawl_companies")
+    if store is not None:
+        store.replace(ABR_CLEANED, df_abr, partition_cols=["state"], sort_by=["postcode"])
+        store.replace(COMMONCRAWL_CLEANED, df_cc, sort_by=["postcode"])
+        print(f"🎯 Cleaned stages written to {store.root}")
+    else:
+        save_cleaned_data(df_abr, ABR_CLEANED_TABLE)
+        save_cleaned_data(df_cc, CC_CLEANED_TABLE)
+
+
+def run_cleaning_stream(store=None, chunk_rows: int = CHUNK_ROWS):
+    """
+    Clean both raw sources chunk by chunk (server-side cursor or stage
+    batches), writing each cleaned chunk as it is produced. Peak memory is
+    set by chunk_rows plus the deduplication budget (DEDUP_MEMORY_BYTES),
+    not by table size.
+    """
+    sources = [
+        (ABR_RAW, ABR_QUERY, clean_abr_frame, ABR_DEDUP_COLUMNS, ABR_CLEANED, ABR_CLEANED_TABLE, ["state"]),
+        (COMMONCRAWL_RAW, CC_QUERY, clean_cc_frame, CC_DEDUP_COLUMNS, COMMONCRAWL_CLEANED, CC_CLEANED_TABLE, None),
+    ]
+    for raw_stage, query, clean_frame, dedup_columns, cleaned_stage, cleaned_table, partition_cols in sources:
+        if store is not None:
+            raw_chunks = store.iter_batches(raw_stage, batch_size=chunk_rows)
+        else:
+            raw_chunks = iter_raw_chunks(query, chunk_rows)
+
+        with HashDeduplicator(dedup_columns) as dedup:
+            chunks = clean_chunks(raw_chunks, clean_frame, dedup)
+            if store is not None:
+                # Cleaning keeps the raw columns and types; pinning the schema stops an
+                # all-null chunk from writing a file with null-typed columns.
+                schema = store.dataset(raw_stage).schema
+                store.clear(cleaned_stage)
+                for part, chunk in enumerate(chunks):
+                    store.write(cleaned_stage, chunk, partition_cols=partition_cols, sort_by=["postcode"],
+                                part_name=f"chunk-{part:05d}", schema=schema)
+                print(f"🎯 Cleaned stage {cleaned_stage} written to {store.root}")
+            else:
+                stream_cleaned_data(chunks, cleaned_table)
+        print(dedup.summary())
+
+    STATE_LOOKUP.save()
+    print(STATE_LOOKUP.summary())
+
+
+def clean_incremental(source, raw_table, clean_frame, cleaned_table, key, chunk_rows: int = CHUNK_ROWS):
+    """One source of run_cleaning_incremental; returns (raw rows read, rows upserted, rows superseded)."""
+    with psycopg2.connect(**DB_CONFIG) as conn:
+        watermark = get_watermark(conn, source)
+    delta = {"rows": 0, "last": watermark}
+    raw_chunks = track_delta(iter_raw_delta(raw_table, watermark, chunk_rows), delta)
+    chunks = (clean_frame(chunk) for chunk in raw_chunks)
+    upserted, superseded = upsert_cleaned_data(chunks, cleaned_table, key, source, delta)
+    since = watermark[0] - WATERMARK_SAFETY_WINDOW if watermark else "the start"
+    print(f"{source}: {delta['rows']:,} raw rows read since {since}, "
+          f"{upserted:,} upserted into {cleaned_table} ({superseded:,} superseded)")
+    return delta["rows"], upserted, superseded
+
+
+def run_cleaning_incremental(chunk_rows: int = CHUNK_ROWS):
+    """
+    Clean only the raw rows added since the last run (per-source watermark
+    on created_at, id, less WATERMARK_SAFETY_WINDOW) and upsert them into
+    pre_dwh: ABR on ABR_DEDUP_COLUMNS, the rows the full modes keep apart,
+    Common Crawl on domain.
+    """
+    sources = [
+        ("abr", ABR_RAW_TABLE, clean_abr_frame, ABR_CLEANED_TABLE, ABR_DEDUP_COLUMNS),
+        ("commoncrawl", CC_RAW_TABLE, clean_cc_frame, CC_CLEANED_TABLE, "domain"),
+    ]
+    for source, raw_table, clean_frame, cleaned_table, key in sources:
+        clean_incremental(source, raw_table, clean_frame, cleaned_table, key, chunk_rows)
+
+    STATE_LOOKUP.save()
+    print(STATE_LOOKUP.summary())
 
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean the raw ABR and Common Crawl data.")
+    parser.add_argument("--stream", action="store_true",
+                        help="read, clean and write in chunks instead of whole tables")
+    parser.add_argument("--incremental", action="store_true",
+                        help="clean only raw rows added since the last run and upsert them (Postgres only)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    if args.incremental:
+        if default_store() is not None:
+            parser.error("--incremental works on the Postgres tables; unset STAGE_STORE_DIR")
+        run_cleaning_incremental(args.chunk_rows)
+    elif args.stream:
+        run_cleaning_stream(default_store(), args.chunk_rows)
+    else:
+        run_cleaning(default_store())
@@ -0,0 +1,157 @@
+"""
+dedup.py
+--------
+Streaming, out-of-core equivalent of DataFrame.drop_duplicates(subset)
+(keep="first") for data that arrives in chunks.
+
+1. The key columns of each row are hashed to a 64-bit digest
+   (pandas.util.hash_pandas_object), so a key costs 8 bytes whatever its
+   width. Two distinct keys sharing a digest would be taken for duplicates;
+   at 64 bits the chance is ~n^2 / 2^65 (about 1e-5 for 20M keys).
+2. Digests seen so far are kept in memory as a few sorted numpy arrays
+   (merged LSM-style as they grow) and probed with searchsorted.
+3. Once they pass memory_bytes they are spilled: split by the top bits of
+   the digest into `partitions` hash partitions and written as one sorted
+   run per partition, read back through mmap. A chunk's digests are probed
+   only against the runs of their own partition; a partition's runs are
+   merged into one when there are more than max_runs of them.
+Rows are kept in order and a row is dropped only if its key appeared in an
+earlier row, so the output is exactly what drop_duplicates would keep.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+DEDUP_MEMORY_BYTES = int(os.getenv("DEDUP_MEMORY_BYTES", 256 * 1024 ** 2))
+
+
+def key_digests(df: pd.DataFrame, subset) -> np.ndarray:
+    """uint64 digest of each row's key columns (stable across chunks and dtypes)."""
+    return pd.util.hash_pandas_object(df[list(subset)], index=False).to_numpy(dtype=np.uint64)
+
+
+def _contains(sorted_keys: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Membership of values in a sorted array."""
+    if not len(sorted_keys) or not len(values):
+        return np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(sorted_keys, values)
+    return sorted_keys[np.minimum(positions, len(sorted_keys) - 1)] == values
+
+
+class HashDeduplicator:
+    def __init__(self, subset, memory_bytes: int = DEDUP_MEMORY_BYTES, spill_dir: str = None,
+                 partitions: int = 64, max_runs: int = 8):
+        if partitions & (partitions - 1):
+            raise ValueError("partitions must be a power of two")
+        self.subset = list(subset)
+        self.memory_bytes = memory_bytes
+        self.partitions = partitions
+        self.max_runs = max_runs
+        self._shift = np.uint64(64 - partitions.bit_length() + 1)
+        self._spill_parent = spill_dir
+        self._dir = None
+        self._levels = []
+        self._runs = [[] for _ in range(partitions)]
+        self._run_ids = 0
+        self.stats = {"rows_in": 0, "rows_out": 0, "keys": 0, "spills": 0, "merges": 0}
+
+    # ------------------- Lookup ------------------- #
+    def _partition_of(self, digests: np.ndarray) -> np.ndarray:
+        if self.partitions == 1:
+            return np.zeros(len(digests), dtype=np.int64)
+        return (digests >> self._shift).astype(np.int64)
+
+    def _seen(self, digests: np.ndarray) -> np.ndarray:
+        seen = np.zeros(len(digests), dtype=bool)
+        for level in self._levels:
+            seen |= _contains(level, digests)
+        if self.stats["spills"]:
+            parts = self._partition_of(digests)
+            for part in np.unique(parts):
+                rows = np.flatnonzero(parts == part)
+                for run in self._runs[part]:
+                    seen[rows] |= _contains(run, digests[rows])
+        return seen
+
+    def filter(self, df: pd.DataFrame) -> pd.DataFrame:
+        """The rows of df whose key has not been seen in this or any earlier chunk."""
+        self.stats["rows_in"] += len(df)
+        if not len(df):
+            return df
+        digests = key_digests(df, self.subset)
+        unique, first = np.unique(digests, return_index=True)
+        new = ~self._seen(unique)
+        keep = np.zeros(len(df), dtype=bool)
+        keep[first[new]] = True
+        self._add(unique[new])
+        self.stats["rows_out"] += int(keep.sum())
+        return df[keep]
+
+    # ------------------- In-memory keys ------------------- #
+    def _add(self, sorted_digests: np.ndarray):
+        """Remember new digests. A digest is only ever added once, so levels and runs stay disjoint."""
+        if not len(sorted_digests):
+            return
+        self._levels.append(sorted_digests)
+        self.stats["keys"] += len(sorted_digests)
+        while len(self._levels) > 1 and len(self._levels[-1]) * 2 >= len(self._levels[-2]):
+            top = self._levels.pop()
+            self._levels[-1] = np.sort(np.concatenate([self._levels[-1], top]))
+        if self.memory_used() > self.memory_bytes:
+            self._spill()
+
+    def memory_used(self) -> int:
+        return sum(level.nbytes for level in self._levels)
+
+    # ------------------- Spilling ------------------- #
+    def _write_run(self, part: int, keys: np.ndarray) -> np.ndarray:
+        path = os.path.join(self._dir, f"run-{self._run_ids:06d}-p{part:04d}.npy")
+        self._run_ids += 1
+        np.save(path, keys)
+        return np.load(path, mmap_mode="r")
+
+    def _spill(self):
+        if self._dir is None:
+            self._dir = tempfile.mkdtemp(prefix="dedup-", dir=self._spill_parent)
+        keys = self._levels[0] if len(self._levels) == 1 else np.sort(np.concatenate(self._levels))
+        self._levels = []
+        # keys are sorted and partitions are digest prefixes, so each partition is a contiguous slice
+        bounds = np.searchsorted(self._partition_of(keys), np.arange(self.partitions + 1))
+        for part in range(self.partitions):
+            chunk = keys[bounds[part]:bounds[part + 1]]
+            if len(chunk):
+                self._runs[part].append(self._write_run(part, chunk))
+            if len(self._runs[part]) > self.max_runs:
+                self._merge_runs(part)
+        self.stats["spills"] += 1
+
+    def _merge_runs(self, part: int):
+        runs = self._runs[part]
+        merged = np.sort(np.concatenate(runs))
+        paths = [run.filename for run in runs]
+        self._runs[part] = [self._write_run(part, merged)]
+        for path in paths:
+            os.remove(path)
+        self.stats["merges"] += 1
+
+    def close(self):
+        """Drop the spilled runs."""
+        self._runs = [[] for _ in range(self.partitions)]
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"Dedup on {', '.join(self.subset)}: {s['rows_in']:,} rows in, {s['rows_out']:,} kept, "
+                f"{s['keys']:,} keys, {s['spills']:,} spills, {s['merges']:,} run merges")
@@ -1,10 +1,19 @@
 import os
+import hashlib
 import psycopg2
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from rapidfuzz import process, fuzz
 from openai import OpenAI
 from dotenv import load_dotenv
-from psycopg2.extras import execute_values
+
+from db.copy_loader import dataframe_rows, replace_table
+from db.stage_store import ABR_CLEANED, COMMONCRAWL_CLEANED, default_store
+from transform.blocking import ABR_BLOCK_SCHEMA, PostcodeBlockIndex, name_keys, sort_tokens
+from transform.llm_matcher import LLMMatcher
+from transform.name_store import NAME_STORE_DIR, NameStore
+from transform.token_index import DEFAULT_K, TOKEN_INDEX_DIR, TokenIndex
 
 # ---------------- Load environment ---------------- #
 load_dotenv(dotenv_path="C:/Users/Admin/Desktop/firmable-etl-pipeline/.venv/.env")
@@ -31,13 +40,9 @@ def store_matches_to_db(matches_df: pd.DataFrame):
         print("No valid matches to store (all null).")
         return
 
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-
-    # Drop and recreate table
-    cursor.execute("DROP TABLE IF EXISTS prd_firmable.dwh.dim_entity_match_company_data;")
-    cursor.execute("""
-        CREATE TABLE prd_firmable.dwh.dim_entity_match_company_data (
+    # Recreated on every run: loaded into a staging table, then swapped in.
+    create_sql = """
+        CREATE TABLE {table} (
             crawl_domain TEXT,
             crawl_company_name TEXT,
             crawl_abn CHAR(20),
@@ -52,7 +57,7 @@ def store_matches_to_db(matches_df: pd.DataFrame):
             created_at TIMESTAMP DEFAULT NOW(),
             creation_dt TIMESTAMP DEFAULT NOW()
         );
-    """)
+    """
 
     expected_columns = [
         "crawl_domain", "crawl_company_name", "crawl_abn",
@@ -67,23 +72,20 @@ def store_matches_to_db(matches_df: pd.DataFrame):
 
     matches_df["creation_dt"] = pd.Timestamp.now()
 
-    execute_values(
-        cursor,
-        f"""
-        INSERT INTO prd_firmable.dwh.dim_entity_match_company_data (
-            {', '.join(expected_columns)}, creation_dt
-        ) VALUES %s
-        """,
-        matches_df[expected_columns + ["creation_dt"]].values.tolist()
-    )
-
-    conn.commit()
-    cursor.close()
+    columns = expected_columns + ["creation_dt"]
+    conn = psycopg2.connect(**DB_CONFIG)
+    replace_table(conn, "prd_firmable.dwh.dim_entity_match_company_data", columns,
+                  dataframe_rows(matches_df, columns), create_sql)
     conn.close()
     print(f"✅ {len(matches_df)} matched records saved to DB.")
 
 # ---------------- Fetch Helpers ---------------- #
-def fetch_crawl_data():
+ABR_MATCH_COLUMNS = ABR_BLOCK_SCHEMA.names
+
+
+def fetch_crawl_data(store=None):
+    if store is not None:
+        return store.read(COMMONCRAWL_CLEANED, columns=["domain", "company_name", "abn", "postcode"])
     conn = psycopg2.connect(**DB_CONFIG)
     df = pd.read_sql("""
         SELECT domain, company_name, abn, postcode 
@@ -92,22 +94,84 @@ def fetch_crawl_data():
     conn.close()
     return df
 
-def fetch_abr_chunk(offset=0, limit=50000):
+def fetch_abr_table(batch_size=50000) -> pa.Table:
+    """All cleaned ABR records, read in one query through a server-side cursor."""
     conn = psycopg2.connect(**DB_CONFIG)
-    query = f"""
-        SELECT abn, entity_name, entity_type, state, postcode
-        FROM prd_firmable.pre_dwh.cleaned_abr_companies
-        WHERE postcode IN (
-              SELECT DISTINCT postcode
-              FROM prd_firmable.pre_dwh.cleaned_commoncrawl_companies
-          )
-        ORDER BY abn
-        OFFSET {offset} ROWS
-        FETCH NEXT {limit} ROWS ONLY;
+    batches = []
+    try:
+        with conn.cursor(name="abr_records") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(f"""
+                SELECT {', '.join(ABR_MATCH_COLUMNS)}
+                FROM prd_firmable.pre_dwh.cleaned_abr_companies
+            """)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                batches.append(pa.Table.from_arrays([pa.array(values, pa.string()) for values in zip(*rows)],
+                                                    schema=ABR_BLOCK_SCHEMA))
+    finally:
+        conn.close()
+    return pa.concat_tables(batches) if batches else ABR_BLOCK_SCHEMA.empty_table()
+
+
+def read_abr_records(store=None, batch_size=50000) -> pa.Table:
     """
-    df = pd.read_sql(query, conn)
-    conn.close()
-    return df
+    All cleaned ABR records (ABR_BLOCK_SCHEMA), from the stage store or
+    Postgres. Unnamed ones (individuals and sole traders) are included: they
+    can still be matched on ABN.
+    """
+    if store is None:
+        return fetch_abr_table(batch_size)
+    table = store.dataset(ABR_CLEANED).to_table(columns=ABR_MATCH_COLUMNS)
+    return table.select(ABR_MATCH_COLUMNS).cast(ABR_BLOCK_SCHEMA)
+
+
+def load_name_store(store=None, batch_size=50000, directory=NAME_STORE_DIR) -> NameStore:
+    """The saved ABR name store if it is still current, else one built from the cleaned ABR records and saved."""
+    fingerprint = abr_fingerprint(store)
+    names = NameStore.open(directory, fingerprint)
+    if names is None:
+        names = NameStore.build(read_abr_records(store, batch_size), fingerprint)
+        names.save(directory)
+    return names
+
+
+def build_abr_index(crawl_df, name_store) -> PostcodeBlockIndex:
+    """Blocking index over the ABR records in the crawl postcodes, sliced from the name store."""
+    return PostcodeBlockIndex(name_store.blocks(crawl_df["postcode"].dropna().unique().tolist()))
+
+def abr_fingerprint(store=None) -> str:
+    """
+    Cheap identity of the cleaned ABR data, changing whenever it is reloaded
+    or upserted, so a saved token index is rebuilt only when needed.
+    """
+    if store is not None:
+        files = sorted(store.dataset(ABR_CLEANED).files)
+        stats = [(path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in files]
+        return "stage:" + hashlib.sha1(repr(stats).encode()).hexdigest()
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cursor:
+            # the oid changes on every full reload (table swap), count / max(created_at) on upserts
+            cursor.execute("""
+                SELECT 'prd_firmable.pre_dwh.cleaned_abr_companies'::regclass::oid, count(*), max(created_at)
+                FROM prd_firmable.pre_dwh.cleaned_abr_companies
+            """)
+            oid, count, latest = cursor.fetchone()
+    finally:
+        conn.close()
+    return f"postgres:{oid}:{count}:{latest}"
+
+
+def load_token_index(name_store, directory=TOKEN_INDEX_DIR) -> TokenIndex:
+    """The saved ABR token index if it matches the name store, else one built over its records and saved."""
+    index = TokenIndex.load(directory, name_store.fingerprint)
+    if index is None:
+        index = TokenIndex.build(name_store.records(), name_store.fingerprint)
+        index.save(directory)
+    return index
 
 # ---------------- Matching Functions ---------------- #
 def rule_based_match_sql():
@@ -134,123 +198,304 @@ def rule_based_match_sql():
     conn.close()
     return df
 
-def fuzzy_match(crawl_df, abr_df, threshold=80):
-    results = []
+def rule_based_match_stage(crawl_df, store):
+    """rule_based_match_sql over the stage store: ABN join, reading only ABR rows with a crawl ABN."""
+    crawl = crawl_df.dropna(subset=["abn"]).assign(abn_key=lambda df: df["abn"].str.strip())
+    abr = store.read(ABR_CLEANED, columns=ABR_MATCH_COLUMNS,
+                     filter=store.isin(ABR_CLEANED, "abn", crawl["abn_key"].unique()))
+    abr = abr.assign(abn_key=abr["abn"].str.strip())
+    merged = crawl.merge(abr, on="abn_key", suffixes=("_cc", "_abr"))
+    df = pd.DataFrame({
+        "crawl_domain": merged["domain"],
+        "crawl_company_name": merged["company_name"],
+        "crawl_abn": merged["abn_cc"],
+        "abr_abn": merged["abn_abr"],
+        "abr_company_name": merged["entity_name"],
+        "abr_entity_type": merged["entity_type"],
+        "abr_state": merged["state"],
+        "abr_postcode": merged["postcode_abr"],
+        "match_method": "rule_based_abn",
+        "match_score": 100.0,
+        "match_confidence": "high",
+    })
+    return df.drop_duplicates(ignore_index=True)
+
+def rule_based_match_local(crawl_df, name_store):
+    """
+    rule_based_match_sql without a database round-trip: crawl ABNs are joined
+    in process with the name store's sorted int64 ABNs. Same columns, one row
+    per distinct match, in crawl order.
+    """
+    crawl = crawl_df.reset_index(drop=True)
+    crawl_rows, abr_positions = name_store.match_abns(crawl["abn"].to_numpy(dtype=object))
+    crawl = crawl.iloc[crawl_rows]
+    abr = name_store.records(abr_positions).to_pandas()
+    df = pd.DataFrame({
+        "crawl_domain": crawl["domain"].to_numpy(),
+        "crawl_company_name": crawl["company_name"].to_numpy(),
+        "crawl_abn": crawl["abn"].to_numpy(),
+        "abr_abn": abr["abn"].to_numpy(),
+        "abr_company_name": abr["entity_name"].to_numpy(),
+        "abr_entity_type": abr["entity_type"].to_numpy(),
+        "abr_state": abr["state"].to_numpy(),
+        "abr_postcode": abr["postcode"].to_numpy(),
+        "match_method": "rule_based_abn",
+        "match_score": 100.0,
+        "match_confidence": "high",
+    })
+    return df.drop_duplicates(ignore_index=True)
+
+FUZZY_BLOCK_CELLS = 20_000_000  # score matrix cells (float64) computed per cdist call
+
+
+def best_matches(queries, choices, workers=-1, scorer=fuzz.token_sort_ratio):
+    """
+    Position and score (token_sort_ratio by default) of the best choice for
+    each query, the first one on ties (as process.extractOne). Queries are
+    scored in batches of at most FUZZY_BLOCK_CELLS matrix cells.
+    """
+    positions = np.empty(len(queries), dtype=np.int64)
+    scores = np.empty(len(queries), dtype=np.float64)
+    batch = max(1, FUZZY_BLOCK_CELLS // max(len(choices), 1))
+    for start in range(0, len(queries), batch):
+        matrix = process.cdist(queries[start:start + batch], choices, scorer=scorer,
+                               dtype=np.float64, workers=workers)
+        best = matrix.argmax(axis=1)
+        positions[start:start + batch] = best
+        scores[start:start + batch] = matrix[np.arange(len(best)), best]
+    return positions, scores
+
+
+def fuzzy_match(crawl_df, abr, threshold=80, workers=-1):
+    """
+    Best ABR name (token_sort_ratio) in the same postcode for each crawl
+    record, kept if it scores at least threshold. abr is a
+    PostcodeBlockIndex (or a DataFrame of ABR records to index). Crawl
+    records are blocked by postcode and each block is scored against its
+    complete ABR block in one cdist call over all cores; in ABR blocks over
+    the index's sub_block_size, crawl records are grouped by name keys and
+    scored only against the ABR records sharing one of them. Names are
+    compared token-sorted with fuzz.ratio, which is token_sort_ratio
+    without sorting the ABR names again for every comparison.
+    """
     if crawl_df.empty:
         return pd.DataFrame([]), crawl_df
+    index = abr if isinstance(abr, PostcodeBlockIndex) else PostcodeBlockIndex.from_dataframe(abr)
+
+    crawl = crawl_df.reset_index(drop=True)
+    crawl_names = crawl["company_name"].to_numpy(dtype=object)
+    crawl_sorted = np.array(sort_tokens(crawl_names).to_pylist(), dtype=object)
+    # Unnamed crawl records take no part (the index already leaves out unnamed ABR records).
+    crawl_blocks = crawl.groupby(crawl["postcode"].where(crawl["company_name"].notna()), sort=False).indices
+
+    best_pos = np.full(len(crawl), -1, dtype=np.int64)
+    best_score = np.full(len(crawl), -1.0)
+    for postcode, rows in crawl_blocks.items():
+        span = index.span(postcode)
+        if span is None:
+            continue
+        index.stats["full_comparisons"] += len(rows) * (span[1] - span[0])
+        if not index.is_oversized(postcode):
+            positions, scores = best_matches(crawl_sorted[rows].tolist(), index.names(postcode, "sort_name"),
+                                             workers, fuzz.ratio)
+            best_pos[rows] = span[0] + positions
+            best_score[rows] = scores
+            index.stats["comparisons"] += len(rows) * (span[1] - span[0])
+            continue
+        by_keys = {}
+        for row, keys in zip(rows, name_keys(crawl_names[rows].tolist())):
+            by_keys.setdefault(keys, []).append(row)
+        for keys, key_rows in by_keys.items():
+            candidates = index.candidates(postcode, keys)
+            if not len(candidates):
+                continue
+            positions, scores = best_matches(crawl_sorted[key_rows].tolist(),
+                                             index.names_at(candidates, "sort_name"), workers, fuzz.ratio)
+            best_pos[key_rows] = candidates[positions]
+            best_score[key_rows] = scores
+            index.stats["comparisons"] += len(key_rows) * len(candidates)
+
+    matched = best_score >= threshold
+    if not matched.any():
+        return pd.DataFrame([]), crawl_df
+    crawl_rows = crawl[matched]
+    abr_rows = index.rows(best_pos[matched])
+    scores = best_score[matched]
+    fuzzy_df = pd.DataFrame({
+        "crawl_domain": crawl_rows["domain"].to_numpy(),
+        "crawl_company_name": crawl_rows["company_name"].to_numpy(),
+        "crawl_abn": crawl_rows["abn"].to_numpy(),
+        "abr_abn": abr_rows["abn"].to_numpy(),
+        "abr_company_name": abr_rows["entity_name"].to_numpy(),
+        "abr_entity_type": abr_rows["entity_type"].to_numpy(),
+        "abr_state": abr_rows["state"].to_numpy(),
+        "abr_postcode": abr_rows["postcode"].to_numpy(),
+        "match_method": "fuzzy",
+        "match_score": scores,
+        "match_confidence": np.where(scores >= 92, "high", "medium"),
+    })
+
+    remaining_crawl = crawl_df[~crawl_df["domain"].isin(fuzzy_df["crawl_domain"])].copy()
+    return fuzzy_df, remaining_crawl
 
-    abr_df["entity_name_lower"] = abr_df["entity_name"].str.lower()
-    abr_grouped = abr_df.groupby("postcode")
+def token_match(crawl_df, token_index, threshold=90, k=DEFAULT_K):
+    """
+    Fallback for crawl records postcode blocking could not match: the top k
+    ABR records by shared name tokens (any postcode) are scored with
+    token_sort_ratio and the best kept if it scores at least threshold.
+    With no postcode agreement to back a name the threshold is stricter
+    than fuzzy_match's.
+    """
+    crawl = crawl_df[crawl_df["company_name"].notna()].reset_index(drop=True)
+    if crawl.empty or not len(token_index):
+        return pd.DataFrame([]), crawl_df
+    crawl_names = crawl["company_name"].tolist()
 
-    for _, crawl_row in crawl_df.iterrows():
-        postcode = crawl_row["postcode"]
-        if postcode not in abr_grouped.groups:
+    best_pos = np.full(len(crawl), -1, dtype=np.int64)
+    best_score = np.full(len(crawl), -1.0)
+    for row, shortlist in enumerate(token_index.candidates(crawl_names, k)):
+        if not len(shortlist):
             continue
+        positions, scores = best_matches([crawl_names[row]], token_index.names(shortlist), workers=1)
+        best_pos[row] = shortlist[positions[0]]
+        best_score[row] = scores[0]
 
-        abr_subset = abr_grouped.get_group(postcode)
-        match_name, score, abr_idx = process.extractOne(
-            crawl_row["company_name"], abr_subset["entity_name"].tolist(), scorer=fuzz.token_sort_ratio
-        )
-
-        if score >= threshold:
-            abr_row = abr_subset.iloc[abr_idx]
-            results.append({
-                "crawl_domain": crawl_row["domain"],
-                "crawl_company_name": crawl_row["company_name"],
-                "crawl_abn": crawl_row["abn"],
-                "abr_abn": abr_row["abn"],
-                "abr_company_name": abr_row["entity_name"],
-                "abr_entity_type": abr_row["entity_type"],
-                "abr_state": abr_row["state"],
-                "abr_postcode": abr_row["postcode"],
-                "match_method": "fuzzy",
-                "match_score": score,
-                "match_confidence": "high" if score >= 92 else "medium"
-            })
-
-    fuzzy_df = pd.DataFrame(results)
-    matched_domains = fuzzy_df["crawl_domain"].tolist() if not fuzzy_df.empty else []
-    remaining_crawl = crawl_df[~crawl_df["domain"].isin(matched_domains)].copy()
-    return fuzzy_df, remaining_crawl
+    matched = best_score >= threshold
+    if not matched.any():
+        return pd.DataFrame([]), crawl_df
+    crawl_rows = crawl[matched]
+    abr_rows = token_index.rows(best_pos[matched])
+    scores = best_score[matched]
+    token_df = pd.DataFrame({
+        "crawl_domain": crawl_rows["domain"].to_numpy(),
+        "crawl_company_name": crawl_rows["company_name"].to_numpy(),
+        "crawl_abn": crawl_rows["abn"].to_numpy(),
+        "abr_abn": abr_rows["abn"].to_numpy(),
+        "abr_company_name": abr_rows["entity_name"].to_numpy(),
+        "abr_entity_type": abr_rows["entity_type"].to_numpy(),
+        "abr_state": abr_rows["state"].to_numpy(),
+        "abr_postcode": abr_rows["postcode"].to_numpy(),
+        "match_method": "fuzzy_token",
+        "match_score": scores,
+        "match_confidence": np.where(scores >= 95, "high", "medium"),
+    })
+
+    remaining_crawl = crawl_df[~crawl_df["domain"].isin(token_df["crawl_domain"])].copy()
+    return token_df, remaining_crawl
 
 # ---------------- OpenAI LLM Matching ---------------- #
-def llm_match(crawl_df, abr_df):
-    """LLM-assisted matching using OpenAI GPT."""
-    if client is None or crawl_df.empty:
+LLM_SHORTLIST_K = 5
+
+def top_matches(queries, choices, k, workers=-1, scorer=fuzz.token_sort_ratio):
+    """Positions and scores of the k best choices for each query, best first (ties by position)."""
+    k = min(k, len(choices))
+    positions = np.empty((len(queries), k), dtype=np.int64)
+    scores = np.empty((len(queries), k), dtype=np.float64)
+    batch = max(1, FUZZY_BLOCK_CELLS // max(len(choices), 1))
+    for start in range(0, len(queries), batch):
+        matrix = process.cdist(queries[start:start + batch], choices, scorer=scorer,
+                               dtype=np.float64, workers=workers)
+        best = np.argsort(-matrix, axis=1, kind="stable")[:, :k]
+        positions[start:start + batch] = best
+        scores[start:start + batch] = np.take_along_axis(matrix, best, axis=1)
+    return positions, scores
+
+def _candidate(record, score):
+    return {"abn": record["abn"], "name": record["entity_name"], "entity_type": record["entity_type"],
+            "state": record["state"], "postcode": record["postcode"], "score": float(score)}
+
+def llm_shortlists(crawl_df, abr, token_index=None, k=LLM_SHORTLIST_K, workers=-1):
+    """
+    Up to k candidate ABR records per crawl record for the LLM to choose
+    from, best token_sort_ratio first: the best names of its postcode block
+    (sub-blocked by name keys as in fuzzy_match) and, given a token index,
+    of the records sharing its rarest name tokens. One list of candidate
+    dicts (abn, name, entity_type, state, postcode, score) per crawl row;
+    empty for unnamed records. ABR records without an ABN are never
+    candidates: there would be nothing to match to.
+    """
+    index = abr if isinstance(abr, PostcodeBlockIndex) else PostcodeBlockIndex.from_dataframe(abr)
+    has_abn = index.table.column("abn").is_valid().to_numpy(zero_copy_only=False)
+    crawl = crawl_df.reset_index(drop=True)
+    crawl_names = crawl["company_name"].to_numpy(dtype=object)
+    crawl_sorted = np.array(sort_tokens(crawl_names).to_pylist(), dtype=object)
+    found = [{} for _ in range(len(crawl))]  # abn -> candidate, per crawl row
+
+    groups = []  # (crawl rows, ABR index positions to score them against)
+    for postcode, rows in crawl.groupby(crawl["postcode"].where(crawl["company_name"].notna()), sort=False).indices.items():
+        span = index.span(postcode)
+        if span is None:
+            continue
+        if not index.is_oversized(postcode):
+            groups.append((rows, np.arange(*span)))
+            continue
+        by_keys = {}
+        for row, keys in zip(rows, name_keys(crawl_names[rows].tolist())):
+            by_keys.setdefault(keys, []).append(row)
+        groups.extend((np.array(key_rows), index.candidates(postcode, keys)) for keys, key_rows in by_keys.items())
+    for rows, positions in groups:
+        positions = positions[has_abn[positions]]
+        if not len(positions):
+            continue
+        best, scores = top_matches(crawl_sorted[rows].tolist(), index.names_at(positions, "sort_name"), k,
+                                   workers, fuzz.ratio)
+        records = index.rows(positions[best].ravel()).to_dict(orient="records")
+        for (row, score), record in zip(np.broadcast(rows[:, None], scores), records):
+            found[row][record["abn"]] = _candidate(record, score)
+
+    if token_index is not None:
+        for row, shortlist in enumerate(token_index.candidates(crawl_names.tolist())):
+            if not len(shortlist) or pd.isna(crawl_names[row]):
+                continue
+            records = token_index.rows(shortlist).to_dict(orient="records")
+            records = [record for record in records if not pd.isna(record["abn"])]
+            for _, score, i in process.extract(crawl_names[row], [r["entity_name"] for r in records],
+                                               scorer=fuzz.token_sort_ratio, limit=k):
+                if score > found[row].get(records[i]["abn"], {"score": -1})["score"]:
+                    found[row][records[i]["abn"]] = _candidate(records[i], score)
+
+    return [sorted(candidates.values(), key=lambda c: -c["score"])[:k] for candidates in found]
+
+def llm_match(crawl_df, abr, token_index=None, matcher=None, k=LLM_SHORTLIST_K):
+    """
+    LLM review of crawl records the other steps left unmatched. Each record
+    is sent with only its llm_shortlists candidates, many records per
+    request, through matcher (an LLMMatcher: concurrency, rate limits and
+    the run budget; one on the OpenAI client by default). Matches the model
+    gives low confidence are not kept.
+    """
+    if matcher is None and client is not None:
+        matcher = LLMMatcher(client)
+    if matcher is None or crawl_df.empty:
         return pd.DataFrame([]), crawl_df
 
-    results = []
+    crawl = crawl_df.reset_index(drop=True)
+    shortlists = llm_shortlists(crawl, abr, token_index, k)
+    records = [{"domain": domain, "name": name, "postcode": None if pd.isna(postcode) else postcode,
+                "candidates": shortlist}
+               for domain, name, postcode, shortlist in zip(crawl["domain"], crawl["company_name"],
+                                                            crawl["postcode"], shortlists)]
+    answers = matcher.match(records)
 
-    for _, crawl_row in crawl_df.iterrows():
-        # Build prompt for GPT
-        prompt = f"""
-        You are an expert in Australian business entity resolution. Your task is to determine if web data and official business register data refer to the same company.
-
-        CONTEXT:
-        - Common Crawl data is extracted from company websites (may have informal names, abbreviations)
-        - ABR data is from Australian Business Register (official legal names, may be formal)
-        - Australian companies often trade under different names than their legal registration
-        - Consider common variations: "Pty Ltd" vs "Proprietary Limited", abbreviations, "The" prefix
-
-        MATCHING GUIDELINES:
-        1. Strong match indicators:
-        - ABN found on website matches ABR record exactly (if available)
-        - Domain name clearly derives from entity name
-        - Address match (same suburb/postcode is strong signal)
-        - Trading name listed in ABR matches website name
-
-        2. Weak match indicators:
-        - Similar industry only
-        - Similar name but different legal structure
-        - Geographic proximity only
-
-        3. Non-match indicators:
-        - Completely different business activities
-        - Different states with no connection
-        - Name similarity is coincidental (e.g., "Smith Consulting" is common)
-
-        EXAMPLES:
-
-        Example 1 - MATCH:
-        Website: "acmewidgets.com.au", Name: "Acme Widgets", Location: "Sydney NSW"
-        ABR: ABN 12-345-678-901, Name: "ACME WIDGETS PTY LTD", Location: "Sydney NSW 2000"
-        Reasoning: Domain matches entity name closely, same city. The website uses informal trading name while ABR has formal legal name.
-        Decision: MATCH, Confidence: HIGH
-        Here are the details..
-        
-        Company: {crawl_row['company_name']} 
-        Postcode: {crawl_row['postcode']}
-        ABR options: {abr_df[['entity_name','abn','postcode']].to_dict(orient='records')}
-        Return only the best matching ABR record ABN if confident, otherwise return None.
-        """
-
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
-            gpt_result = response.choices[0].message.content.strip()
-            if gpt_result.lower() != "none":
-                # Example output parsing: assume ABN returned
-                matched_abn = gpt_result
-                abr_row = abr_df[abr_df['abn'] == matched_abn].iloc[0]
-                results.append({
-                    "crawl_domain": crawl_row["domain"],
-                    "crawl_company_name": crawl_row["company_name"],
-                    "crawl_abn": crawl_row["abn"],
-                    "abr_abn": abr_row["abn"],
-                    "abr_company_name": abr_row["entity_name"],
-                    "abr_entity_type": abr_row["entity_type"],
-                    "abr_state": abr_row["state"],
-                    "abr_postcode": abr_row["postcode"],
-                    "match_method": "LLM",
-                    "match_score": 95.0,
-                    "match_confidence": "medium"
-                })
-        except Exception as e:
-            print(f"⚠️ LLM match failed for {crawl_row['company_name']}: {e}")
+    results = []
+    for row in sorted(answers):
+        abn, confidence = answers[row]
+        if confidence not in ("high", "medium"):
             continue
+        candidate = next(c for c in shortlists[row] if c["abn"] == abn)
+        results.append({
+            "crawl_domain": crawl.at[row, "domain"],
+            "crawl_company_name": crawl.at[row, "company_name"],
+            "crawl_abn": crawl.at[row, "abn"],
+            "abr_abn": candidate["abn"],
+            "abr_company_name": candidate["name"],
+            "abr_entity_type": candidate["entity_type"],
+            "abr_state": candidate["state"],
+            "abr_postcode": candidate["postcode"],
+            "match_method": "LLM",
+            "match_score": 95.0,
+            "match_confidence": confidence,
+        })
 
     llm_df = pd.DataFrame(results)
     matched_domains = llm_df["crawl_domain"].tolist() if not llm_df.empty else []
@@ -258,41 +503,70 @@ def llm_match(crawl_df, abr_df):
     return llm_df, remaining_crawl
 
 # ---------------- Main Pipeline ---------------- #
-def run_entity_matching_chunked(batch_size=50000, enable_llm=False):
-    crawl_df = fetch_crawl_data()
-    offset = 0
+def run_entity_matching_chunked(batch_size=50000, enable_llm=False, store=None, abn_join="local"):
+    """
+    Match crawl records to ABR records; with a stage store the inputs are
+    read from Parquet stages. The cleaned ABR records are read (batch_size
+    rows per fetch) into the name store only when they have changed since it
+    was built. ABNs are joined against it in process (abn_join="sql" joins
+    in Postgres, or over the stage with pyarrow, instead); the postcode
+    blocking index is sliced from it, and records left unmatched go through
+    the ABR token index (saved under TOKEN_INDEX_DIR, rebuilt along with the
+    name store). With enable_llm the rest are reviewed by llm_match, within
+    the LLM_MAX_REQUESTS / LLM_MAX_TOKENS budget.
+    """
+    crawl_df = fetch_crawl_data(store)
     final_matches = []
 
-    # --- Step 1: Rule-based SQL matches ---
-    print("Performing rule-based SQL match...")
-    rule_matches = rule_based_match_sql()
+    print("Opening ABR name store...")
+    name_store = load_name_store(store=store, batch_size=batch_size)
+    print(name_store.summary())
+
+    # --- Step 1: Rule-based ABN matches ---
+    if abn_join == "local":
+        print("Performing rule-based ABN match (in process)...")
+        rule_matches = rule_based_match_local(crawl_df, name_store)
+    else:
+        print("Performing rule-based SQL match...")
+        rule_matches = rule_based_match_sql() if store is None else rule_based_match_stage(crawl_df, store)
     print(f"Rule-based matches found: {len(rule_matches)}")
     if not rule_matches.empty:
         final_matches.append(rule_matches)
         matched_domains = rule_matches["crawl_domain"].tolist()
         crawl_df = crawl_df[~crawl_df["domain"].isin(matched_domains)].copy()
 
-    # --- Step 2: Process in chunks for fuzzy / LLM ---
-    while not crawl_df.empty:
-        print(f"Fetching ABR chunk offset={offset}")
-        abr_chunk = fetch_abr_chunk(offset=offset, limit=batch_size)
-        if abr_chunk.empty:
-            break
+    # --- Step 2: Fuzzy / LLM match per postcode block ---
+    if not crawl_df.empty:
+        abr_index = build_abr_index(crawl_df, name_store)
+        print(abr_index.summary())
 
-        # Fuzzy match only remaining rows
         print("  Performing fuzzy match...")
-        fuzzy_matches, crawl_df = fuzzy_match(crawl_df, abr_chunk)
+        fuzzy_matches, crawl_df = fuzzy_match(crawl_df, abr_index)
+        print(abr_index.scoring_summary())
         if not fuzzy_matches.empty:
             final_matches.append(fuzzy_matches)
 
-        # Optional LLM match
+        # Records with no (or the wrong) postcode: shortlist by name tokens across all ABR records
+        token_index = None
+        if not crawl_df.empty:
+            print("  Performing token index match...")
+            token_index = load_token_index(name_store)
+            print(token_index.summary())
+            token_matches, crawl_df = token_match(crawl_df, token_index)
+            if not token_matches.empty:
+                final_matches.append(token_matches)
+
+        # Optional LLM review of what is left, with a fuzzy shortlist per record
         if enable_llm and not crawl_df.empty:
-            print("  Performing LLM match...")
-            llm_matches, crawl_df = llm_match(crawl_df, abr_chunk)
-            if not llm_matches.empty:
-                final_matches.append(llm_matches)
-
-        offset += batch_size
+            if client is None:
+                print("  Skipping LLM match: OPENAI_API_KEY is not set")
+            else:
+                print("  Performing LLM match...")
+                matcher = LLMMatcher(client)
+                llm_matches, crawl_df = llm_match(crawl_df, abr_index, token_index, matcher)
+                print(matcher.summary())
+                if not llm_matches.empty:
+                    final_matches.append(llm_matches)
 
     final_df = pd.concat(final_matches, ignore_index=True) if final_matches else pd.DataFrame([])
     print(f"\n Total Matches: {len(final_df)}")
@@ -300,4 +574,4 @@ def run_entity_matching_chunked(batch_size=50000, enable_llm=False):
 
 # ---------------- Entrypoint ---------------- #
 if __name__ == "__main__":
-    run_entity_matching_chunked(batch_size=50000, enable_llm=False)
+    run_entity_matching_chunked(batch_size=50000, enable_llm=False, store=default_store())
@@ -0,0 +1,204 @@
+"""
+llm_matcher.py
+--------------
+Batched, concurrent LLM adjudication of crawl records against a shortlist of
+candidate ABR records, for the records fuzzy and token matching leave over.
+
+1. Each record carries only its own shortlist (the top few ABR names by
+   fuzzy score, built in entity_matching.llm_shortlists), never a whole ABR
+   block, and records_per_request records share one request.
+2. The model answers with JSON following RESPONSE_SCHEMA (one ABN or null
+   per record id). Answers naming an ABN outside that record's shortlist
+   are dropped.
+3. At most max_in_flight requests run at once, paced by a RateLimiter of
+   requests and tokens per minute (token counts estimated from the prompt
+   size, then corrected with the usage the API reports).
+4. A run stops sending once max_requests or max_tokens would be exceeded;
+   the records not sent stay unmatched and are counted in stats.
+"""
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_MAX_REQUESTS = int(os.getenv("LLM_MAX_REQUESTS", 1_000))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", 2_000_000))
+RECORDS_PER_REQUEST = 20
+CHARS_PER_TOKEN = 4  # prompt size estimate; the API's usage figures correct it afterwards
+COMPLETION_TOKENS_PER_RECORD = 40
+
+SYSTEM_PROMPT = """You are an expert in Australian business entity resolution. For each web record, decide which of its ABR candidates (if any) is the same company.
+
+- Web records come from company websites and may use informal trading names or abbreviations; ABR names are official legal names.
+- Strong signals: the domain derives from the entity name, the same postcode, a trading name matching the legal name ("Acme Widgets" / "ACME WIDGETS PTY LTD").
+- Weak or non-match signals: a similar but common name ("Smith Consulting"), a different state with no other connection, geographic proximity only.
+- Only choose an ABN listed among that record's candidates. Answer null unless confident.
+
+Input: JSON {"records": [{"id", "domain", "name", "postcode", "candidates": [{"abn", "name", "postcode", "state"}]}]}.
+Answer for every record id."""
+
+RESPONSE_SCHEMA = {
+    "name": "entity_matches",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "matches": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "integer"},
+                        "abn": {"type": ["string", "null"]},
+                        "confidence": {"type": "string", "enum": ["high", "medium", "low"]},
+                    },
+                    "required": ["id", "abn", "confidence"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["matches"],
+        "additionalProperties": False,
+    },
+}
+
+
+# ------------------- Rate Limiting ------------------- #
+class RateLimiter:
+    """Token buckets of requests and tokens per minute, refilled continuously and shared by all workers."""
+
+    def __init__(self, requests_per_minute: int = 500, tokens_per_minute: int = 200_000,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.capacity = [float(requests_per_minute), float(tokens_per_minute)]
+        self.available = list(self.capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        elapsed, self._updated = now - self._updated, now
+        self.available = [min(cap, level + elapsed * cap / 60) for cap, level in zip(self.capacity, self.available)]
+
+    def acquire(self, tokens: int):
+        """Wait until one request of about `tokens` tokens fits in both buckets, then take it."""
+        # a request larger than the whole bucket would otherwise never fit
+        needed = [1.0, min(float(tokens), self.capacity[1])]
+        while True:
+            with self._lock:
+                self._refill()
+                if all(level >= need for level, need in zip(self.available, needed)):
+                    self.available = [level - need for level, need in zip(self.available, needed)]
+                    return
+                wait = max((need - level) * 60 / cap
+                           for cap, level, need in zip(self.capacity, self.available, needed))
+            self.sleep(wait)
+
+    def correct(self, estimated: int, used: int):
+        """Return (or take) the difference between a request's estimated and reported tokens."""
+        with self._lock:
+            self.available[1] = min(self.capacity[1], self.available[1] + estimated - used)
+
+
+# ------------------- Matcher ------------------- #
+class LLMMatcher:
+    def __init__(self, client, model: str = LLM_MODEL, records_per_request: int = RECORDS_PER_REQUEST,
+                 max_in_flight: int = 8, rate_limiter: RateLimiter = None,
+                 max_requests: int = LLM_MAX_REQUESTS, max_tokens: int = LLM_MAX_TOKENS):
+        self.client = client
+        self.model = model
+        self.records_per_request = records_per_request
+        self.max_in_flight = max_in_flight
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        self.stats = {"requests": 0, "records": 0, "tokens": 0, "matches": 0, "errors": 0, "skipped": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _reserve(self, tokens: int) -> bool:
+        """Book a request against the run budget, or refuse it if the budget would be exceeded."""
+        with self._lock:
+            if self.stats["requests"] >= self.max_requests or self.stats["tokens"] + tokens > self.max_tokens:
+                return False
+            self.stats["requests"] += 1
+            self.stats["tokens"] += tokens
+            return True
+
+    def _messages(self, batch) -> list:
+        records = [{"id": i, "domain": r["domain"], "name": r["name"], "postcode": r["postcode"],
+                    "candidates": [{key: c[key] for key in ("abn", "name", "postcode", "state")}
+                                   for c in r["candidates"]]}
+                   for i, r in enumerate(batch)]
+        return [{"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": json.dumps({"records": records}, separators=(",", ":"))}]
+
+    @staticmethod
+    def parse(content: str, batch) -> dict:
+        """{batch position: (abn, confidence)} of the answers naming one of that record's candidates."""
+        answers = json.loads(content).get("matches", [])
+        found = {}
+        for answer in answers:
+            i, abn = answer.get("id"), answer.get("abn")
+            if abn is None or not isinstance(i, int) or not 0 <= i < len(batch):
+                continue
+            if abn in {c["abn"] for c in batch[i]["candidates"]}:
+                found[i] = (abn, answer.get("confidence", "low"))
+        return found
+
+    def match_batch(self, batch) -> dict:
+        """One request for a batch of records: {batch position: (abn, confidence)}; {} if refused or failed."""
+        messages = self._messages(batch)
+        completion_tokens = COMPLETION_TOKENS_PER_RECORD * len(batch) + 20
+        estimated = sum(len(m["content"]) for m in messages) // CHARS_PER_TOKEN + completion_tokens
+        if not self._reserve(estimated):
+            self._count("skipped", len(batch))
+            return {}
+        self.rate_limiter.acquire(estimated)
+        used = estimated
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model, messages=messages, temperature=0, max_completion_tokens=completion_tokens,
+                response_format={"type": "json_schema", "json_schema": RESPONSE_SCHEMA})
+            if response.usage is not None:
+                used = response.usage.total_tokens
+            found = self.parse(response.choices[0].message.content, batch)
+        except Exception as e:
+            self._count("errors")
+            print(f"⚠️ LLM match failed for a batch of {len(batch)} records: {e}")
+            return {}
+        finally:
+            self.rate_limiter.correct(estimated, used)
+            self._count("tokens", used - estimated)
+        self._count("records", len(batch))
+        self._count("matches", len(found))
+        return found
+
+    def match(self, records) -> dict:
+        """
+        records: dicts with domain, name, postcode and candidates (dicts with
+        abn, name, postcode, state). Returns {record position: (abn,
+        confidence)} for the records the model matched.
+        """
+        positions = [i for i, r in enumerate(records) if r["candidates"]]
+        batches = [positions[start:start + self.records_per_request]
+                   for start in range(0, len(positions), self.records_per_request)]
+        found = {}
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            futures = [(batch, pool.submit(self.match_batch, [records[i] for i in batch])) for batch in batches]
+            for batch, future in futures:
+                found.update({batch[i]: answer for i, answer in future.result().items()})
+        return found
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"LLM matching: {s['requests']:,} requests for {s['records']:,} records, {s['tokens']:,} tokens, "
+                f"{s['matches']:,} matches ({s['errors']:,} failed requests, "
+                f"{s['skipped']:,} records over budget)")
@@ -0,0 +1,196 @@
+"""
+name_store.py
+-------------
+Match-ready copy of the cleaned ABR records, built once per ABR release and
+memory-mapped by every matching run instead of re-reading and re-deriving
+3M names from Postgres or the stage store.
+
+1. One Arrow IPC file, uncompressed, so opening it maps the file and reads
+   nothing; a postcode block is a zero-copy slice.
+2. Compact columns: ABN as int64; postcode, state and entity type as
+   small-int dictionary codes (the postcode text is kept exactly as
+   cleaned, so "800" and "0800" stay different blocks, as in SQL); the
+   cleaned name and its token-sorted form (blocking.sort_tokens, what
+   token_sort_ratio compares).
+3. Records are sorted by postcode then ABN, and the postcode dictionary is
+   sorted, so block spans are found by binary search on its codes. For
+   exact ABN matching an ABN-sorted view (sorted int64 ABNs and their row
+   positions) is built on first use and crawl ABNs are joined against it
+   with searchsorted.
+4. The file records a fingerprint of the ABR data it was built from and is
+   rebuilt only when that changes (python -m transform.name_store builds it
+   for the configured store).
+"""
+
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from transform.blocking import ABR_BLOCK_SCHEMA, sort_tokens
+
+NAME_STORE_DIR = os.getenv("NAME_STORE_DIR", ".cache/name_store")
+NAME_STORE_FILE = "abr_names.arrow"
+NAME_STORE_FORMAT = "3"  # stores written in another layout are rebuilt
+
+
+def _encode_postcodes(postcodes) -> pa.DictionaryArray:
+    """Postcode text as codes into its sorted distinct values (null stays null)."""
+    postcodes = postcodes.combine_chunks() if isinstance(postcodes, pa.ChunkedArray) else postcodes
+    values = pc.unique(postcodes.drop_null())
+    values = values.take(pc.sort_indices(values))
+    index_type = pa.int16() if len(values) <= np.iinfo(np.int16).max else pa.int32()
+    codes = pc.cast(pc.index_in(postcodes, value_set=values), index_type)
+    return pa.DictionaryArray.from_arrays(codes, values)
+
+
+def encode_abns(abns) -> pa.Array:
+    """
+    ABNs as int64, trimmed of spaces (as TRIM in SQL). Values that would not
+    turn back into the same text (non-digits, a leading zero, over 18
+    digits) become null, so equal integers mean equal ABN text.
+    """
+    if not isinstance(abns, (pa.Array, pa.ChunkedArray)):
+        abns = pa.array(list(abns), pa.string(), from_pandas=True)
+    abns = pc.utf8_trim(abns.cast(pa.string()), " ")
+    digits = pc.match_substring_regex(abns, r"^[1-9][0-9]{0,17}$")
+    return pc.cast(pc.if_else(digits, abns, pa.scalar(None, pa.string())), pa.int64())
+
+
+class NameStore:
+    def __init__(self, table: pa.Table, fingerprint: str = ""):
+        self.table = table
+        self.fingerprint = fingerprint
+        postcodes = table.column("postcode").combine_chunks()
+        # sorted codes, null (-1) first; code of each postcode text
+        self._postcodes = pc.fill_null(postcodes.indices, -1).to_numpy()
+        self._postcode_codes = {value: code for code, value in enumerate(postcodes.dictionary.to_pylist())}
+        self._abn_view = None
+
+    @classmethod
+    def build(cls, records: pa.Table, fingerprint: str = "") -> "NameStore":
+        """
+        records: cleaned ABR records with ABR_BLOCK_SCHEMA columns. Unnamed
+        ones are kept for the ABN join; the blocking and token indexes leave
+        them out.
+        """
+        records = records.select(ABR_BLOCK_SCHEMA.names).cast(ABR_BLOCK_SCHEMA).combine_chunks()
+        table = pa.table({
+            "abn": encode_abns(records["abn"]),
+            "postcode": _encode_postcodes(records["postcode"]),
+            "state": pc.dictionary_encode(records["state"]).cast(pa.dictionary(pa.int8(), pa.string())),
+            "entity_type": pc.dictionary_encode(records["entity_type"]).cast(pa.dictionary(pa.int16(), pa.string())),
+            "entity_name": records["entity_name"],
+            "sort_name": sort_tokens(records["entity_name"]),
+        })
+        codes = pc.fill_null(table["postcode"].combine_chunks().indices, -1)
+        order = pc.sort_indices(pa.table({"postcode": codes, "abn": table["abn"]}),
+                                sort_keys=[("postcode", "ascending"), ("abn", "ascending")])
+        return cls(table.take(order).combine_chunks(), fingerprint)
+
+    def __len__(self):
+        return self.table.num_rows
+
+    # ------------------- Lookup ------------------- #
+    def spans(self, postcodes) -> np.ndarray:
+        """(start, end) positions of each postcode's records; empty for unknown ones."""
+        codes = np.array([self._postcode_codes.get(p, -2) if isinstance(p, str) else -2 for p in postcodes],
+                         dtype=self._postcodes.dtype)
+        # searched with keys of the column's dtype: mixed types would cast the whole column on every call
+        spans = np.stack([np.searchsorted(self._postcodes, codes, side="left"),
+                          np.searchsorted(self._postcodes, codes, side="right")], axis=1)
+        spans[codes < 0] = 0
+        return spans
+
+    def span(self, postcode):
+        start, end = self.spans([postcode])[0]
+        return int(start), int(end)
+
+    def abn_view(self):
+        """(sorted int64 ABNs, row position of each), the records without a usable ABN left out."""
+        if self._abn_view is None:
+            abns = self.table.column("abn")
+            positions = np.flatnonzero(pc.is_valid(abns).to_numpy(zero_copy_only=False))
+            values = pc.fill_null(abns, 0).to_numpy()[positions]
+            order = np.argsort(values, kind="stable")
+            self._abn_view = values[order], positions[order]
+        return self._abn_view
+
+    def match_abns(self, abns):
+        """
+        Equi-join of ABN strings with the stored ABNs: (index into abns,
+        store row position) for every matching pair, in abns order.
+        """
+        sorted_abns, positions = self.abn_view()
+        keys = encode_abns(abns)
+        queries = np.flatnonzero(pc.is_valid(keys).to_numpy(zero_copy_only=False))
+        values = pc.fill_null(keys, 0).to_numpy()[queries]
+        # probing in sorted order keeps the binary searches cache-friendly (~6x on 1M probes of 3M ABNs)
+        order = np.argsort(values, kind="stable")
+        starts, ends = np.empty_like(order), np.empty_like(order)
+        starts[order] = np.searchsorted(sorted_abns, values[order], side="left")
+        ends[order] = np.searchsorted(sorted_abns, values[order], side="right")
+        counts = ends - starts
+        # expand each query to its run of equal ABNs
+        pair_query = np.repeat(queries, counts)
+        run_offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return pair_query, positions[np.repeat(starts, counts) + run_offsets]
+
+    def decode(self, table: pa.Table) -> pa.Table:
+        """Records in ABR_BLOCK_SCHEMA (strings, as the cleaned tables hold them) plus sort_name."""
+        return pa.table({
+            "abn": pc.cast(table.column("abn"), pa.string()),
+            "entity_name": table.column("entity_name"),
+            "entity_type": pc.cast(table.column("entity_type"), pa.string()),
+            "state": pc.cast(table.column("state"), pa.string()),
+            "postcode": pc.cast(table.column("postcode"), pa.string()),
+            "sort_name": table.column("sort_name"),
+        })
+
+    def blocks(self, postcodes) -> pa.Table:
+        """Decoded records of the given postcodes, in postcode then ABN order."""
+        spans = sorted({(int(start), int(end)) for start, end in self.spans(list(postcodes)) if end > start})
+        slices = [self.table.slice(start, end - start) for start, end in spans]
+        return self.decode(pa.concat_tables(slices) if slices else self.table.slice(0, 0))
+
+    def records(self, positions=None) -> pa.Table:
+        """All records (or those at positions), decoded."""
+        return self.decode(self.table if positions is None else self.table.take(pa.array(positions, pa.int64())))
+
+    # ------------------- Persistence ------------------- #
+    def save(self, directory: str = NAME_STORE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, NAME_STORE_FILE)
+        table = self.table.replace_schema_metadata({"fingerprint": self.fingerprint, "format": NAME_STORE_FORMAT})
+        with pa.OSFile(f"{path}.{os.getpid()}.part", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(f"{path}.{os.getpid()}.part", path)
+
+    @classmethod
+    def open(cls, directory: str = NAME_STORE_DIR, fingerprint: str = None):
+        """The memory-mapped store, or None if there is none or it was built from other data than `fingerprint`."""
+        path = os.path.join(directory, NAME_STORE_FILE)
+        if not os.path.exists(path):
+            return None
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        metadata = reader.schema.metadata or {}
+        saved = metadata.get(b"fingerprint", b"").decode()
+        if metadata.get(b"format", b"").decode() != NAME_STORE_FORMAT:
+            return None
+        if fingerprint is not None and saved != fingerprint:
+            return None
+        return cls(reader.read_all(), saved)
+
+    def summary(self) -> str:
+        known = self._postcodes[self._postcodes >= 0]
+        postcodes = np.count_nonzero(np.diff(known)) + 1 if len(known) else 0
+        return f"ABR name store: {len(self):,} records, {postcodes:,} postcodes, {self.table.nbytes / 1e6:.1f} MB"
+
+
+if __name__ == "__main__":
+    from db.stage_store import default_store
+    from transform.entity_matching import load_name_store
+
+    print(load_name_store(store=default_store()).summary())
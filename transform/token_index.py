@@ -0,0 +1,152 @@
+"""
+token_index.py
+--------------
+Inverted index over ABR name tokens, giving a shortlist of candidate ABR
+records for crawl records that postcode blocking cannot place (postcode
+missing, wrong, or with no good name in its block).
+
+1. Names are tokenised with blocking.name_tokens (upper case,
+   non-alphanumerics to spaces). Legal-form and filler words (STOP_WORDS:
+   PTY, LTD, TRUST, ...) are dropped: they appear in most names and say
+   nothing about which company it is.
+2. Postings (record ids per token) are stored CSR-style in numpy arrays,
+   with an IDF weight per token. Tokenising and building are vectorised
+   with Arrow compute, so millions of names index in seconds.
+3. A query scores each record by the summed IDF of the query tokens it
+   shares, rarest tokens first, capped at max_postings postings, and
+   returns the top k records for full rapidfuzz scoring.
+4. The index and its records (Arrow IPC, memory-mapped on load) are saved
+   under a directory together with a fingerprint of the source data, and
+   reused until the fingerprint changes.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from transform.blocking import ABR_BLOCK_SCHEMA, name_tokens
+
+TOKEN_INDEX_DIR = os.getenv("TOKEN_INDEX_DIR", ".cache/token_index")
+DEFAULT_K = 50
+MAX_POSTINGS = 50_000
+
+class TokenIndex:
+    def __init__(self, vocab, token_ptr, doc_ids, idf, records: pa.Table, fingerprint: str = ""):
+        self.vocab = list(vocab)
+        self.token_ids = {token: i for i, token in enumerate(self.vocab)}
+        self.token_ptr = token_ptr
+        self.doc_ids = doc_ids
+        self.idf = idf
+        self.records = records
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, records: pa.Table, fingerprint: str = "") -> "TokenIndex":
+        """Index records (ABR_BLOCK_SCHEMA columns) on their entity_name tokens."""
+        records = records.select(ABR_BLOCK_SCHEMA.names).cast(ABR_BLOCK_SCHEMA)
+        records = records.filter(pc.is_valid(records["entity_name"])).combine_chunks()
+        n_docs = records.num_rows
+        stride = max(n_docs, 1)
+        positions, tokens = name_tokens(records["entity_name"])
+        encoded = pc.dictionary_encode(tokens)
+        vocab = encoded.dictionary.to_pylist()
+        # unique (token, record) pairs, sorted by token then record
+        keys = np.sort(encoded.indices.to_numpy().astype(np.int64) * stride + positions)
+        keys = keys[np.r_[True, keys[1:] != keys[:-1]]] if len(keys) else keys
+        token_of = keys // stride
+        doc_ids = (keys % stride).astype(np.int32)
+        counts = np.bincount(token_of, minlength=len(vocab))
+        token_ptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        idf = np.log((1 + n_docs) / (1 + counts)) + 1.0
+        return cls(vocab, token_ptr, doc_ids, idf, records, fingerprint)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, fingerprint: str = "") -> "TokenIndex":
+        return cls.build(pa.Table.from_pandas(df[ABR_BLOCK_SCHEMA.names], schema=ABR_BLOCK_SCHEMA,
+                                              preserve_index=False), fingerprint)
+
+    def __len__(self):
+        return self.records.num_rows
+
+    # ------------------- Queries ------------------- #
+    def _query_tokens(self, names):
+        positions, tokens = name_tokens(names)
+        per_query = [[] for _ in range(len(names))]
+        for position, token in zip(positions.tolist(), tokens.to_pylist()):
+            token_id = self.token_ids.get(token)
+            if token_id is not None:
+                per_query[position].append(token_id)
+        return per_query
+
+    def _shortlist(self, token_ids, k, max_postings):
+        token_ids = sorted(set(token_ids), key=lambda t: (-self.idf[t], t))
+        lengths = [int(self.token_ptr[t + 1] - self.token_ptr[t]) for t in token_ids]
+        used, total = [], 0
+        for token_id, length in zip(token_ids, lengths):
+            if used and total + length > max_postings:
+                break
+            used.append(token_id)
+            total += length
+        if not used:
+            return np.empty(0, dtype=np.int64)
+        docs = np.concatenate([self.doc_ids[self.token_ptr[t]:self.token_ptr[t + 1]] for t in used])
+        weights = np.repeat(self.idf[used], [self.token_ptr[t + 1] - self.token_ptr[t] for t in used])
+        # sum the weights per record (sorting beats np.unique's hashing here)
+        order = np.argsort(docs, kind="stable")
+        docs, weights = docs[order], weights[order]
+        starts = np.flatnonzero(np.r_[True, docs[1:] != docs[:-1]])
+        scores = np.add.reduceat(weights, starts)
+        best = np.argsort(-scores, kind="stable")[:k]
+        return docs[starts[best]].astype(np.int64)
+
+    def candidates(self, names, k: int = DEFAULT_K, max_postings: int = MAX_POSTINGS):
+        """For each name, the positions of up to k records sharing its rarest tokens, best first."""
+        return [self._shortlist(token_ids, k, max_postings) for token_ids in self._query_tokens(list(names))]
+
+    def names(self, positions) -> list:
+        return self.records.column("entity_name").take(pa.array(positions, pa.int64())).to_pylist()
+
+    def rows(self, positions) -> pd.DataFrame:
+        """Records at the given positions as a DataFrame."""
+        return self.records.take(pa.array(positions, pa.int64())).to_pandas()
+
+    # ------------------- Persistence ------------------- #
+    def save(self, directory: str = TOKEN_INDEX_DIR):
+        """Write records.arrow and postings.npz (last, so a complete postings file means a complete index)."""
+        os.makedirs(directory, exist_ok=True)
+        records_path = os.path.join(directory, "records.arrow")
+        with pa.OSFile(records_path + ".part", "wb") as sink:
+            with pa.ipc.new_file(sink, self.records.schema) as writer:
+                writer.write_table(self.records)
+        os.replace(records_path + ".part", records_path)
+
+        postings_path = os.path.join(directory, "postings.npz")
+        with open(postings_path + ".part", "wb") as f:
+            np.savez(f, vocab=np.frombuffer("\n".join(self.vocab).encode("ascii"), dtype=np.uint8),
+                     token_ptr=self.token_ptr, doc_ids=self.doc_ids, idf=self.idf,
+                     fingerprint=np.array(self.fingerprint))
+        os.replace(postings_path + ".part", postings_path)
+
+    @classmethod
+    def load(cls, directory: str = TOKEN_INDEX_DIR, fingerprint: str = None):
+        """The saved index, or None if there is none or it was built from other data than `fingerprint`."""
+        postings_path = os.path.join(directory, "postings.npz")
+        records_path = os.path.join(directory, "records.arrow")
+        if not (os.path.exists(postings_path) and os.path.exists(records_path)):
+            return None
+        with np.load(postings_path) as postings:
+            saved_fingerprint = str(postings["fingerprint"])
+            if fingerprint is not None and saved_fingerprint != fingerprint:
+                return None
+            blob = postings["vocab"].tobytes().decode("ascii")
+            vocab = blob.split("\n") if blob else []
+            arrays = postings["token_ptr"], postings["doc_ids"], postings["idf"]
+        records = pa.ipc.open_file(pa.memory_map(records_path)).read_all()
+        return cls(vocab, *arrays, records, saved_fingerprint)
+
+    def summary(self) -> str:
+        return (f"ABR token index: {len(self):,} records, {len(self.vocab):,} tokens, "
+                f"{len(self.doc_ids):,} postings")
@@ -0,0 +1,110 @@
+"""
+value_lookup.py
+---------------
+Memoised normalisation for low-cardinality columns (state, entity_type,
+entity_status, ...).
+
+Such columns repeat a few hundred raw spellings across millions of rows, so:
+1. each distinct raw value is resolved once (exact key after tidying, else
+   the best rapidfuzz WRatio match among the keys above a score cut-off);
+2. a column is factorised and the resolved distinct values are joined back
+   through the codes, so no per-row Python call remains;
+3. the raw -> resolved table is persisted as JSON under LOOKUP_CACHE_DIR,
+   so the next run starts warm. The file records the mapping it was built
+   from and is ignored once the mapping or cut-off changes.
+"""
+
+import os
+import re
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import process, fuzz, utils
+
+LOOKUP_CACHE_DIR = os.getenv("LOOKUP_CACHE_DIR", ".cache/lookups")
+
+
+def tidy_key(value: str) -> str:
+    """Upper-case, trim, and fold runs of dots/whitespace into one space."""
+    return re.sub(r'[\.\s]+', ' ', value.strip().upper())
+
+
+class ValueLookup:
+    def __init__(self, name: str, mapping: dict, min_score: int = 85, cache_dir: str = LOOKUP_CACHE_DIR):
+        """
+        mapping: tidied spelling -> canonical value. A raw value resolves to
+        None when it is not a string or no key scores above min_score
+        (scores are rounded to integers first, as fuzzywuzzy reported them).
+        """
+        self.name = name
+        self.mapping = mapping
+        self.min_score = min_score
+        self.cache_dir = cache_dir
+        self.keys = list(mapping)
+        self.signature = hashlib.sha1(json.dumps([mapping, min_score], sort_keys=True).encode()).hexdigest()
+        self.resolved = {}
+        self.stats = {"loaded": 0, "resolved": 0, "fuzzy": 0}
+        self._dirty = False
+        self.load()
+
+    # ------------------- Resolution ------------------- #
+    def _resolve(self, value):
+        if not isinstance(value, str):
+            return None
+        key = tidy_key(value)
+        if key in self.mapping:
+            return self.mapping[key]
+        self.stats["fuzzy"] += 1
+        match = process.extractOne(key, self.keys, scorer=fuzz.WRatio, processor=utils.default_process)
+        if match is not None and round(match[1]) > self.min_score:
+            return self.mapping[match[0]]
+        return None
+
+    def resolve(self, value):
+        """Canonical value for one raw value (memoised)."""
+        if not isinstance(value, str):
+            return None
+        if value not in self.resolved:
+            self.resolved[value] = self._resolve(value)
+            self.stats["resolved"] += 1
+            self._dirty = True
+        return self.resolved[value]
+
+    def map(self, series: pd.Series) -> pd.Series:
+        """Resolve a whole column: distinct values once, then joined back by factorised codes."""
+        codes, uniques = pd.factorize(series)
+        resolved = np.array([self.resolve(value) for value in uniques] + [None], dtype=object)
+        return pd.Series(resolved[codes], index=series.index, name=series.name)
+
+    # ------------------- Persistence ------------------- #
+    @property
+    def path(self) -> str:
+        return os.path.join(self.cache_dir, f"{self.name}.json")
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get("signature") == self.signature:
+            self.resolved.update(saved["values"])
+            self.stats["loaded"] = len(saved["values"])
+
+    def save(self):
+        """Write the resolved table (atomically) if anything new was resolved."""
+        if not self._dirty:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.part"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"signature": self.signature, "values": self.resolved}, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"Lookup {self.name}: {len(self.resolved):,} distinct values "
+                f"({s['loaded']:,} from cache, {s['resolved']:,} resolved, {s['fuzzy']:,} fuzzy)")